@@ -9,32 +9,32 @@ from src.trace_based_logging.logging_config import setup_logging
 logger = setup_logging()
 
 from src.trace_based_logging.config import load_config, build_node_url, initialize_extraction_state
-from src.trace_based_logging.extraction import process_transactions, insert_transaction_index
+from src.trace_based_logging.extraction import process_transactions, replay_archive, insert_transaction_index
 from src.trace_based_logging.saving import save_trace_data, folder_set_up
 from src.trace_based_logging.decoding import decode_all
 
-def main():
-    dir_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-    config_path = os.path.join(dir_path, 'config.json')
-    
-    try:
-        logger.info("STARTING SET-UP PHASE")
-        config = load_config(config_path)
-        from src.trace_based_logging.raw_trace_retriever import trace_retriever_utils
-        state = initialize_extraction_state(config, trace_retriever_utils)
-        trace_retriever_utils.check_socket(config["host"], config["port"])
-        folder_set_up(dir_path, config)
-    except Exception as e:
-        logger.error(f"Error in set-up phase: {e}")
-    
+def run_phases(config, state, dir_path):
+    """
+    Runs the extraction, decoding, and transformation phases that are switched on in the configuration, for the block
+    range of the configuration.
+
+    Returns:
+        bool: True if no phase failed.
+    """
+    succeeded = True
     if config["extraction"]:
         try:
             logger.info("STARTING EXTRACTION PHASE")
-            process_transactions(config, state)
+            if config["replay_from_archive"]:
+                # Flattening from the raw traces of an earlier run, without replaying the transactions on the node
+                replay_archive(config, state)
+            else:
+                process_transactions(config, state, dir_path)
             insert_transaction_index(config, state, build_node_url)
             save_trace_data(config, state, dir_path)
         except Exception as e:
             logger.error(f"Error in extraction phase: {e}")
+            succeeded = False
     else: 
         logger.info("Skipping extraction phase.")
         
@@ -57,12 +57,18 @@ def main():
             df_log = data_preparation.base_transformation(state["trace_tree"], state["contracts_dapp"])
             del state["trace_tree"]
             abi_path = os.path.join(dir_path, "resources", config["log_folder"], "decoding", f"dict_abi_{state['base_contract']}_{config['min_block']}_{config['max_block']}.pkl")
-            dict_abi = data_preparation.create_abi_dict(data_preparation.address_selection(df_log), config["etherscan_api_key"], abi_path)
+            if state.get("follow_state") is not None:
+                # A follow round only requests the ABIs of addresses that earlier rounds have not seen
+                fetch_abis = lambda addresses: data_preparation.create_abi_dict(addresses, config["etherscan_api_key"], abi_path, state["etherscan_client"], return_non_verified=True)
+                dict_abi = state["follow_state"].abi_dict(data_preparation.address_selection(df_log), fetch_abis)
+            else:
+                dict_abi = data_preparation.create_abi_dict(data_preparation.address_selection(df_log), config["etherscan_api_key"], abi_path, state["etherscan_client"])
             pickle.dump(dict_abi, open(abi_path, 'wb'))
             logger.info(f"Saved ABI dictionary at: {abi_path}")
             decode_all(df_log, state, config, dict_abi, build_node_url)
         except Exception as e:
             logger.error(f"Error in decoding phase: {e}")
+            succeeded = False
     else: 
         logger.info("Skipping decoding phase.")
     
@@ -79,8 +85,51 @@ def main():
             log_construction_augur.build_log(RESOURCES_DIR, LOG_FOLDER, config)
         except Exception as e:
             logger.error(f"Error in transformation phase: {e}")
+            succeeded = False
     else: 
-        logger.info("Skipping transformation phase.")            
+        logger.info("Skipping transformation phase.")
+    return succeeded
+
+def main():
+    dir_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    config_path = os.path.join(dir_path, 'config.json')
+    
+    try:
+        logger.info("STARTING SET-UP PHASE")
+        config = load_config(config_path)
+        from src.trace_based_logging import transport
+        transport.configure(config)
+        from src.trace_based_logging import request_controller
+        request_controller.configure(config)
+        from src.trace_based_logging.raw_trace_retriever import trace_retriever_utils
+        state = initialize_extraction_state(config, trace_retriever_utils)
+        # One Etherscan client for the transaction lists and the ABIs, so that both share the rate limit
+        from src.trace_based_logging.raw_trace_retriever.etherscan_client import EtherscanClient
+        state["etherscan_client"] = EtherscanClient(config["etherscan_api_key"], config["etherscan_requests_per_second"], config["etherscan_concurrency"])
+        # One block header cache for event timestamps, block tracing, and transaction indexes
+        from src.trace_based_logging.raw_trace_retriever.block_cache import BlockHeaderCache
+        state["block_cache"] = BlockHeaderCache(config["block_cache_path"])
+        if config["etherscan_cache_path"]:
+            from src.trace_based_logging.raw_trace_retriever.etherscan_cache import EtherscanCache
+            state["etherscan_cache"] = EtherscanCache(config["etherscan_cache_path"])
+        if config["trace_archive_path"]:
+            from src.trace_based_logging.raw_trace_retriever.trace_archive import TraceArchive
+            from src.trace_based_logging.raw_trace_retriever.tracers import tracer_store_path
+            state["trace_archive"] = TraceArchive(tracer_store_path(config["trace_archive_path"], config["tracer_mode"]))
+        trace_retriever_utils.check_socket(config["host"], config["port"])
+        folder_set_up(dir_path, config)
+    except Exception as e:
+        logger.error(f"Error in set-up phase: {e}")
+    
+    if config["follow_mode"]:
+        from src.trace_based_logging import follow
+        # A restarted follow mode continues after the last processed block instead of running the block range again
+        if not os.path.exists(follow.follow_state_path(dir_path, config, state)) and not run_phases(config, state, dir_path):
+            logger.error("Follow mode not started, as the run over the block range failed.")
+        else:
+            follow.follow_chain(config, state, dir_path, run_phases)
+    else:
+        run_phases(config, state, dir_path)
     print("DONE")
 
 if __name__ == '__main__':
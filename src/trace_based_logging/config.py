@@ -1,6 +1,7 @@
 import json
 import os
 from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging.raw_trace_retriever.tracers import TRACER_MODES
 
 logger = setup_logging()
 
@@ -10,6 +11,10 @@ def load_config(config_path):
             nested_config = json.load(file)
         # Transform the nested configuration into the flat structure expected by the rest of the code.
         config = transform_config(nested_config)
+        # Relative paths in the configuration are relative to the folder of the configuration file
+        for path_key in ["trace_cache_path", "block_cache_path", "etherscan_cache_path", "trace_archive_path", "tracer_js_path"]:
+            if config[path_key] and not os.path.isabs(config[path_key]):
+                config[path_key] = os.path.join(os.path.dirname(os.path.abspath(config_path)), config[path_key])
         validate_config(config)
         return config
     except (FileNotFoundError, json.JSONDecodeError) as e:
@@ -23,6 +28,24 @@ def transform_config(nested_config):
     flat_config["port"] = node.get("port")
     flat_config["protocol"] = node.get("protocol")
     flat_config["host"] = node.get("host")
+    flat_config["node_provider"] = node.get("provider", "http")
+    flat_config["node_ipc_path"] = node.get("ipc_path")
+    flat_config["node_ws_url"] = node.get("ws_url")
+    flat_config["node_urls"] = node.get("urls", [])
+    flat_config["node_hedge_requests"] = node.get("hedge_requests", True)
+    flat_config["node_hedge_min_delay"] = node.get("hedge_min_delay", 2.0)
+    flat_config["node_health_check_interval"] = node.get("health_check_interval", 60)
+
+    # Transport settings (shared HTTP session)
+    transport = nested_config.get("transport", {})
+    flat_config["pool_connections"] = transport.get("pool_connections")
+    flat_config["pool_maxsize"] = transport.get("pool_maxsize")
+    flat_config["connect_timeout"] = transport.get("connect_timeout")
+    flat_config["read_timeout"] = transport.get("read_timeout")
+    flat_config["node_initial_concurrency"] = transport.get("node_initial_concurrency", 8)
+    flat_config["node_max_concurrency"] = transport.get("node_max_concurrency", 64)
+    flat_config["circuit_failure_threshold"] = transport.get("circuit_failure_threshold", 5)
+    flat_config["circuit_open_seconds"] = transport.get("circuit_open_seconds", 10)
     
     # Contracts configuration
     contracts = nested_config.get("contracts", {})
@@ -33,6 +56,14 @@ def transform_config(nested_config):
     block_range = nested_config.get("block_range", {})
     flat_config["min_block"] = block_range.get("min_block")
     flat_config["max_block"] = block_range.get("max_block")
+
+    # Follow mode (new blocks after the block range)
+    follow = nested_config.get("follow", {})
+    flat_config["follow_mode"] = follow.get("enabled", False)
+    flat_config["follow_confirmations"] = follow.get("confirmations", 12)
+    flat_config["follow_poll_seconds"] = follow.get("poll_seconds", 12)
+    flat_config["follow_max_blocks_per_round"] = follow.get("max_blocks_per_round", 1000)
+    flat_config["follow_max_rounds"] = follow.get("max_rounds")
     
     # Extraction settings
     extraction = nested_config.get("extraction", {})
@@ -40,6 +71,33 @@ def transform_config(nested_config):
     flat_config["extract_internal_transactions"] = extraction.get("internal_transactions")
     flat_config["extract_transactions_by_events"] = extraction.get("transactions_by_events")
     flat_config["etherscan_api_key"] = extraction.get("etherscan_api_key")
+    flat_config["etherscan_requests_per_second"] = extraction.get("etherscan_requests_per_second", 5)
+    flat_config["etherscan_concurrency"] = extraction.get("etherscan_concurrency", 1)
+    flat_config["event_log_concurrency"] = extraction.get("event_log_concurrency", 1)
+    flat_config["event_log_chunk_size"] = extraction.get("event_log_chunk_size", 10000)
+    flat_config["event_log_address_batch_size"] = extraction.get("event_log_address_batch_size", 100)
+    flat_config["discovery_backend"] = extraction.get("discovery_backend", "etherscan")
+    flat_config["trace_filter_concurrency"] = extraction.get("trace_filter_concurrency", 1)
+    flat_config["trace_filter_chunk_size"] = extraction.get("trace_filter_chunk_size", 1000)
+    flat_config["trace_concurrency"] = extraction.get("trace_concurrency", 1)
+    flat_config["trace_batch_size"] = extraction.get("trace_batch_size", 1)
+    flat_config["block_trace_threshold"] = extraction.get("block_trace_threshold")
+    flat_config["stream_trace_threshold_mb"] = extraction.get("stream_trace_threshold_mb")
+    flat_config["tracer_mode"] = extraction.get("tracer_mode", "full")
+    flat_config["tracer_js_path"] = extraction.get("tracer_js_path")
+    flat_config["tracer_timeout"] = extraction.get("tracer_timeout")
+    flat_config["pipeline_fetch_workers"] = extraction.get("pipeline_fetch_workers", 2)
+    flat_config["pipeline_flatten_workers"] = extraction.get("pipeline_flatten_workers", 1)
+    flat_config["pipeline_queue_size"] = extraction.get("pipeline_queue_size", 2)
+    flat_config["pipeline_discovery"] = extraction.get("pipeline_discovery", True)
+    flat_config["trace_cache_path"] = extraction.get("trace_cache_path")
+    flat_config["trace_cache_max_size_mb"] = extraction.get("trace_cache_max_size_mb")
+    flat_config["block_cache_path"] = extraction.get("block_cache_path")
+    flat_config["etherscan_cache_path"] = extraction.get("etherscan_cache_path")
+    flat_config["trace_archive_path"] = extraction.get("trace_archive_path")
+    flat_config["replay_from_archive"] = extraction.get("replay_from_archive", False)
+    flat_config["spill_to_disk"] = extraction.get("spill_to_disk", False)
+    flat_config["resume_extraction"] = extraction.get("resume_extraction", False)
     
     # Output settings for dapp
     output = nested_config.get("output", {})
@@ -85,6 +143,10 @@ def validate_config(config):
             raise ValueError(f"Missing required configuration key: {key}")
         if key == "etherscan_api_key" and config[key] == "ETHERSCAN_API_KEY":
             raise ValueError("Please provide your Etherscan API key in the configuration file")
+    if config.get("replay_from_archive") and not config.get("trace_archive_path"):
+        raise ValueError("replay_from_archive requires a trace_archive_path")
+    if config.get("tracer_mode", "full") not in TRACER_MODES:
+        raise ValueError(f"Unknown tracer_mode: {config['tracer_mode']}. Expected one of {', '.join(TRACER_MODES)}")
 
 def build_node_url(config):
     return f"{config['protocol']}{config['host']}:{config['port']}"
@@ -97,6 +159,11 @@ def initialize_extraction_state(config, utils_module):
         "base_contract": contracts_lx[0],
         "contracts_dapp": set(contracts_lx),
         "all_transactions": set(),
+        "transaction_indexes": {},
         "trace_tree": None,  
+        "trace_partitions": None,
+        "extraction_checkpoint": None,
+        "block_cache": None,
+        "etherscan_cache": None,
         "contracts_non_dapp": set(contracts_non_dapp)
     }
@@ -1,28 +1,59 @@
+import os
+import json
 import pandas as pd
 import time
+from concurrent.futures import ThreadPoolExecutor
 from src.trace_based_logging.logging_config import setup_logging
-from src.trace_based_logging.raw_trace_retriever import get_transactions, get_txIndex, trace_transformation, create_relations
+from src.trace_based_logging.raw_trace_retriever import get_transactions, get_txIndex, trace_transformation, create_relations, tracers
+from src.trace_based_logging.raw_trace_retriever.trace_cache import TraceCache
+from src.trace_based_logging.raw_trace_retriever.trace_partitions import TracePartitionStore
+from src.trace_based_logging.raw_trace_retriever.extraction_checkpoint import ExtractionCheckpoint, CHECKPOINT_FILE
+from src.trace_based_logging.raw_trace_retriever.trace_archive import replay_traces
+from src.trace_based_logging.raw_trace_retriever.log_range_scheduler import IncompleteRangesError
 
 logger = setup_logging()
 
-def fetch_transactions(config, contracts_lx):
+# Number of transaction indexes queried between two checkpoints
+TX_INDEX_CHECKPOINT_SIZE = 1000
+# Settings that change which transactions are traced and which rows they give; a checkpoint written with other
+# values is not resumed. The base contract and the block range are part of the partition folder name.
+FINGERPRINT_KEYS = ("contracts_dapp", "contracts_non_dapp", "extract_normal_transactions", "extract_internal_transactions",
+                    "extract_transactions_by_events", "discovery_backend", "tracer_mode", "tracer_js_path")
+
+def fetch_transactions(config, contracts_lx, etherscan_client=None, block_cache=None, etherscan_cache=None):
     transactions = pd.DataFrame()
+    # Normal and internal transactions from the node's trace_filter instead of Etherscan
+    if config["discovery_backend"] == "trace_filter":
+        if config["extract_normal_transactions"] or config["extract_internal_transactions"]:
+            try:
+                from src.trace_based_logging.config import build_node_url  # reusing our function
+                transactions_traces = get_transactions.get_transactions_by_trace_filter(
+                    build_node_url(config), contracts_lx, config["min_block"], config["max_block"],
+                    max_workers=config["trace_filter_concurrency"], chunk_size=config["trace_filter_chunk_size"],
+                    address_batch_size=config["event_log_address_batch_size"], block_cache=block_cache
+                )
+                transactions = pd.concat([transactions, transactions_traces], ignore_index=True)
+            except IncompleteRangesError:
+                # Block ranges without results would silently drop transactions; the extraction stops instead
+                raise
+            except Exception as e:
+                logger.error(f"Error fetching transactions by trace_filter: {e}")
     # Normal transactions
-    if config["extract_normal_transactions"]:
+    elif config["extract_normal_transactions"]:
         try:
             transactions_normal = get_transactions.get_transactions(
                 contracts_lx, config["min_block"], config["max_block"],
-                internal_flag="normal", etherscan_api_key=config["etherscan_api_key"]
+                internal_flag="normal", etherscan_api_key=config["etherscan_api_key"], client=etherscan_client, cache=etherscan_cache
             )
             transactions = pd.concat([transactions, transactions_normal], ignore_index=True)
         except Exception as e:
             logger.error(f"Error fetching normal transactions: {e}")
     # Internal transactions
-    if config["extract_internal_transactions"]:
+    if config["discovery_backend"] != "trace_filter" and config["extract_internal_transactions"]:
         try:
             transactions_internal = get_transactions.get_transactions(
                 contracts_lx, config["min_block"], config["max_block"],
-                internal_flag="internal", etherscan_api_key=config["etherscan_api_key"]
+                internal_flag="internal", etherscan_api_key=config["etherscan_api_key"], client=etherscan_client, cache=etherscan_cache
             )
             transactions = pd.concat([transactions, transactions_internal], ignore_index=True)
         except Exception as e:
@@ -32,47 +63,218 @@ def fetch_transactions(config, contracts_lx):
         try:
             from src.trace_based_logging.config import build_node_url  # reusing our function
             transactions_events = get_transactions.get_transactions_by_events(
-                build_node_url(config), contracts_lx, config["min_block"], config["max_block"]
+                build_node_url(config), contracts_lx, config["min_block"], config["max_block"],
+                max_workers=config["event_log_concurrency"], chunk_size=config["event_log_chunk_size"],
+                address_batch_size=config["event_log_address_batch_size"], block_cache=block_cache
             )
             transactions = pd.concat([transactions, transactions_events], ignore_index=True)
+        except IncompleteRangesError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching transactions by events: {e}")
     # Remove duplicates based on transaction hash
     transactions.drop_duplicates(subset='hash', keep="last", inplace=True)
     return transactions
 
-def process_transactions(config, state):
+def partition_folder(config, state, dir_path):
+    return os.path.join(dir_path, "resources", config["log_folder"], "extraction", f"partitions_{state['base_contract']}_{config['min_block']}_{config['max_block']}")
+
+def extraction_fingerprint(config):
+    settings = {key: config.get(key) for key in FINGERPRINT_KEYS}
+    for key in ("contracts_dapp", "contracts_non_dapp"):
+        settings[key] = sorted(str(address).lower() for address in settings[key] or [])
+    return json.dumps(settings, sort_keys=True)
+
+def archive_run(config, state):
+    # Name under which the trace archive records the transactions of a run
+    return f"{state['base_contract']}_{config['min_block']}_{config['max_block']}"
+
+def process_transactions(config, state, dir_path=None):
     from src.trace_based_logging.config import build_node_url
     level = 1
-    while state["contracts_lx"]:
-        logger.info("##### GETTING TRANSACTIONS #####")
-        transactions = fetch_transactions(config, state["contracts_lx"])
-        transactions = transactions[~transactions["hash"].isin(state["all_transactions"])]
-        if transactions.empty:
-            logger.info("No additional transactions were found. Extraction ends.")
-            break
-        logger.info(f"New transactions for next iteration: {len(transactions)}")
-        transactions.reset_index(drop=True, inplace=True)
-        state["all_transactions"].update(transactions["hash"].tolist())
+    # With spill_to_disk, the rows of each chunk go to a partition file and only the CREATE rows stay in memory.
+    # A resumable extraction always spills, since the partitions are what a restarted run continues from.
+    resume = bool(config["resume_extraction"] and dir_path)
+    partition_store = None
+    checkpoint = ExtractionCheckpoint(partition_folder(config, state, dir_path), extraction_fingerprint(config)) if resume else None
+    if (config["spill_to_disk"] or resume) and dir_path:
+        # The partitions of an earlier run are only kept if its checkpoint is resumed
+        partition_store = TracePartitionStore(partition_folder(config, state, dir_path), clear=not resume or checkpoint.discarded)
+        checkpoint_path = os.path.join(partition_folder(config, state, dir_path), CHECKPOINT_FILE)
+        if not resume and os.path.exists(checkpoint_path):
+            # The partitions are rewritten, so the ledger of an earlier resumable run no longer matches them
+            stale_checkpoint = ExtractionCheckpoint(partition_folder(config, state, dir_path))
+            stale_checkpoint.clear()
+            stale_checkpoint.close()
+    pending_transactions = None
+    if checkpoint:
+        level, pending_transactions = checkpoint.restore(state, partition_store)
+    # The raw traces of the run are archived level by level; a run that starts over is recorded anew
+    trace_archive = state.get("trace_archive")
+    if trace_archive is not None and level == 1 and pending_transactions is None:
+        trace_archive.clear_run(archive_run(config, state))
+    # The traces of each level are kept as one DataFrame per level and concatenated once at the end.
+    # CREATE-relations only need the CREATE rows, which update the creation graph level by level.
+    # After a restart, the first update also adds the CREATE rows of the partitions restored from the checkpoint.
+    trace_levels = []
+    creation_graph = create_relations.CreationGraph()
+    # Traces of different tracer modes are not interchangeable, so each mode has a store of its own
+    tracer_config = tracers.tracer_config(config["tracer_mode"], config["tracer_js_path"], config["tracer_timeout"])
+    trace_cache_path = tracers.tracer_store_path(config["trace_cache_path"], config["tracer_mode"])
+    trace_cache = TraceCache(trace_cache_path, config["trace_cache_max_size_mb"]) if trace_cache_path else None
+    # With pipeline_discovery, the transactions of the contracts found in a chunk are fetched while the rest of the
+    # level is still traced; the next level starts with their results
+    discovery_executor = ThreadPoolExecutor(max_workers=1) if config["pipeline_discovery"] else None
+    discovery_futures = []
+    discovered_contracts = set()
+    discover = lambda contracts: fetch_transactions(config, contracts, state.get("etherscan_client"), state.get("block_cache"), state.get("etherscan_cache"))
+    try:
+        while state["contracts_lx"]:
+            if pending_transactions is not None:
+                # Transactions of the interrupted level that were fetched but not traced yet
+                transactions = pending_transactions
+                pending_transactions = None
+            else:
+                logger.info("##### GETTING TRANSACTIONS #####")
+                if discovery_futures:
+                    remaining = state["contracts_lx"] - discovered_contracts
+                    if remaining:
+                        discovery_futures.append(discovery_executor.submit(discover, remaining))
+                    transactions = pd.concat([future.result() for future in discovery_futures], ignore_index=True)
+                    transactions.drop_duplicates(subset='hash', keep="last", inplace=True)
+                    discovery_futures = []
+                else:
+                    transactions = discover(state["contracts_lx"])
+                transactions = transactions[~transactions["hash"].isin(state["all_transactions"])]
+                if transactions.empty:
+                    logger.info("No additional transactions were found. Extraction ends.")
+                    break
+                logger.info(f"New transactions for next iteration: {len(transactions)}")
+                transactions.reset_index(drop=True, inplace=True)
+                state["all_transactions"].update(transactions["hash"].tolist())
+                # Transactions found by events come with their transaction index
+                if "transactionIndex" in transactions.columns:
+                    df_indexed = transactions.dropna(subset=["transactionIndex"])
+                    state["transaction_indexes"].update(zip(df_indexed["hash"].astype(str), df_indexed["transactionIndex"].astype(int)))
+                if checkpoint:
+                    checkpoint.start_level(level, transactions, state)
 
-        logger.info("##### COMPUTING TRACES #####")
-        traces = trace_transformation.tx_to_trace(transactions, build_node_url(config))
-        if state["trace_tree"] is None:
-            state["trace_tree"] = traces
-        else:
-            state["trace_tree"] = pd.concat([state["trace_tree"], traces], axis=0, ignore_index=True)
-        logger.info("SUCCESS: Traces computed.")
+            logger.info("##### COMPUTING TRACES #####")
+            chunk_callback = None
+            if partition_store:
+                # Chunks of a resumed level are numbered after the partitions already written for it
+                chunk_offset = checkpoint.last_chunk(level) if checkpoint else 0
+                def chunk_callback(df_chunk, chunk, level=level, chunk_offset=chunk_offset):
+                    path = partition_store.write(df_chunk, level, chunk + chunk_offset)
+                    if checkpoint and path:
+                        checkpoint.record_partition(level, chunk + chunk_offset, path, df_chunk["hash"].unique())
+            trace_callback = None
+            if trace_archive is not None:
+                def trace_callback(records, level=level):
+                    trace_archive.append(records, archive_run(config, state), level)
+            # The CREATE-relations are followed chunk by chunk, so that the next level is discovered while this one is traced
+            level_contracts = set()
+            discovered_contracts = set()
+            def creations_callback(df_creations):
+                state["contracts_dapp"], contracts_new = creation_graph.update(df_creations, state["contracts_dapp"], state["contracts_non_dapp"])
+                level_contracts.update(contracts_new)
+                if contracts_new and discovery_executor is not None:
+                    discovered_contracts.update(contracts_new)
+                    discovery_futures.append(discovery_executor.submit(discover, contracts_new))
+            traces = trace_transformation.tx_to_trace(
+                transactions, build_node_url(config), max_workers=config["trace_concurrency"], batch_size=config["trace_batch_size"],
+                block_trace_threshold=config["block_trace_threshold"], trace_cache=trace_cache, chunk_callback=chunk_callback,
+                block_cache=state.get("block_cache"),
+                stream_threshold=int(config["stream_trace_threshold_mb"] * 1024 * 1024) if config["stream_trace_threshold_mb"] is not None else None,
+                trace_callback=trace_callback, tracer_config=tracer_config, fetch_workers=config["pipeline_fetch_workers"],
+                flatten_workers=config["pipeline_flatten_workers"], queue_size=config["pipeline_queue_size"], creations_callback=creations_callback
+            )
+            if partition_store:
+                # Also holds the CREATE rows of the partitions restored from a checkpoint; rows seen before add nothing
+                creations_callback(partition_store.new_creations())
+            else:
+                trace_levels.append(traces)
+            logger.info("SUCCESS: Traces computed.")
+
+            state["contracts_lx"] = level_contracts
+            logger.info(f"New contracts at level {level}: {len(state['contracts_lx'])}")
+            if checkpoint:
+                checkpoint.complete_level(level, level + 1, state)
+            level += 1
+    finally:
+        # Also on errors, so that the discovery thread ends and pending discoveries are dropped
+        if discovery_executor is not None:
+            discovery_executor.shutdown(cancel_futures=True)
+        if trace_cache is not None:
+            trace_cache.close()
+    if checkpoint:
+        state["extraction_checkpoint"] = checkpoint
+    if partition_store:
+        state["trace_partitions"] = partition_store
+        logger.info(f"Total extracted operations: {partition_store.row_count} in {len(partition_store.paths)} partitions")
+        return
+    if trace_levels:
+        state["trace_tree"] = pd.concat(trace_levels, axis=0, ignore_index=True)
+    del trace_levels
+    logger.info(f"Total extracted operations: {len(state['trace_tree']) if state['trace_tree'] is not None else 0}")
+    if trace_archive is not None:
+        logger.info(f"Trace archive: {trace_archive.stats()}")
 
-        logger.info("Identifying relevant CREATE-relations.")
-        state["contracts_dapp"], state["contracts_lx"] = create_relations.create_relations(
-            state["trace_tree"], state["contracts_dapp"], state["contracts_lx"], state["contracts_non_dapp"]
+def replay_archive(config, state):
+    """
+    Rebuilds the extraction result of a run from the trace archive instead of the node: the archived traces are
+    flattened level by level, and the CREATE-relations and transaction indexes are restored, as `process_transactions`
+    and `insert_transaction_index` would compute them.
+    """
+    trace_archive = state["trace_archive"]
+    run = archive_run(config, state)
+    levels = trace_archive.run_levels(run)
+    if not levels:
+        raise ValueError(f"The trace archive holds no traces of the run {run}")
+    trace_levels = []
+    creation_graph = create_relations.CreationGraph()
+    for level, tx_hashes in levels:
+        tic = time.time()
+        traces = replay_traces(trace_archive, tx_hashes)
+        logger.info(f"Level {level}: {len(traces)} operations of {len(tx_hashes)} transactions replayed in {time.time() - tic:.1f}s")
+        trace_levels.append(traces)
+        state["all_transactions"].update(tx_hashes)
+        state["contracts_dapp"], state["contracts_lx"] = creation_graph.update(
+            create_relations.select_creations(traces), state["contracts_dapp"], state["contracts_non_dapp"]
         )
-        logger.info(f"New contracts at level {level}: {len(state['contracts_lx'])}")
-        level += 1
-        time.sleep(1)
-    logger.info(f"Total extracted operations: {len(state['trace_tree'])}")
+    state["trace_tree"] = pd.concat(trace_levels, axis=0, ignore_index=True)
+    hashes = state["trace_tree"]["hash"].astype(str).unique() if "hash" in state["trace_tree"].columns else []
+    state["transaction_indexes"].update(trace_archive.transaction_indexes(hashes))
+    logger.info(f"Total replayed operations: {len(state['trace_tree'])}")
+
+def add_transaction_index(df_trace_tree, transaction_indexes):
+    df_trace_tree["transactionIndex"] = df_trace_tree["hash"].astype(str).map(transaction_indexes).fillna(df_trace_tree["hash"])
+    return df_trace_tree
 
 def insert_transaction_index(config, state, build_node_url_func):
-    hash_list = state["trace_tree"]["hash"].unique()
-    transaction_indexes = get_txIndex.get_txIndex(hash_list, build_node_url_func(config))
-    state["trace_tree"]["transactionIndex"] = state["trace_tree"]["hash"].astype(str).map(transaction_indexes).fillna(state["trace_tree"]["hash"])
+    partition_store = state.get("trace_partitions")
+    checkpoint = state.get("extraction_checkpoint")
+    if partition_store:
+        block_numbers = partition_store.block_numbers
+    else:
+        df_hash_blocks = state["trace_tree"][["hash", "blockNumber"]].drop_duplicates(subset="hash")
+        block_numbers = dict(zip(df_hash_blocks["hash"].astype(str), df_hash_blocks["blockNumber"]))
+    # Indexes captured from event logs during discovery, or recorded by an interrupted run, are not queried again
+    transaction_indexes = dict(state.get("transaction_indexes") or {})
+    if checkpoint:
+        transaction_indexes.update(checkpoint.transaction_indexes())
+    hash_list = sorted((tx_hash for tx_hash in block_numbers if tx_hash not in transaction_indexes), key=lambda tx_hash: get_txIndex.to_block_number(block_numbers[tx_hash]))
+    logger.info(f"Transaction indexes: {len(block_numbers) - len(hash_list)} known, {len(hash_list)} to query")
+    # With a checkpoint, the result is recorded slice by slice; the slices cover consecutive blocks
+    slice_size = TX_INDEX_CHECKPOINT_SIZE if checkpoint else max(len(hash_list), 1)
+    for i in range(0, len(hash_list), slice_size):
+        queried_indexes = get_txIndex.get_txIndex(hash_list[i:i + slice_size], build_node_url_func(config), block_numbers, block_cache=state.get("block_cache"))
+        if checkpoint:
+            checkpoint.record_transaction_indexes(queried_indexes)
+        transaction_indexes.update(queried_indexes)
+    if state.get("trace_archive") is not None:
+        state["trace_archive"].record_transaction_indexes(transaction_indexes)
+    if partition_store:
+        partition_store.map_partitions(lambda df_partition: add_transaction_index(df_partition, transaction_indexes))
+    else:
+        add_transaction_index(state["trace_tree"], transaction_indexes)
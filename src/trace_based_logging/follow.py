@@ -0,0 +1,220 @@
+import os
+import time
+import pickle
+import pandas as pd
+import requests
+from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport
+from src.trace_based_logging.config import build_node_url
+
+"""
+This module provides the follow mode, which keeps the outputs of a DApp current: after the configured block range,
+it polls the node for new blocks and runs the extraction, decoding, and transformation phases for each range of new
+blocks once they are `follow_confirmations` blocks deep. Each round writes the usual outputs for its block range
+(trace tree, decoded data, OCEL files), so the outputs of a DApp form partitions by block range.
+
+Between rounds, the follow state keeps the last processed block, the DApp contracts found so far (including the
+contracts created in earlier rounds), the decoded CREATE-relations, and the ABIs requested so far, so that a round
+only discovers and traces the transactions of the new blocks, only requests the ABIs of new addresses, and labels
+contracts created in earlier rounds. The follow state is saved after each
+round; a restarted follow mode continues after the last processed block.
+
+Blocks are only processed below the confirmation depth. If the last processed block is no longer part of the chain
+(a reorganization deeper than the confirmation depth), a warning is logged; the outputs of the affected round may
+then hold transactions of orphaned blocks. If the node does not answer a poll, the poll is repeated after
+`follow_poll_seconds`.
+
+Classes:
+    FollowState: Persistent state of the follow mode.
+
+Functions:
+    next_range(last_block, safe_head, max_blocks): Returns the next block range to process.
+    round_state(state, follow_state): Returns the state for one round.
+    follow_chain(config, state, dir_path, run_phases, sleep=time.sleep): Processes new blocks round by round.
+
+Constants:
+    FOLLOW_STATE_FILE (str): File name of the follow state in the log folder.
+    NODE_ERRORS (tuple): Errors of a poll after which the poll is repeated.
+"""
+
+logger = setup_logging()
+
+FOLLOW_STATE_FILE = "follow_state_{base_contract}.pkl"
+# State entries that are shared by all rounds
+SHARED_STATE_KEYS = ("base_contract", "contracts_non_dapp", "etherscan_client", "block_cache", "trace_archive")
+# Request and connection errors (HTTP, IPC, and WebSocket providers) and JSON-RPC errors, which Web3 raises as ValueError
+NODE_ERRORS = (requests.exceptions.RequestException, OSError, ValueError)
+
+
+class FollowState:
+    """
+    Persistent state of the follow mode, stored as a pickle file.
+
+    Args:
+        path (str): Path of the pickle file. An existing file is loaded.
+
+    Attributes:
+        last_block (int): The last processed block, or None before the first round.
+        last_block_hash (str): The hash of the last processed block, to detect reorganizations.
+        contracts_dapp (set): The DApp contracts found so far.
+        creations (pd.DataFrame): The decoded CREATE and CREATE2 rows found so far.
+        abis (dict): Maps each address whose ABI was retrieved to its ABI, or to None if Etherscan reported that its
+                     source code is not verified. Addresses whose request failed are not kept, so they are requested again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last_block = None
+        self.last_block_hash = None
+        self.contracts_dapp = set()
+        self.creations = pd.DataFrame()
+        self.abis = {}
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                self.__dict__.update(pickle.load(file))
+            self.path = path
+            logger.info(f"Follow state loaded from {path}: last block {self.last_block}, {len(self.contracts_dapp)} DApp contracts")
+
+    def save(self):
+        data = {"last_block": self.last_block, "last_block_hash": self.last_block_hash, "contracts_dapp": self.contracts_dapp,
+                "creations": self.creations, "abis": self.abis}
+        # Written to a temporary file first, so that an interrupted run never leaves a partial state
+        with open(self.path + ".tmp", "wb") as file:
+            pickle.dump(data, file)
+        os.replace(self.path + ".tmp", self.path)
+
+    def all_creations(self, creations):
+        """
+        Returns the CREATE rows of earlier rounds together with the CREATE rows of the current round.
+        """
+        if self.creations.empty:
+            return creations
+        return pd.concat([self.creations, creations], ignore_index=True)
+
+    def abi_dict(self, addresses, fetch):
+        """
+        Returns the ABIs of the addresses; only the addresses that were not retrieved in an earlier round are requested.
+
+        Args:
+            addresses (list): The addresses.
+            fetch (callable): Called with the list of new addresses; returns a dictionary with the verified ABIs and
+                              the set of addresses without verified source code (see `data_preparation.create_abi_dict`).
+
+        Returns:
+            dict: Maps the addresses with a verified ABI to their ABI.
+        """
+        missing = [address for address in addresses if address not in self.abis]
+        failed = 0
+        if missing:
+            fetched, non_verified = fetch(missing)
+            for address in missing:
+                if address in fetched:
+                    self.abis[address] = fetched[address]
+                elif address in non_verified:
+                    self.abis[address] = None
+                else:
+                    failed += 1
+        logger.info(f"ABI dictionary: {len(addresses) - len(missing)} address(es) known from earlier rounds, {len(missing)} requested, {failed} failed")
+        return {address: self.abis[address] for address in addresses if self.abis.get(address) is not None}
+
+
+def next_range(last_block, safe_head, max_blocks):
+    """
+    Returns the next block range to process: the blocks after `last_block` up to the confirmed head, at most
+    `max_blocks` blocks.
+
+    Returns:
+        tuple: (first block, last block), or None if there is no new confirmed block.
+    """
+    if safe_head <= last_block:
+        return None
+    return last_block + 1, min(safe_head, last_block + max_blocks)
+
+
+def round_state(state, follow_state):
+    """
+    Returns a fresh state for one round that starts from the DApp contracts found so far. The Etherscan cache is not
+    used, as the ranges of a round end close to the chain head (see etherscan_cache).
+    """
+    new_state = {key: state.get(key) for key in SHARED_STATE_KEYS}
+    new_state.update({
+        "contracts_lx": set(follow_state.contracts_dapp),
+        "contracts_dapp": set(follow_state.contracts_dapp),
+        "all_transactions": set(),
+        "transaction_indexes": {},
+        "trace_tree": None,
+        "trace_partitions": None,
+        "extraction_checkpoint": None,
+        "etherscan_cache": None,
+        "follow_state": follow_state
+    })
+    return new_state
+
+
+def follow_state_path(dir_path, config, state):
+    return os.path.join(dir_path, "resources", config["log_folder"], FOLLOW_STATE_FILE.format(base_contract=state["base_contract"]))
+
+
+def follow_chain(config, state, dir_path, run_phases, sleep=time.sleep):
+    """
+    Processes the new blocks after the configured block range (or after the last block of an earlier follow run)
+    round by round, until `follow_max_rounds` rounds are done or the process is stopped.
+
+    Args:
+        config (dict): The (flat) configuration.
+        state (dict): The state after the set-up phase, or after the run over the configured block range.
+        dir_path (str): The project folder.
+        run_phases (callable): Runs the phases for a configuration and a state; returns True if all phases succeeded.
+        sleep (callable, optional): Waits for the given number of seconds between polls.
+    """
+    follow_state = FollowState(follow_state_path(dir_path, config, state))
+    if follow_state.last_block is None:
+        follow_state.last_block = config["max_block"]
+        follow_state.contracts_dapp = set(state["contracts_dapp"])
+        if state.get("creations") is not None:
+            follow_state.creations = state["creations"]
+        # The verified ABIs of the configured block range
+        abi_path = os.path.join(dir_path, "resources", config["log_folder"], "decoding", f"dict_abi_{state['base_contract']}_{config['min_block']}_{config['max_block']}.pkl")
+        if os.path.exists(abi_path):
+            with open(abi_path, "rb") as file:
+                follow_state.abis.update(pickle.load(file))
+    web3 = transport.get_web3(build_node_url(config))
+    rounds = 0
+    while config["follow_max_rounds"] is None or rounds < config["follow_max_rounds"]:
+        try:
+            head = web3.eth.block_number
+            if follow_state.last_block_hash is not None and follow_state.last_block <= head:
+                block_hash = web3.eth.get_block(follow_state.last_block)["hash"].hex()
+                if block_hash != follow_state.last_block_hash:
+                    logger.warning(f"Follow: block {follow_state.last_block} was reorganized after it was processed; increase follow_confirmations")
+                    follow_state.last_block_hash = block_hash
+        except NODE_ERRORS as e:
+            logger.warning(f"Follow: polling the node failed: {e}. Retrying in {config['follow_poll_seconds']}s")
+            sleep(config["follow_poll_seconds"])
+            continue
+        block_range = next_range(follow_state.last_block, head - config["follow_confirmations"], config["follow_max_blocks_per_round"])
+        if block_range is None:
+            sleep(config["follow_poll_seconds"])
+            continue
+
+        logger.info(f"FOLLOW ROUND: blocks {block_range[0]} to {block_range[1]} (head {head})")
+        round_config = dict(config, min_block=block_range[0], max_block=block_range[1])
+        state_round = round_state(state, follow_state)
+        if not run_phases(round_config, state_round, dir_path):
+            # The round is repeated after the next poll; its outputs are overwritten
+            logger.error(f"Follow: round for blocks {block_range[0]} to {block_range[1]} failed, retrying")
+            sleep(config["follow_poll_seconds"])
+            continue
+        follow_state.contracts_dapp.update(state_round["contracts_dapp"])
+        if state_round.get("creations") is not None:
+            follow_state.creations = follow_state.all_creations(state_round["creations"])
+        follow_state.last_block = block_range[1]
+        try:
+            follow_state.last_block_hash = web3.eth.get_block(block_range[1])["hash"].hex()
+        except NODE_ERRORS as e:
+            # The round is kept; the reorganization check of its last block is skipped
+            logger.warning(f"Follow: the hash of block {block_range[1]} could not be retrieved: {e}")
+            follow_state.last_block_hash = None
+        follow_state.save()
+        rounds += 1
+        logger.info(f"Follow: processed up to block {block_range[1]}, {max(0, head - config['follow_confirmations'] - block_range[1])} confirmed block(s) behind")
@@ -3,6 +3,7 @@ import pandas as pd
 import src.trace_based_logging.log_construction.transformation_augur_utils as transformation_augur_utils
 from web3 import Web3
 from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport
 
 logger = setup_logging()
 
@@ -174,7 +175,7 @@ def combine_min_block_numbers(dict_list):
 
 
 def annotate_addresses(addresses, addresses_w_min_block_numbers, node_url, creations, contracts_dapp, mappings):
-    w3 = Web3(Web3.HTTPProvider(node_url))
+    w3 = transport.get_web3(node_url)
     contract_name_map = transformation_augur_utils.label_contracts_by_relative(creations, contracts_dapp, mappings["factory_contract_map"])
     address_dict = {}
     for address in addresses:
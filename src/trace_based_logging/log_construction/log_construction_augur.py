@@ -242,7 +242,9 @@ def create_ocel_files(overall_dataframe, RESOURCES_DIR, CONFIG):
     else:
         overall_dataframe.sort_values(["timeStamp"], inplace=True)
     overall_dataframe.rename(columns={"Activity": "ocel:activity", "timeStamp": "ocel:timestamp"}, inplace=True)
-    overall_dataframe["ocel:eid"] = "EID_" + overall_dataframe.index.astype(str)
+    # In follow mode, the OCEL files of each block range are partitions of one log, so the event ids carry the range
+    eid_prefix = f"EID_{CONFIG['min_block']}_" if CONFIG.get("follow_mode") else "EID_"
+    overall_dataframe["ocel:eid"] = eid_prefix + overall_dataframe.index.astype(str)
 
     # Build event-to-object relations
     e2o_list = []
@@ -333,9 +335,11 @@ def create_ocel_files(overall_dataframe, RESOURCES_DIR, CONFIG):
     logger.info(f"Constructed events dataframe with shape: {events_df.shape}")
 
     # Write OCEL components to Parquet files.
-    objects_path = os.path.join(RESOURCES_DIR, CONFIG["log_folder"], "transformation", "ocel_objects.parquet")
-    events_path = os.path.join(RESOURCES_DIR, CONFIG["log_folder"], "transformation", "ocel_events.parquet")
-    e2o_path = os.path.join(RESOURCES_DIR, CONFIG["log_folder"], "transformation", "ocel_e2o.parquet")
+    # Named by block range like the XML-OCEL file, so that the files of several block ranges can be kept side by side
+    file_suffix = f'{CONFIG["base_contract"]}_{CONFIG["min_block"]}_{CONFIG["max_block"]}'
+    objects_path = os.path.join(RESOURCES_DIR, CONFIG["log_folder"], "transformation", f"ocel_objects_{file_suffix}.parquet")
+    events_path = os.path.join(RESOURCES_DIR, CONFIG["log_folder"], "transformation", f"ocel_events_{file_suffix}.parquet")
+    e2o_path = os.path.join(RESOURCES_DIR, CONFIG["log_folder"], "transformation", f"ocel_e2o_{file_suffix}.parquet")
 
     objects_df.to_parquet(objects_path, index=False)
     logger.info(f"OCEL objects written to: {objects_path}")
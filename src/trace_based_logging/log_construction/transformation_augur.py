@@ -390,6 +390,9 @@ def transform_augur_data(resources_dir, log_folder, state, CONFIG):
     mapping_path = os.path.join(os.path.dirname(__file__), "mappings.json")
     mappings = load_mappings(mapping_path)
     creations, contracts_dapp = load_resources(base_contract, min_block, max_block, resources_dir, CONFIG)
+    # In follow mode, contracts are also labeled with the CREATE-relations of earlier rounds;
+    # the creation events are only those of the block range
+    creations_all = state["follow_state"].all_creations(creations) if state.get("follow_state") is not None else creations
     txs_reverted = get_reverted_transactions(resources_dir, base_contract, min_block, max_block, CONFIG)
     
     market_info = None
@@ -400,7 +403,7 @@ def transform_augur_data(resources_dir, log_folder, state, CONFIG):
     # Process EVENTS DAPP
     if CONFIG.get("dapp_events", False):
         events_dapp = transform_events_dapp(state, resources_dir, CONFIG,
-                                             mappings, creations, contracts_dapp, txs_reverted,
+                                             mappings, creations_all, contracts_dapp, txs_reverted,
                                              sensitive_events=CONFIG.get("sensitive_events", False))
         save_transformed_category(events_dapp, "dapp_events", base_contract, min_block, max_block, resources_dir, log_folder)
         if CONFIG.get("sensitive_events", False):
@@ -412,7 +415,7 @@ def transform_augur_data(resources_dir, log_folder, state, CONFIG):
     # Process CALLS DAPP
     if CONFIG.get("dapp_calls", False):
         calls_dapp = transform_calls_dapp(state, resources_dir, CONFIG,
-                                          mappings, creations, contracts_dapp, txs_reverted,
+                                          mappings, creations_all, contracts_dapp, txs_reverted,
                                           sensitive_events=CONFIG.get("sensitive_events", False),
                                           market_info=market_info, market_type_info=market_type_info)
         save_transformed_category(calls_dapp, "dapp_calls", base_contract, min_block, max_block, resources_dir, log_folder)
@@ -422,7 +425,7 @@ def transform_augur_data(resources_dir, log_folder, state, CONFIG):
     # Process DELEGATECALLS DAPP
     if CONFIG.get("dapp_delegatecalls", False):
         dcalls_dapp = transform_delegatecalls_dapp(state, resources_dir, CONFIG,
-                                                    mappings, creations, contracts_dapp, txs_reverted,
+                                                    mappings, creations_all, contracts_dapp, txs_reverted,
                                                     sensitive_events=CONFIG.get("sensitive_events", False),
                                                     market_info=market_info, market_type_info=market_type_info)
         save_transformed_category(dcalls_dapp, "dapp_delegatecalls", base_contract, min_block, max_block, resources_dir, log_folder)
@@ -432,7 +435,7 @@ def transform_augur_data(resources_dir, log_folder, state, CONFIG):
     # Process ZERO VALUE CALLS DAPP
     if CONFIG.get("dapp_zero_value_calls", False):
         zcalls_dapp = transform_zero_value_calls_dapp(state, resources_dir, CONFIG,
-                                                       mappings, creations, contracts_dapp, txs_reverted,
+                                                       mappings, creations_all, contracts_dapp, txs_reverted,
                                                        sensitive_events=CONFIG.get("sensitive_events", False),
                                                        market_info=market_info, market_type_info=market_type_info)
         save_transformed_category(zcalls_dapp, "dapp_zero_value_calls", base_contract, min_block, max_block, resources_dir, log_folder)
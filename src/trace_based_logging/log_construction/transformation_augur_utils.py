@@ -3,6 +3,7 @@ import json
 from web3 import Web3
 
 from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport
 
 # Create a logger
 logger = setup_logging()
@@ -510,7 +511,7 @@ for act in act_list:
 
 
 def annotate_addresses(addresses, addresses_w_min_block_numbers, node_url, creations, contracts_dapp, mappings):
-    w3 = Web3(Web3.HTTPProvider(node_url))
+    w3 = transport.get_web3(node_url)
     contract_name_map = label_contracts_by_relative(creations, contracts_dapp, mappings["factory_contract_map"])
     address_dict = {}
     for address in addresses:
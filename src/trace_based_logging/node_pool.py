@@ -0,0 +1,307 @@
+import time
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from web3.providers.base import JSONBaseProvider
+from src.trace_based_logging.logging_config import setup_logging
+
+"""
+This module provides a pool of Ethereum nodes (endpoints) that serve the same chain. JSON-RPC requests are sent to
+the healthy endpoint with the lowest expected latency (per method, weighted by the requests in flight). An endpoint
+that fails (connection errors, timeouts, HTTP 5xx or 429) is skipped for a cooldown that grows with consecutive
+failures; the request is sent to the next endpoint instead. If a request takes much longer than usual for its
+method, a hedged duplicate is sent to the second-best endpoint and the first response wins. Only read requests are
+sent through the pool, so duplicates are harmless.
+
+The pool is created by `transport.configure` when several node URLs are configured. `transport.post` routes the
+requests for the configured node URL through the pool, and `transport.get_web3` builds Web3 instances with a
+`NodePoolProvider`.
+
+Classes:
+    NodeEndpoint: Health and latency statistics of one endpoint.
+    NodePool: Spreads JSON-RPC requests across endpoints, with failover and hedged requests.
+    NodePoolProvider: Web3 provider that sends its requests through a NodePool.
+
+Constants:
+    HEDGE_MIN_DELAY (float): Minimum time in seconds before a request is hedged.
+    HEDGE_FACTOR (float): A request is hedged after HEDGE_FACTOR times the usual latency of its method.
+    HEDGE_BUDGET (float): Maximum share of requests that are hedged.
+    COOLDOWN_BASE (float): Cooldown in seconds of an endpoint after its first failure; it doubles per failure.
+    COOLDOWN_MAX (float): Maximum cooldown in seconds.
+    MAX_BLOCK_LAG (int): Number of blocks an endpoint may lag behind the best endpoint in a health check.
+    LATENCY_SMOOTHING (float): Weight of a new latency sample in the moving average.
+"""
+
+logger = setup_logging()
+
+HEDGE_MIN_DELAY = 2.0
+HEDGE_FACTOR = 3.0
+HEDGE_BUDGET = 0.1
+COOLDOWN_BASE = 5.0
+COOLDOWN_MAX = 300.0
+MAX_BLOCK_LAG = 20
+LATENCY_SMOOTHING = 0.2
+
+
+def rpc_method(payload):
+    """
+    Returns the method of a JSON-RPC request (or of the first call of a batch), used to group latencies.
+    """
+    if isinstance(payload, list):
+        return f"batch:{payload[0].get('method')}" if payload else "batch"
+    if isinstance(payload, dict):
+        return payload.get("method", "unknown")
+    return "unknown"
+
+
+def close_discarded(future):
+    """
+    Closes the response of a request whose duplicate won, once it arrives. Streamed responses otherwise keep their
+    pooled connection until they are garbage-collected.
+    """
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class NodeEndpoint:
+    """
+    Health and latency statistics of one node endpoint.
+
+    Args:
+        url (str): The HTTP URL of the node.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = {}
+        self.in_flight = 0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.block_number = None
+
+    def is_available(self, now):
+        return now >= self.unhealthy_until
+
+    def expected_latency(self, method):
+        # Unknown methods are tried first, so that every endpoint gets a latency sample
+        if method in self.latency:
+            return self.latency[method]
+        return min(self.latency.values()) if self.latency else 0.0
+
+    def record_success(self, method, seconds):
+        previous = self.latency.get(method)
+        self.latency[method] = seconds if previous is None else (1 - LATENCY_SMOOTHING) * previous + LATENCY_SMOOTHING * seconds
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+    def record_failure(self, now):
+        self.errors += 1
+        self.failures += 1
+        self.unhealthy_until = now + min(COOLDOWN_MAX, COOLDOWN_BASE * 2 ** (self.failures - 1))
+
+
+class NodePool:
+    """
+    Spreads JSON-RPC requests across several endpoints of the same chain. The pool can be shared by several threads.
+
+    Args:
+        urls (list of str): The HTTP URLs of the nodes.
+        send (callable): Sends a POST request, called as send(url, **kwargs), e.g., the post of a shared session.
+        hedge (bool): If True, slow requests are hedged with a duplicate to the second-best endpoint.
+        hedge_min_delay (float): Minimum time in seconds before a request is hedged.
+        hedge_factor (float): A request is hedged after hedge_factor times the usual latency of its method.
+        max_workers (int): Number of threads that send requests (including hedged duplicates).
+    """
+
+    def __init__(self, urls, send, hedge=True, hedge_min_delay=HEDGE_MIN_DELAY, hedge_factor=HEDGE_FACTOR, max_workers=64):
+        if not urls:
+            raise ValueError("A node pool needs at least one URL")
+        self.endpoints = [NodeEndpoint(url) for url in dict.fromkeys(urls)]
+        self.send = send
+        self.hedge = hedge and len(self.endpoints) > 1
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_factor = hedge_factor
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="node-pool")
+        self.requests = 0
+        self.hedged = 0
+        self.health_thread = None
+        self.stop_event = threading.Event()
+
+    def ranked(self, method, exclude=()):
+        """
+        Returns the available endpoints, best first: lowest expected latency for the method, weighted by the requests
+        in flight. If no endpoint is available, the one whose cooldown ends first is returned.
+        """
+        now = time.monotonic()
+        with self.lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.url not in exclude]
+            available = [endpoint for endpoint in candidates if endpoint.is_available(now)]
+            if not available:
+                return sorted(candidates, key=lambda endpoint: endpoint.unhealthy_until)[:1]
+            return sorted(available, key=lambda endpoint: endpoint.expected_latency(method) * (1 + endpoint.in_flight))
+
+    def hedge_delay(self, endpoint, method):
+        return max(self.hedge_min_delay, self.hedge_factor * endpoint.expected_latency(method))
+
+    def send_to(self, endpoint, method, kwargs):
+        with self.lock:
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+        start = time.monotonic()
+        try:
+            response = self.send(endpoint.url, **kwargs)
+            if response.status_code >= 500 or response.status_code == 429:
+                raise requests.exceptions.HTTPError(f"HTTP {response.status_code} from {endpoint.url}", response=response)
+        except requests.exceptions.RequestException:
+            with self.lock:
+                endpoint.in_flight -= 1
+                endpoint.record_failure(time.monotonic())
+            raise
+        with self.lock:
+            endpoint.in_flight -= 1
+            endpoint.record_success(method, time.monotonic() - start)
+        return response
+
+    def post(self, method=None, **kwargs):
+        """
+        Sends a JSON-RPC request (single or batch) to the best endpoint, with failover to the other endpoints and a
+        hedged duplicate for slow requests.
+
+        Args:
+            method (str, optional): The JSON-RPC method, for the latency statistics. Taken from `json` if None.
+            **kwargs: Arguments of the POST request (json or data, headers, timeout).
+
+        Returns:
+            requests.Response: The first successful response.
+
+        Raises:
+            requests.exceptions.RequestException: The last error, if all endpoints failed.
+        """
+        method = method or rpc_method(kwargs.get("json"))
+        with self.lock:
+            self.requests += 1
+        tried = set()
+        last_error = None
+        for attempt in range(len(self.endpoints)):
+            candidates = self.ranked(method, exclude=tried)
+            if not candidates:
+                break
+            primary = candidates[0]
+            tried.add(primary.url)
+            if not self.hedge or len(candidates) < 2:
+                try:
+                    return self.send_to(primary, method, kwargs)
+                except requests.exceptions.RequestException as e:
+                    logger.debug(f"Node {primary.url} failed for {method}: {e}. Trying the next node.")
+                    last_error = e
+                    continue
+            futures = {self.executor.submit(self.send_to, primary, method, kwargs): primary}
+            done, pending = wait(futures, timeout=self.hedge_delay(primary, method))
+            if not done and self.hedge_allowed():
+                secondary = candidates[1]
+                tried.add(secondary.url)
+                logger.debug(f"Hedging {method}: no response from {primary.url} after {self.hedge_delay(primary, method):.1f}s, also sent to {secondary.url}")
+                futures[self.executor.submit(self.send_to, secondary, method, kwargs)] = secondary
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        # A slower duplicate is left to finish in the background; its latency is still recorded, and
+                        # its response is closed to release the connection
+                        for other in futures:
+                            if other is not future:
+                                other.add_done_callback(close_discarded)
+                        return future.result()
+                    last_error = future.exception()
+                    logger.debug(f"Node {futures[future].url} failed for {method}: {last_error}. Trying the next node.")
+        if last_error is None:
+            last_error = requests.exceptions.ConnectionError("No node of the pool is available")
+        raise last_error
+
+    def hedge_allowed(self):
+        with self.lock:
+            if self.hedged + 1 > HEDGE_BUDGET * self.requests + 1:
+                return False
+            self.hedged += 1
+            return True
+
+    def check_health(self, timeout=10):
+        """
+        Requests the latest block number from each endpoint. Endpoints that do not answer or lag more than
+        MAX_BLOCK_LAG blocks behind the best endpoint are skipped for a cooldown.
+        """
+        request_ids = itertools.count()
+        for endpoint in self.endpoints:
+            try:
+                response = self.send_to(endpoint, "eth_blockNumber", {
+                    "json": {"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": next(request_ids)},
+                    "headers": {"Content-type": "application/json"}, "timeout": timeout
+                })
+                endpoint.block_number = int(response.json()["result"], 16)
+            except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Node {endpoint.url} failed the health check: {e}")
+                endpoint.block_number = None
+        block_numbers = [endpoint.block_number for endpoint in self.endpoints if endpoint.block_number is not None]
+        if block_numbers:
+            now = time.monotonic()
+            with self.lock:
+                for endpoint in self.endpoints:
+                    if endpoint.block_number is not None and max(block_numbers) - endpoint.block_number > MAX_BLOCK_LAG:
+                        logger.warning(f"Node {endpoint.url} lags {max(block_numbers) - endpoint.block_number} blocks behind and is skipped for now")
+                        endpoint.record_failure(now)
+        logger.info(f"Node pool: {self.stats()}")
+
+    def start_health_checks(self, interval):
+        """
+        Runs `check_health` every `interval` seconds in a background thread.
+        """
+        def run():
+            while not self.stop_event.wait(interval):
+                self.check_health()
+        self.health_thread = threading.Thread(target=run, name="node-pool-health", daemon=True)
+        self.health_thread.start()
+
+    def stats(self):
+        """
+        Returns the request, error, and latency statistics of the endpoints and the number of hedged requests.
+        """
+        now = time.monotonic()
+        with self.lock:
+            endpoints = {
+                endpoint.url: {
+                    "requests": endpoint.requests, "errors": endpoint.errors, "available": endpoint.is_available(now),
+                    "block": endpoint.block_number, "latency": {method: round(seconds, 3) for method, seconds in endpoint.latency.items()}
+                }
+                for endpoint in self.endpoints
+            }
+            return {"requests": self.requests, "hedged": self.hedged, "endpoints": endpoints}
+
+    def close(self):
+        self.stop_event.set()
+        self.executor.shutdown(wait=False)
+
+
+class NodePoolProvider(JSONBaseProvider):
+    """
+    Web3 provider that sends its JSON-RPC requests through a NodePool.
+
+    Args:
+        pool (NodePool): The node pool.
+        timeout (tuple or float, optional): Timeout of the requests.
+    """
+
+    def __init__(self, pool, timeout=None):
+        super().__init__()
+        self.pool = pool
+        self.timeout = timeout
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        response = self.pool.post(method=method, data=request_data, headers={"Content-Type": "application/json"}, timeout=self.timeout)
+        response.raise_for_status()
+        return self.decode_rpc_response(response.content)
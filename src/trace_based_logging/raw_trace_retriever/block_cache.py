@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging.raw_trace_retriever.trace_retriever_utils import json_rpc_batch
+
+"""
+This module provides a persistent cache for block headers. The header of a mined block (below the reorg depth) 
+never changes, so each block is requested at most once across contracts, levels, and runs. Missing headers are 
+requested with batched eth_getBlockByNumber calls (without full transactions).
+
+The cache keeps the fields the package needs: the timestamp (event-based transactions), the block hash, the base 
+fee, and the number of transactions (block tracing).
+
+Classes:
+    BlockHeaderCache: Persistent block header cache.
+
+Constants:
+    HEADER_BATCH_SIZE (int): Number of blocks requested per JSON-RPC batch.
+    HEADER_FIELDS (tuple): The cached fields of a header.
+"""
+
+logger = setup_logging()
+
+HEADER_BATCH_SIZE = 100
+HEADER_FIELDS = ("timestamp", "hash", "baseFeePerGas", "transactionCount")
+
+
+class BlockHeaderCache:
+    """
+    Persistent cache of block headers, keyed by block number. The cache can be shared by several threads.
+
+    Args:
+        path (str, optional): Path of the SQLite database file. Missing folders are created. If None, the cache is 
+                              kept in memory for the lifetime of the object.
+    """
+
+    def __init__(self, path=None):
+        if path:
+            folder = os.path.dirname(os.path.abspath(path))
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS headers (number INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL, hash TEXT, base_fee INTEGER, tx_count INTEGER)"
+        )
+        self.connection.commit()
+        self.requested = 0
+
+    @staticmethod
+    def header_from_block(block):
+        """
+        Extracts the cached fields from an eth_getBlockByNumber result (hex-encoded JSON-RPC fields).
+        """
+        return {
+            "timestamp": int(block["timestamp"], 16),
+            "hash": block.get("hash"),
+            "baseFeePerGas": int(block["baseFeePerGas"], 16) if block.get("baseFeePerGas") else None,
+            "transactionCount": len(block["transactions"]) if block.get("transactions") is not None else None,
+        }
+
+    def put_blocks(self, blocks):
+        """
+        Stores the headers of eth_getBlockByNumber results, e.g., of blocks requested for another purpose.
+
+        Args:
+            blocks (list of dict): eth_getBlockByNumber results; None entries are ignored.
+        """
+        rows = []
+        for block in blocks:
+            if block:
+                header = self.header_from_block(block)
+                rows.append((int(block["number"], 16), header["timestamp"], header["hash"], header["baseFeePerGas"], header["transactionCount"]))
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO headers (number, timestamp, hash, base_fee, tx_count) VALUES (?, ?, ?, ?, ?)", rows)
+            self.connection.commit()
+
+    def lookup(self, block_numbers):
+        found = {}
+        with self.lock:
+            # SQLite limits the number of parameters per statement
+            for i in range(0, len(block_numbers), 500):
+                batch = block_numbers[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for number, timestamp, block_hash, base_fee, tx_count in self.connection.execute(
+                    f"SELECT number, timestamp, hash, base_fee, tx_count FROM headers WHERE number IN ({placeholders})", batch
+                ):
+                    found[number] = dict(zip(HEADER_FIELDS, (timestamp, block_hash, base_fee, tx_count)))
+        return found
+
+    def get_headers(self, block_numbers, node_url):
+        """
+        Returns the headers of the given blocks; missing headers are requested from the node and cached.
+
+        Args:
+            block_numbers (iterable of int): The block numbers.
+            node_url (str): The URL of the Ethereum node.
+
+        Returns:
+            dict: Maps each block number to a dict with the fields in HEADER_FIELDS. Blocks that could not be 
+                  retrieved are missing.
+        """
+        block_numbers = sorted({int(block_number) for block_number in block_numbers})
+        headers = self.lookup(block_numbers)
+        missing = [block_number for block_number in block_numbers if block_number not in headers]
+        for i in range(0, len(missing), HEADER_BATCH_SIZE):
+            batch = missing[i:i + HEADER_BATCH_SIZE]
+            blocks = json_rpc_batch(node_url, [("eth_getBlockByNumber", [hex(block_number), False]) for block_number in batch])
+            self.requested += len(batch)
+            self.put_blocks(blocks)
+            for block_number, block in zip(batch, blocks):
+                if block:
+                    headers[block_number] = self.header_from_block(block)
+        if missing:
+            logger.info(f"Block headers: {len(block_numbers) - len(missing)} of {len(block_numbers)} from the cache, {len(missing)} requested")
+        return headers
+
+    def get_timestamps(self, block_numbers, node_url):
+        """
+        Returns the timestamps of the given blocks, see `get_headers`.
+        """
+        return {block_number: header["timestamp"] for block_number, header in self.get_headers(block_numbers, node_url).items()}
+
+    def close(self):
+        self.connection.close()
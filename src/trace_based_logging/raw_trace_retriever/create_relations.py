@@ -1,17 +1,121 @@
+from collections import defaultdict, deque
+import pandas as pd
 from src.trace_based_logging.logging_config import setup_logging
 
 logger = setup_logging()
 
+def select_creations(df_trace_tree):
+    """
+    Selects the CREATE and CREATE2 rows of a trace DataFrame, which are all that is needed to follow CREATE-relations.
+
+    Args:
+        df_trace_tree (pd.DataFrame): A DataFrame containing transaction trace data.
+
+    Returns:
+        pd.DataFrame: The rows with the type "CREATE" or "CREATE2".
+    """
+    if "type" not in df_trace_tree.columns:
+        return pd.DataFrame(columns=["type", "from", "to"])
+    return df_trace_tree[df_trace_tree["type"].isin(["CREATE", "CREATE2"])]
+
+
+class CreationGraph:
+    """
+    Index of the CREATE-relations found so far, as an undirected adjacency of creators and created contracts. The 
+    index is updated with the CREATE rows of each level only, and the contracts related to the DApp are found by a 
+    graph traversal from the DApp contracts. As the set of reached contracts is kept between levels, a level only 
+    traverses the part of the graph that its new CREATE-relations connect.
+
+    Attributes:
+        adjacency (dict): Maps each address to the set of addresses it created or was created by.
+        reached (set): The addresses reached from the DApp contracts so far, including predefined non-DApp contracts.
+    """
+
+    def __init__(self):
+        self.adjacency = defaultdict(set)
+        self.reached = set()
+
+    def add_creations(self, df_creations):
+        """
+        Adds the CREATE-relations of CREATE and CREATE2 rows to the index.
+
+        Args:
+            df_creations (pd.DataFrame): CREATE and CREATE2 rows (at least with the columns "from" and "to"), e.g., 
+                                         from `select_creations`.
+
+        Returns:
+            list of tuple: The relations (creator, created contract) that were not in the index yet.
+        """
+        new_relations = []
+        if df_creations.empty:
+            return new_relations
+        # The "from"-address may carry the position of the computational step as an attachment (_[count]); only the 
+        # first 42 characters belong to the actual address. Failed creations have no "to"-address and are skipped.
+        for creator, created in zip(df_creations["from"], df_creations["to"]):
+            if not isinstance(creator, str) or not isinstance(created, str):
+                continue
+            creator = creator[:42]
+            if created not in self.adjacency[creator]:
+                self.adjacency[creator].add(created)
+                self.adjacency[created].add(creator)
+                new_relations.append((creator, created))
+        return new_relations
+
+    def update(self, df_creations, contracts_dapp, contracts_non_dapp):
+        """
+        Adds the CREATE rows of a level to the index and identifies the contracts related to the DApp. A contract is 
+        related if it was created by or created a related contract, starting from the known DApp contracts. The 
+        traversal passes through predefined non-DApp contracts, which are removed from the result.
+
+        Args:
+            df_creations (pd.DataFrame): The CREATE and CREATE2 rows of the new traces.
+            contracts_dapp (set): The contract addresses known to be part of the DApp; updated in place.
+            contracts_non_dapp (set): The contract addresses known not to be part of the DApp.
+
+        Returns:
+            tuple: Returns a tuple containing two sets:
+                - contracts_dapp (set): The updated set of contract addresses associated with the DApp.
+                - set_contracts_lx (set): The newly discovered contract addresses, excluding predefined non-DApp contracts.
+        """
+        new_relations = self.add_creations(df_creations)
+        # Everything reached before is closed under the previous relations; only new DApp contracts and the new 
+        # relations that touch reached contracts extend the traversal
+        frontier = [contract for contract in contracts_dapp if contract not in self.reached]
+        for creator, created in new_relations:
+            if creator in self.reached and created not in self.reached:
+                frontier.append(created)
+            elif created in self.reached and creator not in self.reached:
+                frontier.append(creator)
+        newly_reached = set()
+        queue = deque(frontier)
+        while queue:
+            contract = queue.popleft()
+            if contract in self.reached:
+                continue
+            self.reached.add(contract)
+            newly_reached.add(contract)
+            queue.extend(neighbor for neighbor in self.adjacency.get(contract, ()) if neighbor not in self.reached)
+
+        # Remove contracts that are known for not belonging to the DApp from the newly discovered contracts, so that 
+        # the next level does not follow the CREATE-relations of another DApp deployed by the same root (see create_relations)
+        set_contracts_lx = remove_contracts_non_dapp(newly_reached - contracts_dapp, contracts_non_dapp)
+        contracts_dapp.update(set_contracts_lx)
+        contracts_dapp.difference_update(contracts_non_dapp)
+        return contracts_dapp, set_contracts_lx
+
+
 def create_relations(df_trace_tree, contracts_dapp, set_contracts_lx, contracts_non_dapp):
     """
     Analyzes blockchain transaction traces stored in a dataframe to identify CREATE-relationships between contracts related to a DApp. 
     This process involves identifying contracts created by or that created known DApp contracts, and updating the set of contracts associated with the DApp. 
     Additionally, it filters out predefined non-DApp contracts.
 
+    The extraction keeps a `CreationGraph` across levels instead, which only processes the CREATE rows of each level.
+
     Args:
         df_trace_tree (pd.DataFrame): A DataFrame containing transaction trace data, which includes information on transactions with types "CREATE" or "CREATE2".
         contracts_dapp (set): A set of contract addresses known to be part of the DApp.
-        set_contracts_lx (set): A dynamic set of contract addresses under investigation for their relevance to the DApp. It gets updated throughout the function execution.
+        set_contracts_lx (set): The contract addresses under investigation at the current level (kept for compatibility).
         contracts_non_dapp (set): A set of contract addresses known not to be part of the DApp, used for filtering purposes.
 
     Returns:
@@ -25,75 +129,18 @@ def create_relations(df_trace_tree, contracts_dapp, set_contracts_lx, contracts_
         3. Identifies relevant contracts based on their creation relationships. A contract is deemed relevant if:
             - It is created by a contract known to be part of the DApp.
             - It is a known DApp contract being created in the trace.
-        4. Iteratively updates the set of DApp contracts as new relationships are discovered through the traces.
+        4. Follows the relationships transitively (graph traversal) as new relationships are discovered through the traces.
         5. Filters out any contracts identified as non-DApp contracts from the set of newly discovered contracts to ensure the purity of the DApp's contract ecosystem.
         
     Note:
         The function employs a temporary solution for identifying CREATE-relations by trimming the "from" addresses to their first 42 characters, due to a workaround for encoding the order of computational steps in the trace data. 
         Future improvements could refine how order and relationships are encoded and identified.
     """
-    # Create masks to only consider CREATE traces to find contracts that were created by contracts we looked at
-    # For now, all CREATE-relations are identified. We sort out relevant ones later.
-    mask_create = df_trace_tree["type"]=="CREATE"
-    mask_create2 = df_trace_tree["type"]=="CREATE2"
-    mask_create = mask_create+mask_create2
-    df_trace_tree_creates = df_trace_tree[mask_create]
-
     # Big issue in blockchain and therefore in the code is the ordering of events (essentially: http://www.workflowpatterns.com/patterns/logimperfection/elp1.php).
     # In order to insert an order, the position of a computational step in the trace tree was stored as an extension of the "from"-address in the JSON (attached _[count] to "from" address). This can be improved.
-    # As a consequence, the "from"-address now has to be liberated from its coding accident related attachement. To fix the issue, only use the first 42 characters of the "from"-addresses (only characters that belong to the actual address), and omit the attached order.
-    # This remains temporary for the identification of CREATE-relations
-
-    # Written by ChatGPT
-    # Check if 'from' is a string and has a length of at least 42 characters
-    mask = (df_trace_tree_creates['from'].str.len() >= 42) & df_trace_tree_creates['from'].apply(lambda x: isinstance(x, str))
-    # Use .loc to set values that meet the condition
-    df_trace_tree_creates.loc[mask, 'from'] = df_trace_tree_creates['from'].str[:42]
-        
-    # Now identify relevant contracts in the CREATE-relations. Beware and exclude contracts that were created by accounts that do not belong to the DApp
-    # There are two cases:
-    # 1) Contracts were created by contracts we know belong to the DApp -> Created contracts are relevant (contracts that have "from"-address set_contracts_lx)
-    # 2) Contracts we know belong to the DApp were created -> Creating contracts are relevant (contracts that have "to"-address set_contracts_lx)
-    # Those contracts identified might then in turn have additional relevant CREATE-relations like 1) and 2), hence, we have move on iteratively and the the whole state of traces has to be considered
-
-    # Make a copy of known DApp contracts to be able to compare against new contracts later
-    contracts_dapp_minus_1 = contracts_dapp.copy()
-    set_tmp = set()
-    while set_tmp != set_contracts_lx: 
-        set_tmp = set_contracts_lx.copy()
-        creators_of_contracts = set(df_trace_tree_creates[df_trace_tree_creates['to'].isin(contracts_dapp)]["from"].tolist())
-        # creations by contracts of the list (this has to happen after "creators_of_contracts" to not miss out on their creations)    
-        creations_of_contracts = set(df_trace_tree_creates[df_trace_tree_creates['from'].isin(contracts_dapp)]["to"].tolist())
-                
-        creators_and_creations = creators_of_contracts.union(creations_of_contracts)
-        contracts_dapp.update(creators_and_creations)
-        set_contracts_lx.update(creators_and_creations)
-        # print("NEW LIST CONTRACTS", set_contracts_lx)
-        # print(set_tmp != set_contracts_lx)
-    
-       
-    set_contracts_lx = contracts_dapp.difference(contracts_dapp_minus_1)
-    # Remove contracts that are known for not belonging to the DApp from the list of newly discovered contracts.
-    # Why? Because the next iterations looks for all CREATE-relations to and from the contracts is set_contracts_lx
     # If a deployment was not clean, (e.g., a root deployed more than one DApp), the branches to non-DApp CREATION-relations can be "pruned" by removing those contracts we know do not belong to the DApp anyways.
     # The alternative would be that contracts that do not belong to the DApp are identified as DApp contracts in the next iterations. We would end up with deployment trees of multiple DApps. 
-    set_contracts_lx = remove_contracts_non_dapp(set_contracts_lx, contracts_non_dapp)
-    
-
-    """
-    if "0x0000000000000000000000000000000000000000".lower() in set_contracts_lx:
-        ts = datetime.datetime.fromtimestamp(time.time()).strftime('%d-%m-%Y %H:%M:%S')
-        # print(ts, "0x0000000000000000000000000000000000000000 was excluded")
-        set_contracts_lx.remove("0x0000000000000000000000000000000000000000")
-    else: 
-        ts = datetime.datetime.fromtimestamp(time.time()).strftime('%d-%m-%Y %H:%M:%S')
-        # print(ts, "0x0000000000000000000000000000000000000000 was not in the contract list")
-    """
-    contracts_dapp = contracts_dapp.union(creators_and_creations)
-    
-    contracts_dapp = remove_contracts_non_dapp(contracts_dapp, contracts_non_dapp)    
-    
-    return contracts_dapp, set_contracts_lx
+    return CreationGraph().update(select_creations(df_trace_tree), contracts_dapp, contracts_non_dapp)
 
 
 def remove_contracts_non_dapp(set_contracts_lx, contracts_non_dapp):
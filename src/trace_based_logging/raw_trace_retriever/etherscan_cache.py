@@ -0,0 +1,143 @@
+import os
+import json
+import sqlite3
+import threading
+import pandas as pd
+from src.trace_based_logging.logging_config import setup_logging
+
+"""
+This module provides a persistent cache of the transaction lists received from Etherscan. The cache keeps the
+transactions of each contract and action ('normal' or 'internal') together with the block intervals that were
+completely fetched. When the block range of a run is widened, e.g., to re-run a dApp with a longer horizon, only
+the missing block intervals are requested from Etherscan.
+
+Only complete responses are cached: the intervals of requests that failed are not recorded and are requested again
+in the next run. The cached intervals should end below the chain head, as later transactions in the same blocks are
+not known to the cache.
+
+Classes:
+    EtherscanCache: Persistent cache of Etherscan transaction lists with covered block intervals.
+"""
+
+logger = setup_logging()
+
+
+class EtherscanCache:
+    """
+    Persistent cache of Etherscan transaction lists, keyed by contract, action, and block interval. The cache can be
+    shared by several threads.
+
+    Args:
+        path (str, optional): Path of the SQLite database file. Missing folders are created. If None, the cache is
+                              kept in memory for the lifetime of the object.
+    """
+
+    def __init__(self, path=None):
+        if path:
+            folder = os.path.dirname(os.path.abspath(path))
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS intervals (contract TEXT NOT NULL, action TEXT NOT NULL, from_block INTEGER NOT NULL, to_block INTEGER NOT NULL)"
+        )
+        # A row is stored as the JSON of the Etherscan record; the record identifies the row, as internal
+        # transactions can list the same hash several times
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS transactions (contract TEXT NOT NULL, action TEXT NOT NULL, block_number INTEGER NOT NULL, record TEXT NOT NULL, "
+            "PRIMARY KEY (contract, action, record))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS transactions_block ON transactions (contract, action, block_number)")
+        self.connection.commit()
+
+    def intervals(self, contract, action):
+        """
+        Returns the covered block intervals of a contract and action as a sorted list of (from_block, to_block).
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT from_block, to_block FROM intervals WHERE contract = ? AND action = ? ORDER BY from_block", (contract.lower(), action)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def missing_intervals(self, contract, action, min_block, max_block):
+        """
+        Returns the block intervals between min_block and max_block (inclusive) that are not covered by the cache.
+
+        Args:
+            contract (str): The contract address.
+            action (str): 'normal' or 'internal'.
+            min_block (int): The first block of the requested range.
+            max_block (int): The last block of the requested range.
+
+        Returns:
+            list of tuple: The missing intervals (from_block, to_block) in block order.
+        """
+        missing = []
+        start = min_block
+        for from_block, to_block in self.intervals(contract, action):
+            if to_block < start:
+                continue
+            if from_block > max_block:
+                break
+            if from_block > start:
+                missing.append((start, from_block - 1))
+            start = max(start, to_block + 1)
+        if start <= max_block:
+            missing.append((start, max_block))
+        return missing
+
+    def store(self, contract, action, from_block, to_block, transactions):
+        """
+        Stores the complete transaction list of a block interval and merges the interval with the covered ones.
+
+        Args:
+            contract (str): The contract address.
+            action (str): 'normal' or 'internal'.
+            from_block (int): The first block of the fetched interval.
+            to_block (int): The last block of the fetched interval.
+            transactions (pd.DataFrame): The transactions (Etherscan records) of the interval.
+        """
+        contract = contract.lower()
+        rows = []
+        for record in transactions.to_dict("records"):
+            block_number = int(record["blockNumber"])
+            if from_block <= block_number <= to_block:
+                rows.append((contract, action, block_number, json.dumps(record, default=str)))
+        with self.lock:
+            self.connection.executemany("INSERT OR IGNORE INTO transactions (contract, action, block_number, record) VALUES (?, ?, ?, ?)", rows)
+            # Overlapping and adjacent intervals are merged into one
+            overlapping = self.connection.execute(
+                "SELECT from_block, to_block FROM intervals WHERE contract = ? AND action = ? AND to_block >= ? AND from_block <= ?",
+                (contract, action, from_block - 1, to_block + 1)
+            ).fetchall()
+            merged_from = min([from_block] + [row[0] for row in overlapping])
+            merged_to = max([to_block] + [row[1] for row in overlapping])
+            self.connection.execute(
+                "DELETE FROM intervals WHERE contract = ? AND action = ? AND to_block >= ? AND from_block <= ?",
+                (contract, action, from_block - 1, to_block + 1)
+            )
+            self.connection.execute("INSERT INTO intervals (contract, action, from_block, to_block) VALUES (?, ?, ?, ?)", (contract, action, merged_from, merged_to))
+            self.connection.commit()
+
+    def get(self, contract, action, min_block, max_block):
+        """
+        Returns the cached transactions of a contract and action between min_block and max_block (inclusive), in
+        block order.
+
+        Returns:
+            pd.DataFrame: The Etherscan records; empty if there are none.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT record FROM transactions WHERE contract = ? AND action = ? AND block_number BETWEEN ? AND ? ORDER BY block_number, rowid",
+                (contract.lower(), action, min_block, max_block)
+            ).fetchall()
+        return pd.DataFrame([json.loads(row[0]) for row in rows])
+
+    def close(self):
+        self.connection.close()
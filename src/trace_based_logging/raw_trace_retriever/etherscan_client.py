@@ -0,0 +1,167 @@
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport
+from src.trace_based_logging.request_controller import backoff_delay
+
+"""
+This module provides a concurrent client for the Etherscan API. All requests of the package (transaction lists and 
+ABIs) go through one client, so that they share one rate limit that matches the API tier of the key.
+
+The rate limit is a token bucket: every request takes a token, and tokens are refilled at the configured number 
+of requests per second. When Etherscan answers that the rate limit is reached, the request is retried with 
+jittered exponential backoff, and the bucket is paused for the backoff time, so that the other threads slow down as well.
+
+Classes:
+    TokenBucket: Thread-safe token bucket.
+    EtherscanClient: Rate-limited, concurrent Etherscan client with retries.
+
+Constants:
+    ETHERSCAN_API_URL (str): URL of the Etherscan API.
+    REQUESTS_PER_SECOND (float): Default rate limit (free API tier).
+    MAX_WORKERS (int): Default number of concurrent requests.
+    MAX_ATTEMPTS (int): Default number of attempts per request.
+    BACKOFF_BASE (float): Maximum backoff time in seconds after the first failed attempt; doubled with every further 
+                          attempt. The backoff time is drawn at random up to this maximum (jitter).
+    BACKOFF_MAX (float): Maximum backoff time in seconds.
+"""
+
+logger = setup_logging()
+
+ETHERSCAN_API_URL = 'https://api.etherscan.io/api'
+REQUESTS_PER_SECOND = 5
+MAX_WORKERS = 5
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that limits the rate of requests.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float, optional): Maximum number of tokens (burst size). Defaults to `rate`, at least 1.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token; blocks until a token is available.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now > self.last_refill:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                    self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.last_refill - now, 0) + (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Empties the bucket and stops the refill for the given time, e.g., after a rate-limit response.
+        """
+        with self.lock:
+            self.tokens = 0
+            self.last_refill = max(self.last_refill, time.monotonic() + seconds)
+
+
+class EtherscanClient:
+    """
+    Rate-limited, concurrent client for the Etherscan API.
+
+    Args:
+        api_key (str): The Etherscan API key.
+        requests_per_second (float): Rate limit of the API key.
+        max_workers (int): Number of requests kept in flight by `map`.
+        max_attempts (int): Number of attempts per request.
+    """
+
+    def __init__(self, api_key, requests_per_second=REQUESTS_PER_SECOND, max_workers=MAX_WORKERS, max_attempts=MAX_ATTEMPTS):
+        self.api_key = api_key
+        self.bucket = TokenBucket(requests_per_second)
+        self.max_workers = max(1, max_workers)
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def is_rate_limited(response_json):
+        return response_json.get("status") == "0" and isinstance(response_json.get("result"), str) and "rate limit" in response_json["result"].lower()
+
+    def backoff(self, attempt):
+        delay = backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX)
+        self.bucket.pause(delay)
+        time.sleep(delay)
+
+    def request(self, parameters):
+        """
+        Sends a request to the Etherscan API, respecting the rate limit.
+
+        Args:
+            parameters (dict): Query parameters of the request, without the API key.
+
+        Returns:
+            dict: The JSON response.
+
+        Raises:
+            Exception: If no valid response was received after `max_attempts` attempts.
+        """
+        parameters = dict(parameters, apikey=self.api_key)
+        for attempt in range(self.max_attempts):
+            self.bucket.acquire()
+            try:
+                response_API = transport.get(ETHERSCAN_API_URL, parameters)
+                if response_API.status_code == 429:
+                    logger.debug(f"Etherscan rate limit reached (HTTP 429). Retrying... {attempt + 1}/{self.max_attempts}")
+                else:
+                    response_API.raise_for_status()
+                    response_json = response_API.json()
+                    if not self.is_rate_limited(response_json):
+                        return response_json
+                    logger.debug(f"Etherscan rate limit reached: {response_json['result']}. Retrying... {attempt + 1}/{self.max_attempts}")
+            except requests.exceptions.ConnectionError as e:
+                logger.error(f"ConnectionError encountered: {e}. Retrying...")
+            except requests.exceptions.HTTPError as e:
+                logger.error(f"HTTPError encountered: {e}. Retrying...")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Other RequestException encountered: {e}. Retrying...")
+            except ValueError as e:
+                logger.error(f"JSON decoding error: {e}. Retrying...")
+            self.backoff(attempt)
+        raise Exception(f"API request failed after {self.max_attempts} attempts")
+
+    def map(self, func, items):
+        """
+        Applies a function that sends requests through this client to several items concurrently.
+
+        Args:
+            func (callable): Function that takes one item.
+            items (iterable): The items, e.g., contract addresses.
+
+        Returns:
+            list: The results in the order of `items`.
+        """
+        items = list(items)
+        if self.max_workers == 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def get_transaction_list(self, address, min_block, max_block, internal_flag):
+        action = "txlistinternal" if internal_flag == "internal" else "txlist"
+        return self.request({"module": "account", "action": action, "address": address, "startblock": min_block, "endblock": max_block})
+
+    def get_abi(self, address):
+        return self.request({"module": "contract", "action": "getabi", "address": address})
@@ -0,0 +1,202 @@
+import glob
+import json
+import os
+import sqlite3
+import pandas as pd
+from src.trace_based_logging.logging_config import setup_logging
+
+"""
+This module provides durable checkpoints for the extraction. A restarted extraction continues where the previous 
+run stopped: the transactions of the interrupted level are not fetched again, transactions whose trace rows are 
+already in a partition are not replayed again, and transaction indexes already queried are not queried again.
+
+The checkpoint is an SQLite ledger next to the trace partitions. It records:
+    - the current level, `contracts_dapp`, and `contracts_lx` (updated once a level is complete),
+    - the hashes of all fetched transactions (`all_transactions`),
+    - the trace partitions written so far and the hashes of the transactions they contain,
+    - the transaction indexes queried so far,
+    - a fingerprint of the settings that change the result of the extraction (e.g., the contracts or the tracer mode).
+The transactions fetched for the current level are kept as a pickle in the same folder until the level is complete.
+A ledger that was written with a different fingerprint is cleared, so that a run with other settings starts over
+instead of resuming (or outputting) the partitions of the earlier run.
+
+Classes:
+    ExtractionCheckpoint: Ledger of the extraction progress.
+
+Constants:
+    CHECKPOINT_FILE (str): File name of the ledger in the partition folder.
+"""
+
+logger = setup_logging()
+
+CHECKPOINT_FILE = "checkpoint.sqlite"
+
+
+class ExtractionCheckpoint:
+    """
+    Ledger of the extraction progress in a partition folder.
+
+    Args:
+        folder (str): The partition folder of the extraction. It is created if it does not exist.
+        fingerprint (str, optional): Fingerprint of the settings of the run. If the ledger holds the progress of a run
+                                     with another (or without a) fingerprint, it is cleared, and `discarded` is True.
+
+    Attributes:
+        discarded (bool): True if the progress of an earlier run was cleared because its settings differ.
+    """
+
+    def __init__(self, folder, fingerprint=None):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.folder = folder
+        # Partitions are recorded by the last stage of the trace pipeline, while the extraction waits for it; the
+        # checkpoint is never used by two threads at the same time
+        self.connection = sqlite3.connect(os.path.join(folder, CHECKPOINT_FILE), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS fetched (hash TEXT PRIMARY KEY, level INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS partitions (level INTEGER NOT NULL, chunk INTEGER NOT NULL, path TEXT NOT NULL, PRIMARY KEY (level, chunk));
+            CREATE TABLE IF NOT EXISTS traced (hash TEXT PRIMARY KEY, level INTEGER NOT NULL, chunk INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS tx_index (hash TEXT PRIMARY KEY, transaction_index INTEGER NOT NULL);
+            """
+        )
+        self.connection.commit()
+        self.discarded = False
+        if fingerprint is not None:
+            self.check_fingerprint(fingerprint)
+
+    def check_fingerprint(self, fingerprint):
+        saved = self.connection.execute("SELECT value FROM state WHERE key = 'fingerprint'").fetchone()
+        progress = self.connection.execute("SELECT 1 FROM state WHERE key = 'extraction'").fetchone()
+        if progress is not None and (saved is None or saved[0] != fingerprint):
+            logger.warning(f"The extraction checkpoint in {self.folder} was written with other settings and is not resumed; the extraction starts over.")
+            self.clear()
+            self.discarded = True
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+
+    def clear(self):
+        """
+        Removes the recorded progress and the pickled transactions of the levels. The partition files are removed by the
+        partition store.
+        """
+        with self.connection:
+            for table in ("state", "fetched", "partitions", "traced", "tx_index"):
+                self.connection.execute(f"DELETE FROM {table}")
+        for path in glob.glob(os.path.join(self.folder, "transactions_level_*.pkl")):
+            os.remove(path)
+
+    def transactions_path(self, level):
+        return os.path.join(self.folder, f"transactions_level_{level:03d}.pkl")
+
+    def save_state(self, level, state):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('extraction', ?)",
+                (json.dumps({"level": level, "contracts_dapp": sorted(state["contracts_dapp"]), "contracts_lx": sorted(state["contracts_lx"])}),)
+            )
+
+    def start_level(self, level, transactions, state):
+        """
+        Records the transactions fetched for a level before they are traced.
+
+        Args:
+            level (int): The level of the transactions.
+            transactions (pd.DataFrame): The new transactions of the level.
+            state (dict): The extraction state.
+        """
+        transactions.to_pickle(self.transactions_path(level) + ".tmp")
+        os.replace(self.transactions_path(level) + ".tmp", self.transactions_path(level))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO fetched (hash, level) VALUES (?, ?)", ((str(tx_hash), level) for tx_hash in transactions["hash"])
+            )
+        if state.get("transaction_indexes"):
+            self.record_transaction_indexes(state["transaction_indexes"])
+        self.save_state(level, state)
+
+    def complete_level(self, level, next_level, state):
+        """
+        Records the contracts found at a completed level, so that a restarted run continues with the next level.
+
+        Args:
+            level (int): The completed level.
+            next_level (int): The level the extraction continues with.
+            state (dict): The extraction state after the CREATE-relations of the level were followed.
+        """
+        self.save_state(next_level, state)
+        if os.path.exists(self.transactions_path(level)):
+            os.remove(self.transactions_path(level))
+
+    def record_partition(self, level, chunk, path, tx_hashes):
+        """
+        Records a written partition and the transactions whose trace rows it contains.
+
+        Args:
+            level (int): The level of the partition.
+            chunk (int): The number of the chunk within the level.
+            path (str): Path of the partition file.
+            tx_hashes (iterable): Hashes of the transactions in the partition.
+        """
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO partitions (level, chunk, path) VALUES (?, ?, ?)", (level, chunk, path))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO traced (hash, level, chunk) VALUES (?, ?, ?)", ((str(tx_hash), level, chunk) for tx_hash in tx_hashes)
+            )
+
+    def last_chunk(self, level):
+        return self.connection.execute("SELECT COALESCE(MAX(chunk), 0) FROM partitions WHERE level = ?", (level,)).fetchone()[0]
+
+    def partitions(self):
+        return [row[0] for row in self.connection.execute("SELECT path FROM partitions ORDER BY level, chunk")]
+
+    def traced_hashes(self):
+        return {row[0] for row in self.connection.execute("SELECT hash FROM traced")}
+
+    def restore(self, state, partition_store):
+        """
+        Restores the extraction state and the partition store from the ledger.
+
+        Args:
+            state (dict): The extraction state. `contracts_dapp`, `contracts_lx`, and `all_transactions` are replaced
+                          by the recorded values.
+            partition_store (TracePartitionStore): Store the recorded partitions are loaded into.
+
+        Returns:
+            tuple: The level to continue with and the transactions of that level that are not traced yet (a DataFrame),
+                   or None for the transactions if the level has to be fetched first. The level is 1 if nothing is
+                   recorded.
+        """
+        row = self.connection.execute("SELECT value FROM state WHERE key = 'extraction'").fetchone()
+        if row is None:
+            return 1, None
+        saved = json.loads(row[0])
+        state["contracts_dapp"] = set(saved["contracts_dapp"])
+        state["contracts_lx"] = set(saved["contracts_lx"])
+        state["all_transactions"] = {row[0] for row in self.connection.execute("SELECT hash FROM fetched")}
+        for path in self.partitions():
+            partition_store.load(path)
+        level = saved["level"]
+        pending = None
+        if os.path.exists(self.transactions_path(level)):
+            transactions = pd.read_pickle(self.transactions_path(level))
+            pending = transactions[~transactions["hash"].astype(str).isin(self.traced_hashes())].reset_index(drop=True)
+        logger.info(f"Resuming extraction at level {level}: {len(state['all_transactions'])} transactions fetched, "
+                    f"{partition_store.row_count} operations in {len(partition_store.paths)} partitions, "
+                    f"{len(pending) if pending is not None else 0} transactions of the level left to trace.")
+        return level, pending
+
+    def transaction_indexes(self):
+        return dict(self.connection.execute("SELECT hash, transaction_index FROM tx_index"))
+
+    def record_transaction_indexes(self, transaction_indexes):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tx_index (hash, transaction_index) VALUES (?, ?)",
+                ((str(tx_hash), int(tx_index)) for tx_hash, tx_index in transaction_indexes.items())
+            )
+
+    def close(self):
+        self.connection.close()
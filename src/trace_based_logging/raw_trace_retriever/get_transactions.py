@@ -4,7 +4,13 @@ import requests
 import datetime
 from web3 import Web3
 import math
+import threading
 from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport, request_controller
+from src.trace_based_logging.raw_trace_retriever.etherscan_client import EtherscanClient
+from src.trace_based_logging.raw_trace_retriever.log_range_scheduler import LogRangeScheduler, is_range_error
+from src.trace_based_logging.raw_trace_retriever.block_cache import BlockHeaderCache
+from src.trace_based_logging.raw_trace_retriever.trace_retriever_utils import json_rpc_call
 
 
 """
@@ -13,19 +19,33 @@ This module provides functionalities to fetch and process blockchain transaction
 Functions:
 - send_api_request: Sends a request to the Etherscan API to fetch transaction data.
 - request_mediator: Processes the JSON response from Etherscan, converting it into a DataFrame.
-- get_transactions: Fetches and processes transactions for a list of contracts.
-- get_transactions_by_events: Fetches transactions by querying contract events and extracting the transaction hashes.
+- is_complete_response: Checks whether an Etherscan response is a (possibly empty) list of transactions.
+- fetch_contract_range: Fetches the transactions of one contract within a block range, splitting it into concurrent sub-ranges beyond Etherscan's result limit.
+- get_contract_transactions: Fetches all transactions of one contract, requesting only the block intervals missing in the cache.
+- get_transactions: Fetches and processes transactions for a list of contracts concurrently.
+- get_transactions_by_events: Fetches transactions by querying contract events (with adaptive block ranges) and extracting the transaction hashes.
+- get_transactions_by_trace_filter: Fetches transactions interacting with contracts with the node's trace_filter method.
 - event_fetcher: Fetches logs of events from a blockchain node using Web3.
 
 Constants:
-- CHUNK_SIZE: Defines the chunk size for processing blocks in batches.
-- DELAY: Specifies the delay between API requests to manage server load and avoid throttling.
+- CHUNK_SIZE: Defines the initial chunk size (in blocks) of the event queries; the size adapts to the density of events.
+- LOG_WORKERS: Defines the number of event queries kept in flight.
+- PAGE_SIZE: Etherscan's maximum number of transactions per request.
+- PAGE_TARGET: Defines the expected number of transactions per sub-range when a range exceeds PAGE_SIZE.
+- ADDRESS_BATCH_SIZE: Defines the number of contract addresses per event (or trace_filter) query.
+- TRACE_FILTER_CHUNK_SIZE: Defines the initial chunk size (in blocks) of the trace_filter queries.
 """
 
-# The function get_transactions_by_events() works in chunks; here is the definition of the chunk size
+# The function get_transactions_by_events() works in chunks; here is the definition of the initial chunk size
 CHUNK_SIZE = 10000
-# At times, recovery times for servers between requests make sense; here is the definition of the recovery time
-DELAY = 20
+LOG_WORKERS = 1
+# Etherscan returns at most PAGE_SIZE transactions per request; sub-ranges are sized to expect PAGE_TARGET transactions
+PAGE_SIZE = 10000
+PAGE_TARGET = 5000
+# Number of contract addresses combined in one eth_getLogs (or trace_filter) filter
+ADDRESS_BATCH_SIZE = 100
+# The function get_transactions_by_trace_filter() starts with smaller chunks, as traces are denser than events
+TRACE_FILTER_CHUNK_SIZE = 1000
 
 
 # Create a logger
@@ -33,7 +53,7 @@ logger = setup_logging()
 
 ####################### internal - external #######################
 
-def send_api_request(contract_address_tmp, min_block, max_block, internal_flag, etherscan_api_key):
+def send_api_request(contract_address_tmp, min_block, max_block, internal_flag, etherscan_api_key, client=None):
     """
     Sends an API request to Etherscan to fetch transaction data for a given contract address within a specified block range.
 
@@ -43,53 +63,18 @@ def send_api_request(contract_address_tmp, min_block, max_block, internal_flag,
         max_block (int): The ending block number for the query range.
         internal_flag (str): Specifies the type of transactions to fetch ('normal' or 'internal').
         etherscan_api_key (str): The API key for accessing Etherscan's API service.
+        client (EtherscanClient, optional): The shared, rate-limited Etherscan client. If None, a client is created.
 
     Returns:
-        requests.Response: The response object from the Etherscan API request.
+        dict: The JSON response of the Etherscan API.
 
     Raises:
-        Exception: If the API request fails after the specified number of retries.
+        Exception: If the API request fails after the client's number of attempts.
     """
-    api_key = etherscan_api_key
-    
-    max_retries = 5
-        
+    if client is None:
+        client = EtherscanClient(etherscan_api_key)
     # we are interested in 1) txs with the contract as sender / receiver ("normal" txs) and 2) txs the contract was part of (on Etherscan called "internal transactions"). To differentiate the requests, there is a flag
-    if internal_flag == "normal":
-        parameters = {
-            "module": "account",
-            "action": "txlist",
-            "address": contract_address_tmp,
-            "startblock": min_block,
-            "endblock": max_block, 
-            "apikey": api_key
-        }    
-    if internal_flag == "internal":
-        parameters = {
-            "module": "account",
-            "action": "txlistinternal",
-            "address": contract_address_tmp,
-            "startblock": min_block,
-            "endblock": max_block, 
-            "apikey": api_key
-        }
-    
-    for attempt in range(max_retries):
-        
-        try:
-            response_API = requests.get('https://api.etherscan.io/api', parameters)
-            return response_API
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"ConnectionError encountered: {e}. Retrying...")
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"HTTPError encountered: {e}. Retrying...")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Other RequestException encountered: {e}. Retrying...")
-        time.sleep(DELAY)
-    raise Exception(f"API request failed after {max_retries} attempts")
-
-
-
+    return client.get_transaction_list(contract_address_tmp, min_block, max_block, internal_flag)
 
 def request_mediator(txs_json_lx, df_txs_lx, contract_address_tmp): 
     """
@@ -123,16 +108,130 @@ def request_mediator(txs_json_lx, df_txs_lx, contract_address_tmp):
     return df_txs_lx, df_txs_lx_tmp#, count_txs_tmp
 
 
-def get_transactions(list_lx, min_block, max_block, internal_flag, etherscan_api_key):
+def is_complete_response(txs_json_lx):
+    """
+    Checks whether an Etherscan response lists all transactions of the request, i.e., it is not an error message.
+    An empty list ("No transactions found") is complete.
+    """
+    return txs_json_lx.get("status") == "1" or isinstance(txs_json_lx.get("result"), list)
+
+
+def fetch_contract_range(contract_address_tmp, min_block, max_block, internal_flag, client):
+    """
+    Fetches the transactions of one contract address within a block range. Etherscan returns at most 10,000 
+    transactions per request; if a request hits this limit, the rest of the range is split into sub-ranges, sized 
+    by the transaction density observed so far (at most one per worker of the client), which are requested 
+    concurrently through the client.
+
+    Only the blocks a response covers completely are kept: the last block of a truncated response is requested again 
+    as the first block of the next sub-range, so no transaction is kept twice.
+
+    Args:
+        contract_address_tmp (str): The contract address for which transactions are to be fetched.
+        min_block (int): The starting block number for the query range.
+        max_block (int): The ending block number for the query range.
+        internal_flag (str): Specifies the type of transactions to fetch ('normal' or 'internal').
+        client (EtherscanClient): The shared, rate-limited Etherscan client.
+
+    Returns:
+        tuple: A tuple containing:
+            - df_txs_contract (pd.DataFrame): The transactions of the contract within the range, in block order.
+            - complete (bool): False if Etherscan answered a request with an error message.
+
+    Raises:
+        Exception: If a request fails after the client's number of attempts.
+    """
+    pieces = []
+    complete = True
+    pending = [(min_block, max_block, None)]
+    while pending:
+        # A pending range carries the density (transactions per block) of the truncated response it continues
+        sub_ranges = []
+        for from_block, to_block, density in pending:
+            if density is None:
+                sub_ranges.append((from_block, to_block))
+                continue
+            # At most one sub-range per worker of the client, so that a dense stretch does not multiply the requests
+            span = to_block - from_block + 1
+            count = max(1, min(math.ceil(span * density / PAGE_TARGET), client.max_workers))
+            sub_range_size = math.ceil(span / count)
+            sub_ranges += [(start, min(start + sub_range_size - 1, to_block)) for start in range(from_block, to_block + 1, sub_range_size)]
+        if len(sub_ranges) > 1:
+            logger.debug(f"Transactions of {contract_address_tmp} are requested in {len(sub_ranges)} sub-ranges")
+
+        def fetch_sub_range(sub_range):
+            return send_api_request(contract_address_tmp, sub_range[0], sub_range[1], internal_flag, None, client)
+
+        pending = []
+        for (from_block, to_block), txs_json_lx in zip(sub_ranges, client.map(fetch_sub_range, sub_ranges)):
+            complete = complete and is_complete_response(txs_json_lx)
+            df_txs_lx_tmp = request_mediator(txs_json_lx, pd.DataFrame(), contract_address_tmp)[1]
+            if len(df_txs_lx_tmp) >= PAGE_SIZE:
+                # The response is truncated, most likely within its last block (< 10,000 txs per block)
+                block_numbers = pd.to_numeric(df_txs_lx_tmp.blockNumber)
+                last_block = int(block_numbers.max())
+                if last_block > from_block:
+                    df_txs_lx_tmp = df_txs_lx_tmp[block_numbers < last_block]
+                    pending.append((last_block, to_block, PAGE_SIZE / (last_block - from_block + 1)))
+                elif last_block < to_block:
+                    pending.append((last_block + 1, to_block, float(PAGE_SIZE)))
+            pieces.append((from_block, df_txs_lx_tmp))
+        logger.debug(f"{sum(len(df) for _, df in pieces)} transactions received so far for {contract_address_tmp}")
+
+    df_txs_contract = pd.concat([pd.DataFrame()] + [df for _, df in sorted(pieces, key=lambda piece: piece[0])], axis=0)
+    return df_txs_contract, complete
+
+
+def get_contract_transactions(contract_address_tmp, min_block, max_block, internal_flag, client, cache=None):
+    """
+    Fetches all transactions of one contract address. With a cache, only the block intervals that are not cached 
+    yet are requested from Etherscan.
+
+    Args:
+        contract_address_tmp (str): The contract address for which transactions are to be fetched.
+        min_block (int): The starting block number for the query range.
+        max_block (int): The ending block number for the query range.
+        internal_flag (str): Specifies the type of transactions to fetch ('normal' or 'internal').
+        client (EtherscanClient): The shared, rate-limited Etherscan client.
+        cache (EtherscanCache, optional): The persistent cache of Etherscan transaction lists.
+
+    Returns:
+        pd.DataFrame: The transactions of the contract; empty if they could not be received.
+    """
+    try:
+        if cache is None:
+            return fetch_contract_range(contract_address_tmp, min_block, max_block, internal_flag, client)[0]
+        df_txs_uncached = []
+        for from_block, to_block in cache.missing_intervals(contract_address_tmp, internal_flag, min_block, max_block):
+            df_txs_interval, complete = fetch_contract_range(contract_address_tmp, from_block, to_block, internal_flag, client)
+            if complete:
+                cache.store(contract_address_tmp, internal_flag, from_block, to_block, df_txs_interval)
+            else:
+                # Error messages are not cached; the interval is requested again in the next run
+                logger.warning(f"Incomplete response from Etherscan for {contract_address_tmp} between {from_block} and {to_block}; the interval is not cached.")
+                df_txs_uncached.append(df_txs_interval)
+        return pd.concat([cache.get(contract_address_tmp, internal_flag, min_block, max_block)] + df_txs_uncached, axis=0)
+    except Exception as e:
+        # skip contract if all retries failed
+        logger.error(f"Transaction could not be received for {contract_address_tmp}: {e}. Contract is skipped.")
+        return pd.DataFrame()
+
+
+def get_transactions(list_lx, min_block, max_block, internal_flag, etherscan_api_key, client=None, cache=None):
     """
     Fetches and processes transactions for a list of contract addresses based on the specified type ('normal' or 'internal').
 
+    The contracts are fetched concurrently through the (shared) Etherscan client, which limits the request rate.
+
     Args:
         list_lx (list): A list of contract addresses.
         min_block (int): The starting block number for the query range.
         max_block (int): The ending block number for the query range.
         internal_flag (str): Specifies the type of transactions to fetch ('normal' or 'internal').
         etherscan_api_key (str): The API key for accessing Etherscan's API service.
+        client (EtherscanClient, optional): The shared, rate-limited Etherscan client. If None, a client is created.
+        cache (EtherscanCache, optional): The persistent cache of Etherscan transaction lists. If None, the whole 
+                                          range is requested.
 
     Returns:
         pd.DataFrame: A DataFrame containing all fetched and processed transactions for the specified contracts.
@@ -144,61 +243,22 @@ def get_transactions(list_lx, min_block, max_block, internal_flag, etherscan_api
         string_snipped = "NORMAL"
     if internal_flag == "internal":
         string_snipped = "INTERNAL"
-    i=0
-    min_block_fix = min_block
-# Careful: max 1000 transactions per contract with es.get_transactions_by_address(), therefore API request
-    df_txs_lx=pd.DataFrame()
-    count_txs = 0
-    for contract_address_tmp in list_lx:
-        
-        # Retry loop for retrieving transactions from Etherscan
-        for attempt in range(10): 
-            try:
-                try: 
-                    response_API = send_api_request(contract_address_tmp, min_block, max_block, internal_flag, etherscan_api_key) 
-                except Exception as e:
-                    logger.error(f"Failed to connect to Etherscan to retrieve transactions: {e}")
-                
-                txs_json_lx = response_API.json()
-                
-                df_txs_lx, df_txs_lx_tmp = request_mediator(txs_json_lx, df_txs_lx, contract_address_tmp)
-
-                logger.info(f"{string_snipped} transactions for {i+1} / {len(list_lx)} contracts received. Total count of {string_snipped} transactions: {len(df_txs_lx)} {contract_address_tmp}")
-
-            # Etherscan returns <= 10 000 transactions at one request. If more are available, they have to be requested again. 
-                while len(df_txs_lx_tmp) == 10000:
-                    # Maximum number of transactions per block is ~400 txs (2023), i.e., <10,000 txs.
-                    # When number of received txs == 10,000 there is a high chance only a fraction of available txs of the last considered block was returned from Etherscan. 
-                    # Hence, the final block of the last iteration has to be the first block of the next iteration (to get all transactions within the block, NOT min_block_new = min_block_old+1)
-                    df_txs_lx_tmp['blocknumber'] = pd.to_numeric(df_txs_lx_tmp.blockNumber)
-                    min_block = df_txs_lx_tmp.blocknumber.max()
-                    
-                    try: 
-                        response_API = send_api_request(contract_address_tmp, min_block, max_block, internal_flag, etherscan_api_key) 
-                    except Exception as e:
-                        logger.error(f"Failed to connect to Etherscan to retrieve transactions: {e}")
-                    
-                    txs_json_lx = response_API.json()
-                    
-                    df_txs_lx, df_txs_lx_tmp = request_mediator(txs_json_lx, df_txs_lx, contract_address_tmp)
-
-                    logger.info(f"{string_snipped} transactions for {i+1} / {len(list_lx)} contracts received. Total count of {string_snipped} transactions: {len(df_txs_lx)} {contract_address_tmp}")
-                i = i+1
-                # for the next contract in the iteration, the min_block has to be reset to the original block range minimum
-                min_block = min_block_fix 
-            # retry if exception occurred, TODO: more specific exception
-            except:
-                logger.error(f"Transactions could not be received for {contract_address_tmp}. Unspecific error. Retrying ...")
-                time.sleep(DELAY)
-                continue
-            # break the retry loop
-            else:
-                break
-        # skip contract if all retries failed
-        else:
-            logger.error(f"Transaction could not be received for {contract_address_tmp}. Contract is skipped.")
-            time.sleep(DELAY)
-            continue
+    if client is None:
+        client = EtherscanClient(etherscan_api_key)
+    list_lx = list(list_lx)
+    progress = {"contracts": 0, "transactions": 0}
+    progress_lock = threading.Lock()
+
+    def fetch_contract(contract_address_tmp):
+        df_txs_contract = get_contract_transactions(contract_address_tmp, min_block, max_block, internal_flag, client, cache)
+        with progress_lock:
+            progress["contracts"] += 1
+            progress["transactions"] += len(df_txs_contract)
+            logger.info(f"{string_snipped} transactions for {progress['contracts']} / {len(list_lx)} contracts received. Total count of {string_snipped} transactions: {progress['transactions']} {contract_address_tmp}")
+        return df_txs_contract
+
+    # The results are concatenated in the order of the contracts, independent of the order in which they arrive
+    df_txs_lx = pd.concat([pd.DataFrame()] + client.map(fetch_contract, list_lx), axis=0)
         
     # There will be transaction duplicates, duplicates are not necessary, so they are removed
     df_txs_lx.drop_duplicates(subset='hash', keep="last", inplace=True)
@@ -212,82 +272,169 @@ def get_transactions(list_lx, min_block, max_block, internal_flag, etherscan_api
     return df_txs_lx
 
 
-def get_transactions_by_events(node_url, contracts, min_block, max_block):
+def get_transactions_by_events(node_url, contracts, min_block, max_block, max_workers=LOG_WORKERS, chunk_size=CHUNK_SIZE, address_batch_size=ADDRESS_BATCH_SIZE, block_cache=None):
     
     """
     Fetches transactions related to specified contracts by listening to their events within a given block range.
 
+    The contracts are queried in groups of `address_batch_size` addresses per eth_getLogs filter, and the logs are 
+    split back by contract. The block range of each group is queried with an adaptive range size (see 
+    `LogRangeScheduler`): ranges with too many events are bisected, ranges in sparse stretches grow, and several 
+    ranges are queried at once.
+
     Args:
         node_url (str): The URL of the Ethereum node to connect to via Web3.
         contracts (list): A list of contract addresses to listen for events.
         min_block (int): The starting block number for the query range.
         max_block (int): The ending block number for the query range.
+        max_workers (int): Number of eth_getLogs queries kept in flight.
+        chunk_size (int): Initial number of blocks per eth_getLogs query.
+        address_batch_size (int): Number of contract addresses per eth_getLogs filter.
+        block_cache (BlockHeaderCache, optional): Shared block header cache for the timestamps. If None, a cache is 
+                                                  kept for this call only.
 
     Returns:
         pd.DataFrame: A DataFrame containing transactions fetched based on contract events.
     """
     
-    # Chunking / batching was implemented with ChatGPT and then debugged
-
     logger.info("Starting to get transactions by events.")
-    # ts = datetime.datetime.fromtimestamp(time.time()).strftime('%d-%m-%Y %H:%M:%S')
-    # print(ts, "Start getting transactions by events.")
-    w3 = Web3(Web3.HTTPProvider(node_url))
-    log_data_list = []
+    w3 = transport.get_web3(node_url)
+    contracts = list(contracts)
+    address_batch_size = max(1, address_batch_size)
+    contract_groups = [contracts[i:i + address_batch_size] for i in range(0, len(contracts), address_batch_size)]
 
+    def fetch_logs(contract_group, from_block, to_block):
+        # Define the filter criteria
+        parameters = {
+            'address': [Web3.toChecksumAddress(contract_address) for contract_address in contract_group],
+            'fromBlock': from_block,
+            'toBlock': to_block,
+        }
+        try:
+            logs = event_fetcher(parameters, w3)
+        except Exception as e:
+            # A single block with too many events for the whole group: the group is split instead of the range
+            if from_block == to_block and len(contract_group) > 1 and is_range_error(e):
+                middle = len(contract_group) // 2
+                return fetch_logs(contract_group[:middle], from_block, to_block) + fetch_logs(contract_group[middle:], from_block, to_block)
+            raise
+        logger.debug(f"Number of events: {len(logs)} between {from_block} and {to_block} for {len(contract_group)} contract(s)")
+        return logs
+
+    def log_progress(i):
+        logger.info(f"EVENT-BASED: all block ranges queried for contract group {i+1} / {len(contract_groups)} ({len(contract_groups[i])} contracts) Block: {max_block} / {max_block}")
+
+    scheduler = LogRangeScheduler(fetch_logs, max_workers=max_workers, range_size=chunk_size)
+    group_logs = scheduler.run(contract_groups, min_block, max_block, progress_callback=log_progress)
+
+    # The logs of a group are split back by contract (in block order within each contract)
+    contract_logs = {contract_address.lower(): [] for contract_address in contracts}
+    for logs in group_logs:
+        for log in logs:
+            contract_logs[log['address'].lower()].append(log)
+    logger.info(f"EVENT-BASED: {len(contracts)} contracts queried in {len(contract_groups)} group(s)")
+
+    # to insert the time into the log data, the block headers are taken from the cache; missing headers are requested in batches
+    if block_cache is None:
+        block_cache = BlockHeaderCache()
+    block_timestamps = block_cache.get_timestamps([log['blockNumber'] for logs in group_logs for log in logs], node_url)
+    log_data_list = []
     for contract_address in contracts:
-        # Iterate in chunks
-        for chunk_start in range(min_block, max_block+1, CHUNK_SIZE):
-            chunk_end = min(chunk_start + CHUNK_SIZE - 1, max_block)
-
-            # Define the filter criteria
-            parameters = {
-                'address': Web3.toChecksumAddress(contract_address),
-                'fromBlock': chunk_start,
-                'toBlock': chunk_end,
-            }
-            
-            try: 
-                logs = event_fetcher(parameters, w3) 
-            except Exception as e:
-                logger.error(f"Failed to connect to the blockchain node to retrieve events: {e}")
-                
-            logger.debug(f"Number of events: {len(logs)} between {chunk_start} and {chunk_end} for the contract: {contract_address}")
+        for log in contract_logs[contract_address.lower()]:
+            blockNumber = log['blockNumber']
             
-           
-            i = 1
-            previous_blockNumber = None
-            for log in logs:
-                blockNumber = log['blockNumber']
-                
-                # to insert the time into the log data, a block object has to be created. To save time, a new block element is only created if the blockNumber changed
-                if blockNumber != previous_blockNumber:
-                    block = w3.eth.get_block(blockNumber)
-
-                previous_blockNumber = blockNumber
-                
-                log_data = {
-                    'blockNumber': blockNumber,
-                    "timeStamp": block["timestamp"],
-                    'hash': log['transactionHash'].hex(),
-                    'contractAddress': log['address']
-                }
-                
-                log_data_list.append(log_data)
-                
-            # logger.debug(f"Done with building the list.")
+            log_data = {
+                'blockNumber': blockNumber,
+                "timeStamp": block_timestamps[blockNumber],
+                'hash': log['transactionHash'].hex(),
+                'transactionIndex': log['transactionIndex'],
+                'contractAddress': log['address']
+            }
             
-        logger.info(f"EVENT-BASED transactions for contracts {list(contracts).index(contract_address)+1} / {len(contracts)} Total count of transactions: {len(log_data_list)} Block: {chunk_end} / {max_block} {contract_address}")
-            # ts = datetime.datetime.fromtimestamp(time.time()).strftime('%d-%m-%Y %H:%M:%S')
-            # print(ts, "EVENT-BASED transactions for contracts", list(contracts).index(contract_address)+1, "/", len(contracts), " Count of transactions:", len(log_data_list), "Block: ", chunk_end, "/", max_block, " ", contract_address)
+            log_data_list.append(log_data)
+        logger.info(f"EVENT-BASED transactions for contracts {contracts.index(contract_address)+1} / {len(contracts)} Total count of transactions: {len(log_data_list)} {contract_address}")
 
     df = pd.DataFrame(log_data_list)
     return df
 
+def get_transactions_by_trace_filter(node_url, contracts, min_block, max_block, max_workers=LOG_WORKERS, chunk_size=TRACE_FILTER_CHUNK_SIZE, address_batch_size=ADDRESS_BATCH_SIZE, block_cache=None):
+    """
+    Fetches all transactions that interact with the specified contracts (as sender or receiver of any call, including 
+    internal calls and creations) with the `trace_filter` method of the node (Erigon, OpenEthereum), as an alternative 
+    to the normal and internal transactions from Etherscan.
+
+    The contracts are queried in groups of `address_batch_size` addresses, once as `fromAddress` and once as 
+    `toAddress` filter, and the block range is queried with an adaptive range size (see `LogRangeScheduler`).
+
+    Args:
+        node_url (str): The URL of the Ethereum node.
+        contracts (list): A list of contract addresses.
+        min_block (int): The starting block number for the query range.
+        max_block (int): The ending block number for the query range.
+        max_workers (int): Number of trace_filter queries kept in flight.
+        chunk_size (int): Initial number of blocks per trace_filter query.
+        address_batch_size (int): Number of contract addresses per trace_filter query.
+        block_cache (BlockHeaderCache, optional): Shared block header cache for the timestamps.
+
+    Returns:
+        pd.DataFrame: A DataFrame with one row per transaction and contract (blockNumber, timeStamp, hash, 
+                      transactionIndex, contractAddress).
+    """
+    logger.info("Starting to get transactions by trace_filter.")
+    contracts = [contract_address.lower() for contract_address in contracts]
+    address_batch_size = max(1, address_batch_size)
+    contract_groups = [contracts[i:i + address_batch_size] for i in range(0, len(contracts), address_batch_size)]
+
+    def fetch_traces(contract_group, from_block, to_block):
+        traces = []
+        for direction in ["fromAddress", "toAddress"]:
+            traces += json_rpc_call(node_url, "trace_filter", [{"fromBlock": hex(from_block), "toBlock": hex(to_block), direction: contract_group}]) or []
+        logger.debug(f"Number of traces: {len(traces)} between {from_block} and {to_block} for {len(contract_group)} contract(s)")
+        return traces
+
+    def log_progress(i):
+        logger.info(f"TRACE_FILTER: all block ranges queried for contract group {i+1} / {len(contract_groups)} ({len(contract_groups[i])} contracts) Block: {max_block} / {max_block}")
+
+    scheduler = LogRangeScheduler(fetch_traces, max_workers=max_workers, range_size=chunk_size)
+    group_traces = scheduler.run(contract_groups, min_block, max_block, progress_callback=log_progress)
+
+    # The traces are split by contract; a transaction is listed once per contract it interacts with
+    contract_set = set(contracts)
+    contract_transactions = {contract_address: {} for contract_address in contracts}
+    for traces in group_traces:
+        for trace in traces:
+            # Block rewards have no transaction
+            if not trace.get("transactionHash"):
+                continue
+            action = trace.get("action", {})
+            result = trace.get("result") or {}
+            for address in {action.get("from"), action.get("to"), result.get("address")}:
+                if address and address.lower() in contract_set:
+                    contract_transactions[address.lower()].setdefault(trace["transactionHash"], (trace["blockNumber"], trace.get("transactionPosition")))
+
+    if block_cache is None:
+        block_cache = BlockHeaderCache()
+    block_timestamps = block_cache.get_timestamps([block_number for transactions in contract_transactions.values() for block_number, _ in transactions.values()], node_url)
+    log_data_list = []
+    for contract_address in contracts:
+        for tx_hash, (blockNumber, transactionIndex) in contract_transactions[contract_address].items():
+            log_data_list.append({
+                'blockNumber': blockNumber,
+                "timeStamp": block_timestamps.get(blockNumber),
+                'hash': tx_hash,
+                'transactionIndex': transactionIndex,
+                'contractAddress': contract_address
+            })
+    logger.info(f"TRACE_FILTER transactions for {len(contracts)} contracts. Total count of transactions: {len(log_data_list)}")
+    return pd.DataFrame(log_data_list)
+
 def event_fetcher(parameters, w3):
     """
     Fetches logs of events for a given set of parameters using Web3.
 
+    Connection errors are retried. Errors of the query itself (e.g., too many results) and timeouts are raised right 
+    away, so that the caller can query a smaller block range instead.
+
     Args:
         parameters (dict): A dictionary of parameters for the log query, including 'address', 'fromBlock', and 'toBlock'.
         w3 (Web3): An instance of a Web3 connection to an Ethereum node.
@@ -299,18 +446,21 @@ def event_fetcher(parameters, w3):
         Exception: If the log fetching fails after the specified number of retries.
     """    
     
-    # This loop implements retries for
+    # This loop implements retries for connection errors, with a jittered backoff of the shared request controller
     max_retries = 5
+    controller = request_controller.get_controller()
     for attempt in range(max_retries):
     
         try:
-            logs = w3.eth.get_logs(parameters)
+            logs = controller.call(w3.eth.get_logs, parameters)
             return logs
         
+        except requests.exceptions.Timeout:
+            raise
         except requests.exceptions.ConnectionError as e:
             logger.error(f"ConnectionError encountered: {e}. Retrying...")
         except requests.exceptions.HTTPError as e:
             logger.error(f"HTTPError encountered: {e}. Retrying...")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Other RequestException encountered: {e}. Retrying...")
-        time.sleep(DELAY)
\ No newline at end of file
+        if attempt + 1 < max_retries:
+            controller.backoff(attempt)
+    raise Exception(f"Log request failed after {max_retries} attempts: {parameters}")
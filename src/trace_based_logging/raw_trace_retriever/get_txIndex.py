@@ -1,63 +1,84 @@
-from web3 import Web3
-import time
 from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging.raw_trace_retriever.trace_retriever_utils import json_rpc_batch
 
+"""
+This module provides the transaction index (the position of a transaction in its block) for the extracted 
+transactions without one RPC call per transaction. The transaction hashes of a block are requested once with 
+eth_getBlockByNumber (in JSON-RPC batches of several blocks), and the index of every relevant transaction is its 
+position in the block. Only transactions without a known block number are requested one by one, as a batch of 
+eth_getTransactionByHash calls.
 
-logger = setup_logging()
-
+Functions:
+    to_block_number(block_number): Converts a block number from Etherscan, Web3, or JSON-RPC to an int.
+    get_txIndex(hash_list, node_url, block_numbers=None, batch_size=BLOCK_BATCH_SIZE, block_cache=None): Returns the transaction index 
+        of each hash.
 
-def get_txIndex(hash_list, node_url):
-    #path = os.path.join(dir_path, "resources", 'df_trace_tree_' + base_contract + "_" + str(min_block) + "_" + str(max_block) + '.csv')
-    #hashes = pd.read_csv(path, usecols=["hash"])
+Constants:
+    BLOCK_BATCH_SIZE (int): Number of blocks (or transactions) requested per JSON-RPC batch.
+"""
 
-    # hashes.reset_index(inplace=True, drop=True)
-    # hash_list = hashes["hash"].unique()
+logger = setup_logging()
 
-#    dir_path = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..'))
+BLOCK_BATCH_SIZE = 100
 
-#    path = os.path.join(dir_path, "config.json")
 
-#    with open(path, 'r') as file:
-#        config = json.load(file)
-#    port = config["port"]
-#    protocol = config["protocol"]
-#    host = config["host"]
-#    node_url = protocol + host + ":" + str(port)
-    w3 = Web3(Web3.HTTPProvider(node_url))
+def to_block_number(block_number):
+    if isinstance(block_number, str) and block_number.startswith("0x"):
+        return int(block_number, 16)
+    return int(block_number)
 
 
-    # Check connection
-    if not w3.isConnected():
-        logger.info("Query transaction index: Failed to connect to Ethereum node")
-        exit()
+def get_txIndex(hash_list, node_url, block_numbers=None, batch_size=BLOCK_BATCH_SIZE, block_cache=None):
+    """
+    Retrieves the transaction index of each transaction hash.
 
+    Args:
+        hash_list (iterable): The transaction hashes.
+        node_url (str): The URL of the Ethereum node.
+        block_numbers (dict, optional): Maps transaction hashes to their block numbers. Hashes with a block number are 
+                                        resolved per block; all other hashes per transaction.
+        batch_size (int): Number of blocks (or transactions) requested per JSON-RPC batch.
+        block_cache (BlockHeaderCache, optional): Cache the headers of the requested blocks are added to.
 
-    # Dictionary to store transaction indexes
+    Returns:
+        dict: Maps the transaction hashes (as given in `hash_list`) to their transaction index (int). Hashes whose index 
+              could not be retrieved are missing.
+    """
+    block_numbers = block_numbers or {}
     transaction_indexes = {}
+    hashes_by_block = {}
+    hashes_without_block = []
+    for tx_hash in hash_list:
+        try:
+            hashes_by_block.setdefault(to_block_number(block_numbers[tx_hash]), []).append(tx_hash)
+        except (KeyError, TypeError, ValueError):
+            hashes_without_block.append(tx_hash)
+
+    blocks = sorted(hashes_by_block)
+    for i in range(0, len(blocks), batch_size):
+        batch_blocks = blocks[i:i + batch_size]
+        results = json_rpc_batch(node_url, [("eth_getBlockByNumber", [hex(block_number), False]) for block_number in batch_blocks])
+        if block_cache is not None:
+            block_cache.put_blocks(results)
+        for block_number, block in zip(batch_blocks, results):
+            positions = {str(block_hash).lower(): position for position, block_hash in enumerate(block["transactions"])} if block else {}
+            for tx_hash in hashes_by_block[block_number]:
+                if str(tx_hash).lower() in positions:
+                    transaction_indexes[tx_hash] = positions[str(tx_hash).lower()]
+                else:
+                    # e.g., a wrong block number; the transaction is requested by its hash instead
+                    hashes_without_block.append(tx_hash)
+        logger.info(f"Query transaction index: Processed {min(i + batch_size, len(blocks))} out of {len(blocks)} blocks")
+
+    for i in range(0, len(hashes_without_block), batch_size):
+        batch_hashes = hashes_without_block[i:i + batch_size]
+        results = json_rpc_batch(node_url, [("eth_getTransactionByHash", [str(tx_hash)]) for tx_hash in batch_hashes])
+        for tx_hash, transaction in zip(batch_hashes, results):
+            if transaction and transaction.get("transactionIndex") is not None:
+                transaction_indexes[tx_hash] = int(transaction["transactionIndex"], 16)
+            else:
+                logger.info(f"Query transaction index: Failed to retrieve transaction {tx_hash}.")
+    if hashes_without_block:
+        logger.info(f"Query transaction index: {len(hashes_without_block)} transactions requested by hash")
 
-    # Maximum number of retries for a failed transaction query
-    max_retries = 15
-    # Delay between retries in seconds
-    retry_delay = 2
-
-    for index, tx_hash in enumerate(hash_list, start=1):
-        retries = 0
-        while retries < max_retries:
-            try:
-                # Retrieve the transaction by hash
-                transaction = w3.eth.get_transaction(tx_hash)
-                # Store the transaction index in the dictionary
-                transaction_indexes[tx_hash] = transaction['transactionIndex']
-                logger.info(f"Query transaction index: Processed transaction {index} out of {len(hash_list)}: {tx_hash}")
-                break  # Exit the retry loop on success
-            except Exception as e:
-                logger.info(f"Query transaction index: Error retrieving transaction {tx_hash}: {e}. Retrying... {retries + 1}/{max_retries}")
-                retries += 1
-                time.sleep(retry_delay)
-        
-        if retries == max_retries:
-            logger.info(f"Query transaction index: Failed to retrieve transaction {tx_hash} after {max_retries} retries.")
-
-    #path = os.path.join(dir_path, "resources", 'transaction_indexes_' + base_contract + "_" + str(min_block) + "_" + str(max_block) + '.pkl')
-    #pickle.dump(transaction_indexes, open(path, "wb"))
-    return transaction_indexes
\ No newline at end of file
+    return transaction_indexes
@@ -0,0 +1,189 @@
+import time
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging.request_controller import backoff_delay
+
+"""
+This module provides an adaptive scheduler for block-range queries such as eth_getLogs. Nodes limit the number of 
+results (or the time) of a single eth_getLogs query, so a fixed block range per query fails in busy stretches and 
+wastes calls in quiet ones. The scheduler adapts the range per target (e.g., a contract address):
+
+    - A range whose query fails because of too many results or a timeout is bisected, and the two halves are 
+      queried instead. The range size of the target is halved as well.
+    - After a query that returned few results, the range size of the target is doubled.
+    - Several ranges (of the same or of different targets) are queried at once.
+
+Each range is queried exactly once with success, so no results of a previous range are ever reused for a failed one.
+A range that still fails after MAX_ATTEMPTS attempts is not skipped: once all other ranges are done, the scheduler
+raises an IncompleteRangesError, so that no results are silently missing.
+
+Classes:
+    IncompleteRangesError: Raised if block ranges could not be queried.
+    LogRangeScheduler: Adaptive, concurrent block-range scheduler.
+
+Functions:
+    is_range_error(error): Checks if an error means that the range of a query was too large.
+
+Constants:
+    MIN_RANGE_SIZE (int): Smallest range size; a failing range of this size is not bisected further.
+    MAX_RANGE_SIZE (int): Largest range size the scheduler grows to.
+    SPARSE_RESULTS (int): Number of results below which a range counts as sparse and the range size grows.
+    MAX_ATTEMPTS (int): Attempts per range for errors that are not range errors (e.g., a lost connection).
+    RETRY_DELAY (float): Base delay in seconds of the jittered exponential backoff before a failed range is queried again.
+    RANGE_ERROR_MESSAGES (tuple): Phrases of node error messages that mean the range was too large.
+    RATE_LIMIT_MESSAGES (tuple): Phrases of node error messages that mean the request was rate-limited, not too large.
+"""
+
+logger = setup_logging()
+
+MIN_RANGE_SIZE = 1
+MAX_RANGE_SIZE = 1000000
+SPARSE_RESULTS = 1000
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 5
+RANGE_ERROR_MESSAGES = ("query returned more than", "too many results", "block range", "range too large", "range is too large",
+                        "limit exceeded", "response size exceeded", "is limited to", "timeout", "timed out")
+RATE_LIMIT_MESSAGES = ("rate limit", "too many requests")
+
+
+class IncompleteRangesError(Exception):
+    """
+    Raised by `LogRangeScheduler.run` if block ranges failed in all attempts.
+
+    Attributes:
+        failed_ranges (list of tuple): The failed ranges as (target, first block, last block).
+    """
+
+    def __init__(self, failed_ranges):
+        super().__init__(f"{len(failed_ranges)} block range(s) could not be queried, e.g., {failed_ranges[0]}")
+        self.failed_ranges = failed_ranges
+
+
+def is_range_error(error):
+    """
+    Checks if an error of a block-range query means that the range was too large: the node reports too many results 
+    (e.g., Geth/Erigon "query returned more than 10000 results", "Log response size exceeded"), or the query timed out.
+    Other errors, e.g., a rate limit or an invalid parameter, are not range errors.
+    """
+    if isinstance(error, requests.exceptions.Timeout):
+        return True
+    if isinstance(error, ValueError):
+        message = str(error.args[0].get("message", "")) if error.args and isinstance(error.args[0], dict) else str(error)
+        message = message.lower()
+        if any(phrase in message for phrase in RATE_LIMIT_MESSAGES):
+            return False
+        return any(phrase in message for phrase in RANGE_ERROR_MESSAGES)
+    return False
+
+
+class LogRangeScheduler:
+    """
+    Queries block ranges of several targets concurrently, with an adaptive range size per target.
+
+    Args:
+        fetch (callable): Takes a target, the first and the last block of a range (inclusive) and returns a list of results.
+        max_workers (int): Number of ranges queried at once.
+        range_size (int): Initial range size of every target.
+        min_range_size (int): Smallest range size.
+        max_range_size (int): Largest range size.
+        sparse_results (int): Number of results below which the range size of a target grows.
+    """
+
+    def __init__(self, fetch, max_workers=1, range_size=10000, min_range_size=MIN_RANGE_SIZE, max_range_size=MAX_RANGE_SIZE, sparse_results=SPARSE_RESULTS):
+        self.fetch = fetch
+        self.max_workers = max(1, max_workers)
+        self.range_size = range_size
+        self.min_range_size = min_range_size
+        self.max_range_size = max(max_range_size, range_size)
+        self.sparse_results = sparse_results
+
+    def fetch_range(self, task):
+        target, from_block, to_block, attempt = task
+        if attempt > 0:
+            time.sleep(backoff_delay(attempt - 1, base=RETRY_DELAY))
+        return self.fetch(target, from_block, to_block)
+
+    def run(self, targets, min_block, max_block, progress_callback=None):
+        """
+        Queries the block range from `min_block` to `max_block` (inclusive) for every target.
+
+        Args:
+            targets (list): The targets, e.g., contract addresses.
+            min_block (int): First block.
+            max_block (int): Last block.
+            progress_callback (callable, optional): Called with the index of a target once all its ranges are done.
+
+        Returns:
+            list: For every target (in the order of `targets`), the results of its ranges, in block order.
+
+        Raises:
+            IncompleteRangesError: If ranges failed in all attempts; the other ranges are queried before.
+        """
+        targets = list(targets)
+        # per target: next block that is not scheduled yet and current range size
+        cursors = [{"next": min_block, "size": self.range_size} for _ in targets]
+        open_ranges = [0] * len(targets)
+        retries = deque()
+        results = [[] for _ in targets]
+        failed_ranges = []
+
+        def next_task():
+            if retries:
+                return retries.popleft()
+            # the target with the smallest scheduled block goes first, so that all targets progress evenly
+            candidates = [i for i, cursor in enumerate(cursors) if cursor["next"] <= max_block]
+            if not candidates:
+                return None
+            i = min(candidates, key=lambda j: (cursors[j]["next"], j))
+            from_block = cursors[i]["next"]
+            to_block = min(from_block + cursors[i]["size"] - 1, max_block)
+            cursors[i]["next"] = to_block + 1
+            return (i, from_block, to_block, 0)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+
+            def fill():
+                while len(futures) < self.max_workers:
+                    task = next_task()
+                    if task is None:
+                        return
+                    open_ranges[task[0]] += 1
+                    futures[executor.submit(self.fetch_range, (targets[task[0]],) + task[1:])] = task
+
+            fill()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, from_block, to_block, attempt = futures.pop(future)
+                    open_ranges[i] -= 1
+                    size = to_block - from_block + 1
+                    try:
+                        range_results = future.result()
+                    except Exception as e:
+                        if is_range_error(e) and size > self.min_range_size:
+                            # bisect the range and continue with smaller ranges for this target
+                            middle = from_block + size // 2
+                            retries.extendleft([(i, middle, to_block, 0), (i, from_block, middle - 1, 0)])
+                            cursors[i]["size"] = max(self.min_range_size, min(cursors[i]["size"], size) // 2)
+                            logger.debug(f"Range {from_block}-{to_block} of {targets[i]} is too large ({e}). Bisecting.")
+                        elif attempt + 1 < MAX_ATTEMPTS:
+                            logger.error(f"Range {from_block}-{to_block} of {targets[i]} failed: {e}. Retrying... {attempt + 1}/{MAX_ATTEMPTS}")
+                            retries.append((i, from_block, to_block, attempt + 1))
+                        else:
+                            logger.error(f"Range {from_block}-{to_block} of {targets[i]} failed after {MAX_ATTEMPTS} attempts: {e}.")
+                            failed_ranges.append((targets[i], from_block, to_block))
+                    else:
+                        results[i].append((from_block, range_results))
+                        if len(range_results) < self.sparse_results and size >= cursors[i]["size"]:
+                            cursors[i]["size"] = min(self.max_range_size, cursors[i]["size"] * 2)
+                    pending_retry = any(task[0] == i for task in retries)
+                    if progress_callback and open_ranges[i] == 0 and not pending_retry and cursors[i]["next"] > max_block:
+                        progress_callback(i)
+                fill()
+
+        if failed_ranges:
+            raise IncompleteRangesError(failed_ranges)
+        return [[result for _, range_results in sorted(target_results, key=lambda r: r[0]) for result in range_results] for target_results in results]
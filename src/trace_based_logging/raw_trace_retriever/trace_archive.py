@@ -0,0 +1,299 @@
+import os
+import json
+import zlib
+import sqlite3
+import numbers
+import threading
+from collections import OrderedDict
+from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging.raw_trace_retriever.trace_buffer import TraceBuffer
+from src.trace_based_logging.raw_trace_retriever.trace_stream import StreamedTrace, iter_decompressed
+from src.trace_based_logging.raw_trace_retriever.trace_transformation import flatten_trace, TRACE_TX_COLUMNS
+
+"""
+This module provides an archive of the raw callTracer responses of the extraction, so that flattening and decoding
+can be re-run from disk without replaying the transactions on the node.
+
+The traces are stored as gzip-compressed JSON lines, one record per transaction with its hash, block number,
+timestamp, and debug_traceTransaction response. The records are partitioned by block into segment files
+(SEGMENT_BLOCKS blocks per file). Each append adds one gzip member per segment at the end of the file, so the
+segments are append-only and can be read with any gzip reader. An SQLite index next to the segments maps each
+transaction hash to its member (offset and length) and line, and records which transactions each extraction run
+traced at which level, in the order they were traced. A run can then be replayed level by level.
+
+Records that were written but not indexed, e.g., after a crash, are cut off when the archive is opened again.
+
+Classes:
+    TraceArchive: Append-only, block-partitioned archive of raw traces with an offset index.
+
+Functions:
+    replay_traces(archive, tx_hashes): Flattens the archived traces of transactions into a DataFrame, as `tx_to_trace`.
+
+Constants:
+    SEGMENT_BLOCKS (int): Number of blocks per segment file.
+    MEMBER_CACHE_SIZE (int): Number of decompressed gzip members kept in memory while reading.
+"""
+
+logger = setup_logging()
+
+SEGMENT_BLOCKS = 100000
+MEMBER_CACHE_SIZE = 8
+
+
+class TraceArchive:
+    """
+    Append-only archive of raw debug_traceTransaction responses in block-partitioned, gzip-compressed JSON lines
+    segments with an SQLite offset index. The archive can be shared by several threads.
+
+    Args:
+        folder (str): Folder of the segments and the index. It is created if it does not exist.
+        segment_blocks (int): Number of blocks per segment file for new records.
+    """
+
+    def __init__(self, folder, segment_blocks=SEGMENT_BLOCKS):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.folder = folder
+        self.segment_blocks = segment_blocks
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(folder, "index.sqlite"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS traces (tx_hash TEXT PRIMARY KEY, block_number INTEGER NOT NULL, segment TEXT NOT NULL, "
+            "member_offset INTEGER NOT NULL, member_length INTEGER NOT NULL, line INTEGER NOT NULL, transaction_index INTEGER)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS traces_block ON traces (block_number)")
+        # seq is the rowid, so the transactions of a run are read back in the order they were traced
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS run_transactions (seq INTEGER PRIMARY KEY, run TEXT NOT NULL, level INTEGER NOT NULL, tx_hash TEXT NOT NULL, "
+            "UNIQUE (run, tx_hash))"
+        )
+        self.connection.commit()
+        self.members = OrderedDict()
+        self.truncate_unindexed()
+
+    def truncate_unindexed(self):
+        # Cuts off members at the end of the segments that were written but not indexed
+        ends = dict(self.connection.execute("SELECT segment, MAX(member_offset + member_length) FROM traces GROUP BY segment").fetchall())
+        for name in os.listdir(self.folder):
+            if not name.endswith(".jsonl.gz"):
+                continue
+            path = os.path.join(self.folder, name)
+            end = ends.get(name, 0)
+            if os.path.getsize(path) > end:
+                logger.warning(f"Trace archive: cutting off {os.path.getsize(path) - end} bytes of unindexed records in {name}")
+                with open(path, "r+b") as file:
+                    file.truncate(end)
+
+    def segment_name(self, block_number):
+        first_block = block_number // self.segment_blocks * self.segment_blocks
+        return f"segment_{first_block:010d}.jsonl.gz"
+
+    def append(self, records, run=None, level=None):
+        """
+        Appends trace records and indexes them. Transactions that are already archived are not written again.
+
+        Args:
+            records (iterable of tuple): (tx_hash, timestamp, block_number, response_json) per transaction. A response
+                                         may hold a `StreamedTrace` with its compressed JSON as result.
+            run (str, optional): Name of the extraction run that traced the transactions.
+            level (int, optional): Level of the run at which the transactions were traced.
+        """
+        records = list(records)
+        keys = [str(record[0]).lower() for record in records]
+        with self.lock:
+            archived = self.archived(keys)
+            by_segment = OrderedDict()
+            for key, record in zip(keys, records):
+                result = record[3].get("result")
+                if isinstance(result, StreamedTrace) and result.compressed is None:
+                    logger.warning(f"Trace archive: the streamed trace of {record[0]} did not keep its JSON and is not archived")
+                elif key not in archived:
+                    archived.add(key)
+                    by_segment.setdefault(self.segment_name(int(record[2])), []).append((key, record))
+            # The segments are written before the index, so that the index never points to missing records
+            rows = []
+            for segment, segment_records in by_segment.items():
+                rows.extend(self.write_member(segment, segment_records))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO traces (tx_hash, block_number, segment, member_offset, member_length, line) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            if run is not None:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO run_transactions (run, level, tx_hash) VALUES (?, ?, ?)", [(run, level, key) for key in keys]
+                )
+            self.connection.commit()
+
+    def archived(self, tx_hashes):
+        # Must be called while holding the lock
+        found = set()
+        for i in range(0, len(tx_hashes), 500):
+            batch = tx_hashes[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(row[0] for row in self.connection.execute(f"SELECT tx_hash FROM traces WHERE tx_hash IN ({placeholders})", batch))
+        return found
+
+    def write_member(self, segment, records):
+        # Writes the records as one gzip member at the end of the segment and returns their index rows
+        path = os.path.join(self.folder, segment)
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        with open(path, "ab") as file:
+            offset = file.tell()
+            for key, (tx_hash, timestamp, block_number, response_json) in records:
+                # The transaction values are kept as they are, so that a replay yields the same rows
+                header = json.dumps({"hash": tx_hash, "blockNumber": plain_value(block_number), "timeStamp": plain_value(timestamp)})
+                file.write(compressor.compress(f'{header[:-1]}, "trace": '.encode("utf-8")))
+                result = response_json.get("result")
+                if isinstance(result, StreamedTrace):
+                    # The response was never in memory as a whole; its compressed JSON is copied over chunk by chunk
+                    for chunk in iter_decompressed(result.compressed):
+                        file.write(compressor.compress(chunk))
+                else:
+                    file.write(compressor.compress(json.dumps(response_json, separators=(",", ":")).encode("utf-8")))
+                file.write(compressor.compress(b"}\n"))
+            file.write(compressor.flush())
+            length = file.tell() - offset
+        return [(key, int(record[2]), segment, offset, length, line) for line, (key, record) in enumerate(records)]
+
+    def read_member(self, segment, offset, length):
+        key = (segment, offset)
+        lines = self.members.get(key)
+        if lines is None:
+            with open(os.path.join(self.folder, segment), "rb") as file:
+                file.seek(offset)
+                lines = zlib.decompress(file.read(length), wbits=16 + zlib.MAX_WBITS).splitlines()
+            self.members[key] = lines
+            if len(self.members) > MEMBER_CACHE_SIZE:
+                self.members.popitem(last=False)
+        return lines
+
+    def get(self, tx_hash):
+        """
+        Reads the archived record of a transaction.
+
+        Args:
+            tx_hash (str): The transaction hash.
+
+        Returns:
+            dict: The record with the keys 'hash', 'blockNumber', 'timeStamp', and 'trace' (the debug_traceTransaction
+                  response), or None if the transaction is not archived.
+        """
+        return next(self.iter_records([tx_hash]), None)
+
+    def iter_records(self, tx_hashes):
+        """
+        Reads the archived records of several transactions, in the order of `tx_hashes`. Transactions that are not
+        archived are skipped. Consecutive records of the same gzip member are decompressed once.
+
+        Args:
+            tx_hashes (iterable of str): The transaction hashes.
+
+        Yields:
+            dict: The record of each archived transaction, see `get`.
+        """
+        for tx_hash in tx_hashes:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT segment, member_offset, member_length, line FROM traces WHERE tx_hash = ?", (str(tx_hash).lower(),)
+                ).fetchone()
+                if row is None:
+                    continue
+                line = self.read_member(row[0], row[1], row[2])[row[3]]
+            yield json.loads(line)
+
+    def run_levels(self, run):
+        """
+        Returns the transactions an extraction run traced, level by level.
+
+        Args:
+            run (str): Name of the extraction run.
+
+        Returns:
+            list of tuple: (level, list of transaction hashes in the order they were traced), by level.
+        """
+        levels = OrderedDict()
+        with self.lock:
+            for level, tx_hash in self.connection.execute("SELECT level, tx_hash FROM run_transactions WHERE run = ? ORDER BY level, seq", (run,)):
+                levels.setdefault(level, []).append(tx_hash)
+        return list(levels.items())
+
+    def clear_run(self, run):
+        """
+        Forgets which transactions a run traced, e.g., before the run is extracted again. The traces are kept.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM run_transactions WHERE run = ?", (run,))
+            self.connection.commit()
+
+    def record_transaction_indexes(self, transaction_indexes):
+        """
+        Records the positions of archived transactions in their blocks, so that a replay does not query them.
+
+        Args:
+            transaction_indexes (dict): Maps transaction hashes to their transaction index.
+        """
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE traces SET transaction_index = ? WHERE tx_hash = ?",
+                [(int(tx_index), str(tx_hash).lower()) for tx_hash, tx_index in transaction_indexes.items() if isinstance(tx_index, numbers.Integral)]
+            )
+            self.connection.commit()
+
+    def transaction_indexes(self, tx_hashes):
+        """
+        Returns the recorded transaction indexes of archived transactions.
+
+        Args:
+            tx_hashes (iterable of str): The transaction hashes.
+
+        Returns:
+            dict: Maps the transaction hashes (as given) to their transaction index; transactions without one are left out.
+        """
+        tx_hashes = list(tx_hashes)
+        indexes = {}
+        with self.lock:
+            for i in range(0, len(tx_hashes), 500):
+                batch = tx_hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                indexes.update(self.connection.execute(
+                    f"SELECT tx_hash, transaction_index FROM traces WHERE tx_hash IN ({placeholders}) AND transaction_index IS NOT NULL",
+                    [str(tx_hash).lower() for tx_hash in batch]
+                ))
+        return {tx_hash: indexes[str(tx_hash).lower()] for tx_hash in tx_hashes if str(tx_hash).lower() in indexes}
+
+    def stats(self):
+        """
+        Returns the number of archived traces and the size of the segments in MB.
+        """
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM traces").fetchone()[0]
+        size = sum(os.path.getsize(os.path.join(self.folder, name)) for name in os.listdir(self.folder) if name.endswith(".jsonl.gz"))
+        return {"entries": entries, "size_mb": round(size / 1024 / 1024, 2)}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def plain_value(value):
+    # numpy scalars from a DataFrame are written as the Python values they hold
+    return value.item() if hasattr(value, "item") else value
+
+
+def replay_traces(archive, tx_hashes):
+    """
+    Flattens the archived traces of transactions into one DataFrame, with the same rows and columns as `tx_to_trace`.
+
+    Args:
+        archive (TraceArchive): The archive.
+        tx_hashes (list of str): The transaction hashes, in the order of the rows.
+
+    Returns:
+        pd.DataFrame: The flattened traces; transactions that are not archived are left out.
+    """
+    trace_buffer = TraceBuffer()
+    for record in archive.iter_records(tx_hashes):
+        trace_buffer.extend(flatten_trace(record["trace"], record["hash"], "Place holder", record["timeStamp"], record["blockNumber"]))
+    df_trace = trace_buffer.to_frame(last_columns=TRACE_TX_COLUMNS)
+    df_trace.reset_index(inplace=True, drop=True)
+    return df_trace
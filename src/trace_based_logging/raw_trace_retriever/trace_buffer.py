@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+"""
+This module provides an append-only, columnar buffer for flattened trace rows. Rows are collected in one Python list 
+per column and materialized as one DataFrame at the end, so that the cost of collecting trace data grows linearly 
+with the number of rows (instead of repeatedly concatenating DataFrames).
+
+Classes:
+    TraceBuffer: Collects row records (dictionaries) column by column and builds a DataFrame from them.
+"""
+
+
+class TraceBuffer:
+    """
+    Append-only columnar buffer for row records with varying keys.
+
+    Rows do not need to have the same keys: a column that appears for the first time is padded with NaN for all 
+    earlier rows, and columns missing in a row are padded with NaN when the DataFrame is built. The column order 
+    is the order in which the columns first appear.
+
+    Example:
+        >>> buffer = TraceBuffer()
+        >>> buffer.extend([{"type": "CALL", "tracePos": 1}, {"address": "0x01", "tracePos": 2}])
+        >>> buffer.to_frame()
+           type  tracePos address
+        0  CALL         1     NaN
+        1   NaN         2    0x01
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, row):
+        """
+        Appends one row record.
+
+        Args:
+            row (dict): The row, mapping column names to values.
+        """
+        for key, value in row.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = []
+            if len(column) < self.length:
+                column.extend([np.nan] * (self.length - len(column)))
+            column.append(value)
+        self.length += 1
+
+    def extend(self, rows):
+        """
+        Appends several row records.
+
+        Args:
+            rows (iterable of dict): The rows to append.
+        """
+        for row in rows:
+            self.append(row)
+
+    def to_frame(self, last_columns=None):
+        """
+        Materializes the buffered rows as one DataFrame.
+
+        Args:
+            last_columns (list of str, optional): Columns to move to the end of the DataFrame, in the given order.
+
+        Returns:
+            pd.DataFrame: A DataFrame with one row per appended record.
+        """
+        for column in self.columns.values():
+            if len(column) < self.length:
+                column.extend([np.nan] * (self.length - len(column)))
+        df = pd.DataFrame(self.columns)
+        if last_columns and not df.empty:
+            last_columns = [col for col in last_columns if col in df.columns]
+            df = df[[col for col in df.columns if col not in last_columns] + last_columns]
+        return df
+
+    def clear(self):
+        """
+        Removes all buffered rows to free memory.
+        """
+        self.columns = {}
+        self.length = 0
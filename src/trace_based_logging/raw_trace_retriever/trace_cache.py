@@ -0,0 +1,190 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from src.trace_based_logging.logging_config import setup_logging
+
+"""
+This module provides a persistent, local store for transaction traces. The trace of a mined transaction never changes, 
+so a trace retrieved once can be reused across runs, block ranges, and DApps instead of replaying the transaction 
+on the node again.
+
+The traces are stored in an SQLite database, keyed by the (lowercase) transaction hash, as zlib-compressed JSON. 
+The store is bounded in size: once the compressed traces exceed the configured maximum, the least recently used 
+traces are evicted.
+
+Classes:
+    TraceCache: Persistent, size-bounded trace store with hit/miss statistics.
+
+Constants:
+    EVICTION_TARGET (float): Share of the maximum size the store is reduced to when it is evicted.
+"""
+
+logger = setup_logging()
+
+EVICTION_TARGET = 0.9
+
+
+class TraceCache:
+    """
+    Persistent, size-bounded store for debug_traceTransaction responses, keyed by transaction hash.
+
+    The store can be shared by several threads. Each lookup updates the last access time of a trace, which 
+    determines the eviction order (least recently used first).
+
+    Args:
+        path (str): Path of the SQLite database file. Missing folders are created.
+        max_size_mb (float, optional): Maximum size of the compressed traces in megabytes. If None, nothing is evicted.
+    """
+
+    def __init__(self, path, max_size_mb=None):
+        folder = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS traces (tx_hash TEXT PRIMARY KEY, trace BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS traces_last_access ON traces (last_access)")
+        self.connection.commit()
+        self.size_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM traces").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def get(self, tx_hash):
+        """
+        Looks up the trace of a transaction.
+
+        Args:
+            tx_hash (str): The transaction hash.
+
+        Returns:
+            dict: The stored debug_traceTransaction response, or None if the trace is not in the store.
+        """
+        blob = self.get_compressed(tx_hash)
+        return None if blob is None else json.loads(zlib.decompress(blob))
+
+    def get_compressed(self, tx_hash):
+        """
+        Looks up the trace of a transaction without decompressing it, e.g., to parse a large trace while streaming.
+
+        Args:
+            tx_hash (str): The transaction hash.
+
+        Returns:
+            bytes: The zlib-compressed JSON of the debug_traceTransaction response, or None if the trace is not in the store.
+        """
+        tx_hash = tx_hash.lower()
+        with self.lock:
+            row = self.connection.execute("SELECT trace FROM traces WHERE tx_hash = ?", (tx_hash,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE traces SET last_access = ? WHERE tx_hash = ?", (time.time(), tx_hash))
+            self.connection.commit()
+        return row[0]
+
+    def contains_many(self, tx_hashes):
+        """
+        Checks which of several transactions have a stored trace, without counting hits or misses.
+
+        Args:
+            tx_hashes (iterable of str): The transaction hashes.
+
+        Returns:
+            set of str: The (lowercase) hashes with a stored trace.
+        """
+        tx_hashes = [tx_hash.lower() for tx_hash in tx_hashes]
+        found = set()
+        with self.lock:
+            # SQLite limits the number of parameters per statement
+            for i in range(0, len(tx_hashes), 500):
+                batch = tx_hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(f"SELECT tx_hash FROM traces WHERE tx_hash IN ({placeholders})", batch).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def put(self, tx_hash, response_json):
+        """
+        Stores the trace of a transaction and evicts the least recently used traces if the store is too large.
+
+        Args:
+            tx_hash (str): The transaction hash.
+            response_json (dict): The debug_traceTransaction response.
+        """
+        self.put_compressed(tx_hash, zlib.compress(json.dumps(response_json, separators=(",", ":")).encode("utf-8")))
+
+    def put_compressed(self, tx_hash, blob):
+        """
+        Stores the trace of a transaction that is already compressed, see `put`.
+
+        Args:
+            tx_hash (str): The transaction hash.
+            blob (bytes): The zlib-compressed JSON of the debug_traceTransaction response.
+        """
+        tx_hash = tx_hash.lower()
+        with self.lock:
+            row = self.connection.execute("SELECT size FROM traces WHERE tx_hash = ?", (tx_hash,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO traces (tx_hash, trace, size, last_access) VALUES (?, ?, ?, ?)",
+                (tx_hash, blob, len(blob), time.time())
+            )
+            self.size_bytes += len(blob) - (row[0] if row else 0)
+            self.writes += 1
+            if self.max_size_bytes is not None and self.size_bytes > self.max_size_bytes:
+                self._evict(int(self.max_size_bytes * EVICTION_TARGET))
+            self.connection.commit()
+
+    def _evict(self, target_bytes):
+        # Must be called while holding the lock
+        evicted = 0
+        while self.size_bytes > target_bytes:
+            rows = self.connection.execute("SELECT tx_hash, size FROM traces ORDER BY last_access LIMIT 1000").fetchall()
+            if not rows:
+                break
+            for tx_hash, size in rows:
+                if self.size_bytes <= target_bytes:
+                    break
+                self.connection.execute("DELETE FROM traces WHERE tx_hash = ?", (tx_hash,))
+                self.size_bytes -= size
+                evicted += 1
+        self.evictions += evicted
+        logger.info(f"Trace cache: evicted {evicted} traces, size is now {self.size_bytes / 1024 / 1024:.1f} MB.")
+
+    def stats(self):
+        """
+        Returns the statistics of the store.
+
+        Returns:
+            dict: Number of stored traces, size in MB, and the hits, misses, writes, and evictions since the store was opened.
+        """
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM traces").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_mb": round(self.size_bytes / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "writes": self.writes,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        with self.lock:
+            self.connection.close()
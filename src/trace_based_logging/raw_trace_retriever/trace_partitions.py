@@ -0,0 +1,173 @@
+import os
+import glob
+import pandas as pd
+from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging.raw_trace_retriever.create_relations import select_creations
+from src.trace_based_logging.raw_trace_retriever.trace_transformation import TRACE_TX_COLUMNS
+
+"""
+This module provides an on-disk store for flattened trace rows. During extraction, the rows of each chunk of 
+transactions are written to a partition file of their own (one per level and chunk) instead of being kept in memory. 
+Only a lightweight index of the CREATE rows, which is all that is needed to follow CREATE-relations, and the 
+transaction hashes stay in memory.
+
+Classes:
+    TracePartitionStore: Writes, indexes, and reads trace partitions in a folder.
+
+Constants:
+    CREATION_INDEX_COLUMNS (list): Columns of the CREATE rows kept in memory.
+"""
+
+logger = setup_logging()
+
+CREATION_INDEX_COLUMNS = ["type", "from", "to", "hash"]
+
+
+class TracePartitionStore:
+    """
+    Stores trace rows as pickled DataFrame partitions, one file per level and chunk.
+
+    Args:
+        folder (str): Folder for the partition files. It is created if it does not exist.
+        clear (bool): If True, partitions of an earlier run in the folder are removed. If False, they are kept, so 
+                      that a resumed extraction can load them.
+    """
+
+    def __init__(self, folder, clear=True):
+        self.folder = folder
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        if clear:
+            for path in glob.glob(os.path.join(folder, "trace_level_*_chunk_*.pkl")):
+                os.remove(path)
+        self.paths = []
+        self.columns = []
+        self.appended_columns = []
+        self.row_count = 0
+        self.hashes = set()
+        self.block_numbers = {}
+        self.creation_frames = []
+        self.creation_frames_read = 0
+
+    def partition_path(self, level, chunk):
+        return os.path.join(self.folder, f"trace_level_{level:03d}_chunk_{chunk:04d}.pkl")
+
+    def write(self, df_chunk, level, chunk):
+        """
+        Writes the rows of one chunk to a partition file and updates the in-memory indexes.
+
+        Args:
+            df_chunk (pd.DataFrame): Flattened trace rows of the chunk.
+            level (int): The CREATE-relation level of the chunk.
+            chunk (int): The number of the chunk within the level.
+
+        Returns:
+            str: Path of the partition file, or None if the chunk has no rows.
+        """
+        if df_chunk.empty:
+            return None
+        path = self.partition_path(level, chunk)
+        # Written to a temporary file first, so that an interrupted run never leaves a partial partition
+        df_chunk.to_pickle(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.index_partition(df_chunk, path)
+        return path
+
+    def load(self, path):
+        """
+        Adds an existing partition file, e.g. of an interrupted run, to the store.
+
+        Args:
+            path (str): Path of the partition file.
+        """
+        self.index_partition(pd.read_pickle(path), path)
+
+    def index_partition(self, df_chunk, path):
+        self.paths.append(path)
+        self.row_count += len(df_chunk)
+        df_hash_blocks = df_chunk[["hash", "blockNumber"]].drop_duplicates(subset="hash")
+        self.hashes.update(df_hash_blocks["hash"].astype(str))
+        self.block_numbers.update(zip(df_hash_blocks["hash"].astype(str), df_hash_blocks["blockNumber"]))
+        for col in df_chunk.columns:
+            # transactionIndex is only in partitions that were rewritten by a resumed run's map_partitions
+            columns = self.appended_columns if col == "transactionIndex" else self.columns
+            if col not in columns:
+                columns.append(col)
+        creations = select_creations(df_chunk)
+        if not creations.empty:
+            self.creation_frames.append(creations.reindex(columns=CREATION_INDEX_COLUMNS))
+
+    def creations(self):
+        """
+        Returns the CREATE and CREATE2 rows of all partitions written so far.
+
+        Returns:
+            pd.DataFrame: The CREATE rows with the columns in CREATION_INDEX_COLUMNS.
+        """
+        return pd.concat([pd.DataFrame(columns=CREATION_INDEX_COLUMNS)] + self.creation_frames, axis=0, ignore_index=True)
+
+    def new_creations(self):
+        """
+        Returns the CREATE and CREATE2 rows of the partitions written since the last call, e.g., to update a 
+        `CreationGraph` with the rows of one level.
+
+        Returns:
+            pd.DataFrame: The CREATE rows with the columns in CREATION_INDEX_COLUMNS.
+        """
+        frames = self.creation_frames[self.creation_frames_read:]
+        self.creation_frames_read = len(self.creation_frames)
+        return pd.concat([pd.DataFrame(columns=CREATION_INDEX_COLUMNS)] + frames, axis=0, ignore_index=True)
+
+    def ordered_columns(self):
+        """
+        Returns the union of the partition columns, with the transaction-level columns and then the columns added by
+        `map_partitions` last.
+        """
+        return ([col for col in self.columns if col not in TRACE_TX_COLUMNS] + [col for col in TRACE_TX_COLUMNS if col in self.columns]
+                + self.appended_columns)
+
+    def iter_partitions(self):
+        """
+        Yields the partitions one by one, in the order they were written, with the union of all columns.
+        """
+        columns = self.ordered_columns()
+        for path in self.paths:
+            yield pd.read_pickle(path).reindex(columns=columns)
+
+    def map_partitions(self, func):
+        """
+        Applies a function to every partition and writes the result back to the partition file.
+
+        Args:
+            func (callable): Takes a partition DataFrame and returns the modified DataFrame.
+        """
+        for path in self.paths:
+            df_partition = func(pd.read_pickle(path))
+            df_partition.to_pickle(path)
+            for col in df_partition.columns:
+                if col not in self.columns and col not in self.appended_columns:
+                    self.appended_columns.append(col)
+
+    def write_csv(self, csv_path):
+        """
+        Writes all partitions to one CSV file, partition by partition, with a continuous index.
+
+        Args:
+            csv_path (str): Path of the CSV file.
+        """
+        offset = 0
+        for i, df_partition in enumerate(self.iter_partitions()):
+            df_partition.index = range(offset, offset + len(df_partition))
+            df_partition.to_csv(csv_path, mode="w" if i == 0 else "a", header=(i == 0))
+            offset += len(df_partition)
+
+    def read_all(self):
+        """
+        Reads all partitions into one DataFrame.
+
+        Returns:
+            pd.DataFrame: All trace rows, or None if no partition was written.
+        """
+        if not self.paths:
+            return None
+        return pd.concat(self.iter_partitions(), axis=0, ignore_index=True)
@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+from src.trace_based_logging.logging_config import setup_logging
+
+"""
+This module provides a small staged pipeline for the extraction: items (e.g., chunks of transactions) pass through
+a sequence of stages, each with a number of worker threads, and bounded queues between the stages. A stage that is
+faster than the next one blocks once the queue to the next stage is full (backpressure), so that at most
+`queue_size` items wait between two stages. Network-bound stages (requests to the node) and CPU-bound stages
+(flattening) thereby run at the same time on different items.
+
+A stage can be ordered: it then has one worker, which processes the items in the order in which they were fed into
+the pipeline, e.g., to write partitions or log progress in order. If a stage raises an exception, the pipeline stops
+and the exception is raised by `run_pipeline`.
+
+Classes:
+    Stage: One stage of a pipeline.
+
+Functions:
+    run_pipeline(items, stages, queue_size=QUEUE_SIZE, name="Pipeline"): Passes items through the stages.
+
+Constants:
+    QUEUE_SIZE (int): Default number of items that wait between two stages.
+"""
+
+logger = setup_logging()
+
+QUEUE_SIZE = 2
+# Seconds between two checks whether the pipeline was stopped while a worker waits for a queue
+POLL_SECONDS = 0.1
+# Marks the end of the items in a queue
+DONE = object()
+
+
+class Stage:
+    """
+    One stage of a pipeline.
+
+    Args:
+        name (str): Name of the stage, for the log.
+        func (callable): Called with each item; its return value is the item of the next stage.
+        workers (int): Number of worker threads of the stage.
+        ordered (bool): If True, the items are processed in the order in which they were fed into the pipeline.
+                        An ordered stage has one worker.
+
+    Raises:
+        ValueError: If an ordered stage has more than one worker.
+    """
+
+    def __init__(self, name, func, workers=1, ordered=False):
+        if ordered and workers != 1:
+            raise ValueError(f"The ordered stage {name} must have one worker, not {workers}")
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.ordered = ordered
+
+
+def run_pipeline(items, stages, queue_size=QUEUE_SIZE, name="Pipeline"):
+    """
+    Passes the items through the stages and waits until all items have passed the last stage.
+
+    Args:
+        items (iterable): The items; consumed as the first stage accepts them.
+        stages (list of Stage): The stages, in order.
+        queue_size (int): Number of items that wait in the queue in front of each stage.
+        name (str): Name of the pipeline, for the log.
+
+    Returns:
+        list: The return values of the last stage, in the order of `items`.
+
+    Raises:
+        Exception: The first exception raised by a stage (or by iterating `items`).
+    """
+    # The input queue of each stage, and one for the results of the last stage
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages] + [queue.Queue()]
+    stop = threading.Event()
+    errors = []
+    lock = threading.Lock()
+    running_workers = [stage.workers for stage in stages]
+    busy_seconds = [0.0] * len(stages)
+
+    def fail(error):
+        with lock:
+            errors.append(error)
+        stop.set()
+
+    def put(index, item):
+        while not stop.is_set():
+            try:
+                queues[index].put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(index):
+        while not stop.is_set():
+            try:
+                return queues[index].get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def process(index, seq, item):
+        start = time.perf_counter()
+        result = stages[index].func(item)
+        with lock:
+            busy_seconds[index] += time.perf_counter() - start
+        return put(index + 1, (seq, result))
+
+    def work(index):
+        stage = stages[index]
+        # Items that arrived before their predecessors, for an ordered stage
+        waiting = {}
+        next_seq = 0
+        try:
+            while True:
+                entry = get(index)
+                if entry is DONE:
+                    break
+                seq, item = entry
+                if not stage.ordered:
+                    if not process(index, seq, item):
+                        break
+                    continue
+                waiting[seq] = item
+                while next_seq in waiting:
+                    if not process(index, next_seq, waiting.pop(next_seq)):
+                        return
+                    next_seq += 1
+        except Exception as e:
+            logger.error(f"{name}: stage {stage.name} failed: {e}")
+            fail(e)
+        finally:
+            # The last worker of a stage ends the next stage
+            with lock:
+                running_workers[index] -= 1
+                last = running_workers[index] == 0
+            if last:
+                for _ in range(stages[index + 1].workers if index + 1 < len(stages) else 1):
+                    put(index + 1, DONE)
+
+    tic = time.perf_counter()
+    threads = [threading.Thread(target=work, args=(index,), name=f"{name}-{stage.name}-{worker}", daemon=True)
+               for index, stage in enumerate(stages) for worker in range(stage.workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for seq, item in enumerate(items):
+            if not put(0, (seq, item)):
+                break
+    except Exception as e:
+        fail(e)
+    finally:
+        for _ in range(stages[0].workers):
+            put(0, DONE)
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - tic
+    utilization = ", ".join(f"{stage.name} {busy / (elapsed * stage.workers):.0%}" for stage, busy in zip(stages, busy_seconds) if elapsed > 0)
+    logger.debug(f"{name}: {elapsed:.1f}s, busy share of the stages: {utilization}")
+    results = {}
+    while not queues[-1].empty():
+        entry = queues[-1].get()
+        if entry is not DONE:
+            results[entry[0]] = entry[1]
+    return [results[seq] for seq in sorted(results)]
@@ -1,7 +1,9 @@
 from contextlib import closing
 import socket
+import requests
 
 from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import request_controller
 
 # Create a logger
 logger = setup_logging()
@@ -40,6 +42,82 @@ def check_socket(host, port):
             logger.error(f"Port {port} on {host} is not open.")
             
             
+def json_rpc_batch(node_url, calls, max_attempts=5):
+    """
+    Sends several JSON-RPC calls to a node as one batch request (one HTTP POST) and matches the responses back by id.
+
+    Calls whose responses are missing or contain an error are sent again in a new batch, up to `max_attempts` times.
+
+    Args:
+        node_url (str): The URL of the Ethereum node.
+        calls (list of tuple): (method, params) tuples, e.g., ("eth_getBlockByNumber", ["0x10", False]).
+        max_attempts (int): Maximum number of attempts for calls that did not return a result.
+
+    Returns:
+        list: The "result" of each call in the order of `calls`; None for calls that failed in all attempts.
+    """
+    headers = {'Content-type': 'application/json'}
+    results = [None] * len(calls)
+    pending = list(range(len(calls)))
+    controller = request_controller.get_controller()
+
+    for attempt in range(max_attempts):
+        if not pending:
+            break
+        parameters = [
+            {"jsonrpc": "2.0", "method": calls[i][0], "params": calls[i][1], "id": i}
+            for i in pending
+        ]
+        back_off = False
+        try:
+            response = controller.post(node_url, json=parameters, headers=headers)
+            back_off = controller.is_failed_response(response)
+            response_json = response.json()
+            back_off = back_off or request_controller.is_overload_error(response_json)
+            if isinstance(response_json, list):
+                for entry in response_json:
+                    if isinstance(entry, dict) and entry.get("id") in pending and entry.get("result") is not None:
+                        results[entry["id"]] = entry["result"]
+            else:
+                logger.error(f"Unexpected response to a batch of {len(parameters)} JSON-RPC calls: {str(response_json)[:200]}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request exception for a batch of {len(parameters)} JSON-RPC calls: {e}. Retrying...")
+            back_off = True
+        except ValueError as e:
+            logger.error(f"JSON decoding error for a batch of {len(parameters)} JSON-RPC calls: {e}. Retrying...")
+        pending = [i for i in pending if results[i] is None]
+        if pending and back_off and attempt + 1 < max_attempts:
+            controller.backoff(attempt)
+
+    if pending:
+        logger.error(f"{len(pending)} of {len(calls)} JSON-RPC calls failed after {max_attempts} attempts, e.g., {calls[pending[0]]}")
+    return results
+
+
+def json_rpc_call(node_url, method, params):
+    """
+    Sends one JSON-RPC call to a node without retries.
+
+    Args:
+        node_url (str): The URL of the Ethereum node.
+        method (str): The JSON-RPC method.
+        params (list): The parameters of the call.
+
+    Returns:
+        The "result" of the call.
+
+    Raises:
+        ValueError: If the node answers with an error; the argument is the JSON-RPC error object, as with Web3.
+        requests.exceptions.RequestException: If the request fails, e.g., with a timeout.
+    """
+    headers = {'Content-type': 'application/json'}
+    parameters = {"jsonrpc": "2.0", "method": method, "params": params, "id": 1}
+    response_json = request_controller.get_controller().post(node_url, json=parameters, headers=headers).json()
+    if "error" in response_json:
+        raise ValueError(response_json["error"])
+    return response_json.get("result")
+
+
 # Use this for testing the resulting dataframe of the JSON output (number of entries / lines)
 def count_string_occurrences_in_keys(data, target_string):
     # generated by GPT, edited by the author
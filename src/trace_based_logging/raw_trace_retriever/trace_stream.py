@@ -0,0 +1,497 @@
+import re
+import json
+import zlib
+import codecs
+import itertools
+from json.decoder import scanstring
+
+"""
+This module provides a streaming parser for large callTracer responses. Small responses are parsed in memory with
+`json.loads`. Responses above a size threshold are tokenized chunk by chunk while they are received, and the calls
+and logs of each trace are emitted as flat row records right away, without building the nested trace JSON. The
+peak memory of a large trace is then about the size of its rows instead of the response text, the nested JSON, and
+the rows together.
+
+The parser understands the three response shapes of the trace retrieval: a single debug_traceTransaction response,
+a JSON-RPC batch (a list of such responses), and a debug_traceBlockByNumber response (a list of {txHash, result}
+entries). The "result" call objects of a streamed response are replaced by `StreamedTrace` objects, everything else
+is parsed as usual. A `StreamedTrace` can also keep the zlib-compressed JSON of its trace, so that it can be stored
+in the trace cache without keeping the JSON in memory.
+
+Classes:
+    JsonTokenizer: Incremental JSON tokenizer that turns text chunks into parse events.
+    StreamedTrace: The calls and logs of a streamed callTracer result as flat row records.
+    CompressedJsonWriter: Writes parse events back as zlib-compressed JSON.
+    TraceStreamParser: Builds a trace response from parse events, with `StreamedTrace` results.
+
+Functions:
+    parse_response(chunks, stream_threshold=None, keep_compressed=False): Parses a response in memory or streaming, by size.
+    read_response(response, stream_threshold=None, keep_compressed=False): Parses the body of a streamed HTTP response.
+    iter_decompressed(blob, chunk_size=CHUNK_SIZE): Yields the decompressed content of a zlib blob in chunks.
+
+Constants:
+    CHUNK_SIZE (int): Number of bytes read from a response (or decompressed from a blob) at a time.
+    STREAMED_RESULT_PREFIX (str): JSON-RPC envelope written before a compressed trace, as in a debug_traceTransaction response.
+"""
+
+CHUNK_SIZE = 64 * 1024
+STREAMED_RESULT_PREFIX = '{"jsonrpc":"2.0","id":1,"result":'
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?")
+NUMBER_PART = re.compile(r"[-+0-9.eE]*")
+LITERALS = {"t": ("true", True), "f": ("false", False), "n": ("null", None)}
+
+
+class JsonTokenizer:
+    """
+    Incremental JSON tokenizer. Text is fed in chunks of any size; the events of all complete tokens are returned,
+    an incomplete token at the end of a chunk is kept until the next chunk.
+
+    The events are tuples (event, value) with the events 'start_map', 'end_map', 'start_array', 'end_array',
+    'key' (value: the key), and 'value' (value: the string, number, boolean, or None).
+
+    Example:
+        >>> tokenizer = JsonTokenizer()
+        >>> tokenizer.feed('{"a": [1, tr') + tokenizer.feed('ue]}') + tokenizer.close()
+        [('start_map', None), ('key', 'a'), ('start_array', None), ('value', 1), ('value', True), ('end_array', None), ('end_map', None)]
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.containers = []
+        # Keys are shared across objects, as in json.loads, which saves one string per key and object
+        self.keys = {}
+        # What comes next: 'value', 'value_or_end' (after '['), 'key', 'key_or_end' (after '{'), 'colon', 'comma_or_end', or 'done'
+        self.expect = "value"
+
+    def feed(self, text, final=False):
+        """
+        Tokenizes the next chunk of text.
+
+        Args:
+            text (str): The next chunk.
+            final (bool): True if no more text follows.
+
+        Returns:
+            list of tuple: The events of the complete tokens.
+
+        Raises:
+            json.JSONDecodeError: If the text is not valid JSON.
+        """
+        buffer = self.buffer + text if self.buffer else text
+        events = []
+        pos = 0
+        end = len(buffer)
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos == end:
+                break
+            char = buffer[pos]
+            expect = self.expect
+            if expect == "comma_or_end":
+                if char == ",":
+                    self.expect = "key" if self.containers[-1] == "{" else "value"
+                    pos += 1
+                elif char == ("}" if self.containers[-1] == "{" else "]"):
+                    pos = self.end_container(events, pos)
+                else:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            elif expect == "colon":
+                if char != ":":
+                    raise json.JSONDecodeError("Expecting ':' delimiter", buffer, pos)
+                self.expect = "value"
+                pos += 1
+            elif expect == "key" or expect == "key_or_end":
+                if char == "}" and expect == "key_or_end":
+                    pos = self.end_container(events, pos)
+                elif char == '"':
+                    key, next_pos = self.scan_string(buffer, pos, final)
+                    if next_pos is None:
+                        break
+                    events.append(("key", self.keys.setdefault(key, key)))
+                    self.expect = "colon"
+                    pos = next_pos
+                else:
+                    raise json.JSONDecodeError("Expecting property name enclosed in double quotes", buffer, pos)
+            elif expect == "done":
+                raise json.JSONDecodeError("Extra data", buffer, pos)
+            else:
+                if char == "]" and expect == "value_or_end":
+                    pos = self.end_container(events, pos)
+                elif char == "{":
+                    events.append(("start_map", None))
+                    self.containers.append("{")
+                    self.expect = "key_or_end"
+                    pos += 1
+                elif char == "[":
+                    events.append(("start_array", None))
+                    self.containers.append("[")
+                    self.expect = "value_or_end"
+                    pos += 1
+                else:
+                    if char == '"':
+                        value, next_pos = self.scan_string(buffer, pos, final)
+                    elif char in LITERALS:
+                        literal, value = LITERALS[char]
+                        next_pos = pos + len(literal)
+                        if not buffer.startswith(literal, pos):
+                            if final or next_pos <= end or not literal.startswith(buffer[pos:]):
+                                raise json.JSONDecodeError("Expecting value", buffer, pos)
+                            next_pos = None
+                    # A number at the end of the chunk may continue in the next chunk
+                    elif not final and NUMBER_PART.match(buffer, pos).end() == end:
+                        next_pos = None
+                    else:
+                        match = NUMBER.match(buffer, pos)
+                        if match is None:
+                            raise json.JSONDecodeError("Expecting value", buffer, pos)
+                        number = match.group()
+                        value = float(number) if match.group(1) or match.group(2) else int(number)
+                        next_pos = match.end()
+                    if next_pos is None:
+                        break
+                    events.append(("value", value))
+                    pos = next_pos
+                    self.expect = "comma_or_end" if self.containers else "done"
+        self.buffer = buffer[pos:]
+        if final and (self.containers or self.expect != "done"):
+            raise json.JSONDecodeError("Unexpected end of data", buffer, end)
+        return events
+
+    def scan_string(self, buffer, pos, final):
+        # Returns (string, end) or (None, None) if the string continues in the next chunk
+        try:
+            return scanstring(buffer, pos + 1)
+        except json.JSONDecodeError:
+            # scanstring also fails for an escape sequence that is cut off at the end of the chunk
+            if final:
+                raise
+            return None, None
+
+    def end_container(self, events, pos):
+        container = self.containers.pop()
+        events.append(("end_map" if container == "{" else "end_array", None))
+        self.expect = "comma_or_end" if self.containers else "done"
+        return pos + 1
+
+    def close(self):
+        """
+        Signals the end of the text.
+
+        Returns:
+            list of tuple: The events of the remaining tokens.
+
+        Raises:
+            json.JSONDecodeError: If the text ends within a token or a container.
+        """
+        return self.feed("", final=True)
+
+
+class StreamedTrace:
+    """
+    The calls and logs of a callTracer result that was parsed while streaming, as flat row records.
+
+    The rows are numbered like in `trace_transformation.flatten_trace` ('tracePos', 'tracePosDepth') and kept level by
+    level: the calls of nesting level n are followed by the logs emitted at level n-1. The rows hold all keys of their
+    call or log except 'calls' and 'logs', and the values of the top-level call are not flattened yet.
+
+    Attributes:
+        type (str): The call type of the top-level call; None if it has none, i.e., the result is not a valid trace.
+        compressed (bytes): The zlib-compressed JSON of the trace, wrapped like a debug_traceTransaction response.
+                            None if it was not kept.
+    """
+
+    def __init__(self):
+        self.type = None
+        self.compressed = None
+        self.calls_by_level = []
+        self.logs_by_level = []
+        self.trace_pos = 0
+
+    def add_level(self, level):
+        while len(self.calls_by_level) <= level:
+            self.calls_by_level.append([])
+            self.logs_by_level.append([])
+
+    def take_rows(self):
+        """
+        Returns the rows in the order of `flatten_trace` and releases them; the trace is empty afterwards.
+
+        Returns:
+            list of dict: One record per call and log in the trace.
+        """
+        rows = [row for calls, logs in zip(self.calls_by_level, self.logs_by_level) for row in calls + logs]
+        self.calls_by_level = []
+        self.logs_by_level = []
+        return rows
+
+
+class CompressedJsonWriter:
+    """
+    Writes parse events back as compact JSON into a zlib stream.
+
+    Args:
+        prefix (str): Text written before the first event.
+        suffix (str): Text written after the last event.
+    """
+
+    def __init__(self, prefix="", suffix=""):
+        self.compressor = zlib.compressobj()
+        self.suffix = suffix
+        self.parts = [prefix]
+        self.size = len(prefix)
+        self.output = []
+        # Number of items written per open container, to place the commas
+        self.counts = []
+        self.after_key = False
+
+    def write(self, event, value):
+        if event == "end_map" or event == "end_array":
+            self.counts.pop()
+            text = "}" if event == "end_map" else "]"
+        else:
+            text = ""
+            if self.after_key:
+                self.after_key = False
+            elif self.counts:
+                if self.counts[-1]:
+                    text = ","
+                self.counts[-1] += 1
+            if event == "key":
+                text += json.dumps(value) + ":"
+                self.after_key = True
+            elif event == "start_map":
+                text += "{"
+                self.counts.append(0)
+            elif event == "start_array":
+                text += "["
+                self.counts.append(0)
+            else:
+                text += json.dumps(value)
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= CHUNK_SIZE:
+            self.flush_parts()
+
+    def flush_parts(self):
+        self.output.append(self.compressor.compress("".join(self.parts).encode("utf-8")))
+        self.parts = []
+        self.size = 0
+
+    def finish(self):
+        """
+        Returns:
+            bytes: The compressed JSON.
+        """
+        self.parts.append(self.suffix)
+        self.flush_parts()
+        self.output.append(self.compressor.flush())
+        return b"".join(self.output)
+
+
+class TraceStreamParser:
+    """
+    Builds a trace response from parse events. The "result" call objects (of a single response, of the responses in a
+    batch, or of the entries of a block trace) become `StreamedTrace` objects; all other values are built as usual.
+
+    Args:
+        keep_compressed (bool): If True, the compressed JSON of each trace is kept in `StreamedTrace.compressed`.
+
+    Example:
+        >>> parser = TraceStreamParser()
+        >>> parser.feed(b'{"jsonrpc": "2.0", "id": 1, "result": {"type": "CALL", "calls": [{"type": "STATICCALL"}]}}')
+        >>> response = parser.close()
+        >>> response["result"].take_rows()
+        [{'type': 'CALL', 'tracePos': 1, 'tracePosDepth': '1'}, {'type': 'STATICCALL', 'tracePos': 2, 'tracePosDepth': '1.1'}]
+    """
+
+    def __init__(self, keep_compressed=False):
+        self.keep_compressed = keep_compressed
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.tokenizer = JsonTokenizer()
+        # Frames of the open containers; a frame is a dict with the 'kind' of the container and its state
+        self.stack = []
+        self.result = None
+        self.writer = None
+        self.writer_depth = None
+
+    def feed(self, chunk):
+        """
+        Parses the next chunk of the response.
+
+        Args:
+            chunk (bytes): The next chunk of the UTF-8 encoded response.
+
+        Raises:
+            ValueError: If the response is not valid JSON.
+        """
+        self.handle(self.tokenizer.feed(self.decoder.decode(chunk)))
+
+    def close(self):
+        """
+        Returns:
+            dict or list: The parsed response.
+
+        Raises:
+            ValueError: If the response is incomplete.
+        """
+        self.handle(self.tokenizer.feed(self.decoder.decode(b"", final=True), final=True))
+        return self.result
+
+    def handle(self, events):
+        stack = self.stack
+        for event, value in events:
+            if self.writer is not None:
+                self.writer.write(event, value)
+            if event == "key":
+                stack[-1]["key"] = value
+            elif event == "value":
+                self.deliver(value)
+            elif event == "start_map" or event == "start_array":
+                stack.append(self.open_frame(event == "start_map"))
+            else:
+                frame = stack.pop()
+                self.deliver(self.close_call(frame) if frame["kind"] == "call" else frame.get("value"))
+
+    def slot(self):
+        # Returns the role of the value that starts next: (kind of the parent container, key)
+        if not self.stack:
+            return None, None
+        frame = self.stack[-1]
+        return frame["kind"], frame.get("key")
+
+    def open_frame(self, is_map):
+        parent, key = self.slot()
+        if is_map:
+            if parent is None or parent == "batch":
+                return {"kind": "response", "value": {}, "key": None}
+            if parent == "entries":
+                return {"kind": "entry", "value": {}, "key": None}
+            if (parent == "response" or parent == "entry") and key == "result":
+                return self.open_call(None, 0)
+            if parent == "calls":
+                return self.open_call(self.stack[-1]["call"], self.stack[-1]["call"]["level"] + 1)
+        else:
+            if parent is None:
+                return {"kind": "batch", "value": [], "key": None}
+            if parent == "response" and key == "result":
+                return {"kind": "entries", "value": [], "key": None}
+            if parent == "call" and key in ("calls", "logs"):
+                return {"kind": key, "call": self.stack[-1], "key": None}
+        return {"kind": "build", "value": {} if is_map else [], "key": None}
+
+    def open_call(self, parent, level):
+        if parent is None:
+            trace = StreamedTrace()
+            trace_pos_depth = "1"
+            if self.keep_compressed:
+                self.writer = CompressedJsonWriter(STREAMED_RESULT_PREFIX, "}")
+                self.writer.write("start_map", None)
+                self.writer_depth = len(self.stack)
+        else:
+            trace = parent["trace"]
+            trace_pos_depth = f"{parent['trace_pos_depth']}.{parent['call_count'] + 1}"
+        trace.trace_pos += 1
+        trace.add_level(level)
+        row = {}
+        trace.calls_by_level[level].append(row)
+        return {"kind": "call", "key": None, "trace": trace, "row": row, "level": level, "trace_pos": trace.trace_pos,
+                "trace_pos_depth": trace_pos_depth, "call_count": 0, "logs": []}
+
+    def close_call(self, frame):
+        trace = frame["trace"]
+        row = frame["row"]
+        row["tracePos"] = frame["trace_pos"]
+        row["tracePosDepth"] = frame["trace_pos_depth"]
+        # The logs of a call are numbered after all of its nested calls and their logs
+        if frame["logs"]:
+            trace.add_level(frame["level"] + 1)
+            for j, log in enumerate(frame["logs"], start=1):
+                trace.trace_pos += 1
+                log["tracePos"] = trace.trace_pos
+                log["tracePosDepth"] = f"{frame['trace_pos_depth']}.{frame['call_count'] + j}"
+                trace.logs_by_level[frame["level"] + 1].append(log)
+        if frame["level"] > 0:
+            return None
+        trace.type = row.get("type")
+        if self.writer is not None and len(self.stack) == self.writer_depth:
+            trace.compressed = self.writer.finish()
+            self.writer = None
+        return trace
+
+    def deliver(self, value):
+        # Hands a complete value to the container it belongs to
+        if not self.stack:
+            self.result = value
+            return
+        frame = self.stack[-1]
+        kind = frame["kind"]
+        if kind == "call":
+            if frame["key"] not in ("calls", "logs"):
+                frame["row"][frame["key"]] = value
+        elif kind == "calls":
+            frame["call"]["call_count"] += 1
+        elif kind == "logs":
+            if isinstance(value, dict):
+                frame["call"]["logs"].append({key: log_value for key, log_value in value.items() if key not in ("calls", "logs")})
+        elif isinstance(frame["value"], list):
+            frame["value"].append(value)
+        else:
+            frame["value"][frame["key"]] = value
+
+
+def parse_response(chunks, stream_threshold=None, keep_compressed=False):
+    """
+    Parses a JSON-RPC trace response. Responses up to `stream_threshold` bytes are parsed in memory with `json.loads`,
+    larger ones with a `TraceStreamParser`, chunk by chunk.
+
+    Args:
+        chunks (iterable of bytes): The response body in chunks.
+        stream_threshold (int, optional): Size in bytes above which the response is parsed while streaming.
+                                          If None, all responses are parsed in memory.
+        keep_compressed (bool): If True, streamed traces keep their compressed JSON (see `StreamedTrace.compressed`).
+
+    Returns:
+        dict or list: The response; the trace results are `StreamedTrace` objects if it was streamed.
+
+    Raises:
+        ValueError: If the response is not valid JSON.
+    """
+    chunks = iter(chunks)
+    head = []
+    size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if stream_threshold is not None and size > stream_threshold:
+            break
+    else:
+        return json.loads(b"".join(head))
+    parser = TraceStreamParser(keep_compressed)
+    for chunk in itertools.chain(head, chunks):
+        parser.feed(chunk)
+    return parser.close()
+
+
+def read_response(response, stream_threshold=None, keep_compressed=False):
+    """
+    Parses the body of an HTTP response that was requested with `stream=True` (see `parse_response`).
+    """
+    return parse_response(response.iter_content(CHUNK_SIZE), stream_threshold, keep_compressed)
+
+
+def iter_decompressed(blob, chunk_size=CHUNK_SIZE):
+    """
+    Yields the decompressed content of a zlib blob in chunks of at most `chunk_size` bytes.
+    """
+    decompressor = zlib.decompressobj()
+    data = blob
+    while data:
+        chunk = decompressor.decompress(data, chunk_size)
+        data = decompressor.unconsumed_tail
+        if chunk:
+            yield chunk
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
@@ -3,7 +3,14 @@ import time
 import datetime
 import requests
 import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport, request_controller
+from src.trace_based_logging.raw_trace_retriever.trace_retriever_utils import json_rpc_batch
+from src.trace_based_logging.raw_trace_retriever.trace_buffer import TraceBuffer
+from src.trace_based_logging.raw_trace_retriever.trace_stream import StreamedTrace, parse_response, read_response, iter_decompressed
+from src.trace_based_logging.raw_trace_retriever.trace_pipeline import Stage, run_pipeline, QUEUE_SIZE
 
 """
 This module provides functionalities for interacting with blockchain nodes to retrieve and process transaction trace data. 
@@ -11,10 +18,28 @@ It includes functions for fetching JSON data for transaction hashes, converting
 flattening nested JSON structures, and handling nested transactions.
 
 Functions:
-    json_retriever(tx_hash, node_url, max_attempts=15):
-        Retrieves JSON data for a given transaction hash from a blockchain node, with a specified number of retry attempts.
+    json_retriever(tx_hash, node_url, max_attempts=15, trace_cache=None, stream_threshold=None, keep_compressed=False, tracer_config=TRACER_CONFIG):
+        Retrieves JSON data for a given transaction hash from a blockchain node (or a trace cache), with a specified number of retry attempts.
 
-    tx_to_trace(df_txs_lx, node_url):
+    json_retriever_batch(tx_hashes, node_url, max_attempts=15, trace_cache=None, stream_threshold=None, keep_compressed=False, tracer_config=TRACER_CONFIG):
+        Retrieves JSON data for several transaction hashes with one JSON-RPC batch request, falling back to single requests for failed entries.
+
+    get_cached_trace(trace_cache, tx_hash, stream_threshold=None):
+        Looks up a trace in the trace cache; large traces are parsed while streaming.
+
+    store_trace(trace_cache, tx_hash, response_json):
+        Stores a trace response, in memory or streamed, in the trace cache.
+
+    retrieve_traces(tx_hashes, node_url, executor=None, batch_size=BATCH_SIZE, trace_cache=None, stream_threshold=None, keep_compressed=False, tracer_config=TRACER_CONFIG):
+        Retrieves the trace JSON for a list of transaction hashes, optionally batched and with several requests in flight, in input order.
+
+    block_trace_retriever(block_number, node_url, max_attempts=15, stream_threshold=None, keep_compressed=False, tracer_config=TRACER_CONFIG):
+        Retrieves the traces of all transactions in a block with one debug_traceBlockByNumber request.
+
+    select_dense_blocks(df_txs_lx, node_url, block_trace_threshold, block_cache=None):
+        Selects the blocks in which the share of relevant transactions is high enough to trace the whole block.
+
+    tx_to_trace(df_txs_lx, node_url, max_workers=MAX_WORKERS, batch_size=BATCH_SIZE, block_trace_threshold=None, trace_cache=None, chunk_callback=None, block_cache=None, stream_threshold=None, trace_callback=None, tracer_config=TRACER_CONFIG, fetch_workers=FETCH_WORKERS, flatten_workers=FLATTEN_WORKERS, queue_size=QUEUE_SIZE, creations_callback=None):
         Converts a DataFrame of transactions into a DataFrame of transaction traces by retrieving trace data from a blockchain node.
 
     insert_order(trace_json_lx, start):
@@ -23,14 +48,31 @@ Functions:
     flatten(trace_json_lx, new_trace_json_lx={}):
         Flattens a nested dictionary by recursively merging its nested structures into the parent dictionary.
 
+    flatten_trace(trace_json_lx, tx_hash, functionName, timestamp, blockNumber):
+        Walks a callTracer result once and returns its calls and logs as flat row records, including 'tracePos' and 'tracePosDepth'.
+        Results that were parsed while streaming (`StreamedTrace`) are already flat; only the transaction values are attached.
+
     flatten_nested(df_flat_json_tmp, df_trace_l1, tx_hash, functionName, timestamp, blockNumber):
         Flattens nested JSON arguments in a DataFrame column named "calls" (if it exists) and organizes the data in a tabular format.
 
     explode_df(df_flat_json, nested_cols):
         Helper function to further flatten and explode nested columns ('calls', 'logs') in a DataFrame obtained from JSON data.
 
+    Note: `tx_to_trace` flattens traces with `flatten_trace`. `insert_tracePos`, `insert_tracePosDepth`, `flatten`, 
+    `flatten_nested`, and `explode_df` implement the same result with one DataFrame per nesting level and are kept 
+    as reference implementation.
+
 Constants:
     INCREMENT_FACTOR (int): A constant used to determine the batch size for processing transactions in chunks.
+    MAX_WORKERS (int): Default number of trace requests kept in flight against the node.
+    BATCH_SIZE (int): Default number of transaction hashes packed into one JSON-RPC batch request.
+    FETCH_WORKERS (int): Default number of chunks of transactions fetched from the node at the same time.
+    FLATTEN_WORKERS (int): Default number of threads that flatten fetched chunks.
+    TRACE_TX_COLUMNS (list): Transaction-level columns that are attached to every row of a trace.
+    DROPPED_TRACE_KEYS (tuple): Keys of the trace JSON that are not taken over into the rows.
+    TRACER_CONFIG (dict): The default tracer options sent with each debug_traceTransaction and debug_traceBlockByNumber request
+                          (see `tracers` for the other tracer modes).
+    BLOCK_COUNT_BATCH_SIZE (int): Number of block transaction counts requested per JSON-RPC batch.
 
 Variables:
     invalid_tx_hash (set): A set used to store transaction hashes that resulted in invalid or unexpected JSON responses.
@@ -39,40 +81,78 @@ Variables:
 logger = setup_logging()
 
 INCREMENT_FACTOR = 100
+# Number of debug_traceTransaction requests in flight; 1 replays the transactions one after another
+MAX_WORKERS = 1
+# Number of debug_traceTransaction calls per JSON-RPC batch (HTTP POST); 1 sends one call per POST
+BATCH_SIZE = 1
+# Chunks fetched at the same time; their requests share the MAX_WORKERS requests in flight
+FETCH_WORKERS = 2
+FLATTEN_WORKERS = 1
+
+TRACER_CONFIG = {"tracer": 'callTracer', "tracerConfig": {"withLog": True}}
+
+BLOCK_COUNT_BATCH_SIZE = 100
+
+TRACE_TX_COLUMNS = ["hash", "functionName", "timeStamp", "blockNumber"]
+# "calls" and "logs" are unfolded into rows of their own, the others do not hold helpful information
+DROPPED_TRACE_KEYS = ("calls", "logs", "index", "jsonrpc", "id")
 
 invalid_tx_hash = set([])
 
-def json_retriever(tx_hash, node_url, max_attempts=15):
+def json_retriever(tx_hash, node_url, max_attempts=15, trace_cache=None, stream_threshold=None, keep_compressed=False, tracer_config=TRACER_CONFIG):
     """
     Retrieves JSON data for a given transaction hash from a blockchain node.
 
+    Responses larger than `stream_threshold` bytes are parsed while they are received (see `trace_stream`): their 
+    "result" is a `StreamedTrace` with the flat rows of the trace instead of the nested callTracer JSON.
+
     Args:
         tx_hash (str): The transaction hash to retrieve the trace for.
         node_url (str): The URL of the blockchain node to query.
         max_attempts (int): Maximum number of attempts for the request.
+        trace_cache (TraceCache, optional): Trace store that is checked before the node is queried. 
+                                            Traces retrieved from the node are added to it.
+        stream_threshold (int, optional): Size in bytes above which a response is parsed while streaming. 
+                                          If None, all responses are parsed in memory.
+        keep_compressed (bool): If True, streamed traces keep their compressed JSON, e.g., to be archived. They
+                                always keep it if `trace_cache` is given.
+        tracer_config (dict, optional): The tracer options of the request, see `tracers.tracer_config`.
 
     Returns:
         tuple: A tuple containing the JSON response and a boolean flag indicating success.
     """
+    if trace_cache is not None:
+        response_json = get_cached_trace(trace_cache, tx_hash, stream_threshold)
+        if response_json is not None:
+            return response_json, True
+
     headers = {'Content-type': 'application/json'}
     parameters = {
         "jsonrpc": "2.0",
         "method": "debug_traceTransaction",
-        "params": [tx_hash, {"tracer": 'callTracer', "tracerConfig": {"withLog": True}}],
+        "params": [tx_hash, tracer_config],
         "id": 1
     }
     attempts = 0
     json_flag = True
+    controller = request_controller.get_controller()
 
     while attempts < max_attempts:
+        # Failures of the node or the connection are retried after a backoff; other invalid responses right away
+        back_off = False
         try:
-            response = requests.post(node_url, json=parameters, headers=headers)
-            # Check if response is valid and contains JSON
-            response_json = response.json()  # This line could raise ValueError if response is not valid JSON
-            if response_json and "result" in response_json and isinstance(response_json["result"], dict) and "type" in response_json["result"]:
+            with controller.post(node_url, json=parameters, headers=headers, stream=True) as response:
+                back_off = controller.is_failed_response(response)
+                # Check if response is valid and contains JSON
+                response_json = read_response(response, stream_threshold, keep_compressed or trace_cache is not None)  # This line could raise ValueError if response is not valid JSON
+            if is_valid_trace_response(response_json):
+                if trace_cache is not None:
+                    store_trace(trace_cache, tx_hash, response_json)
                 return response_json, json_flag
+            back_off = back_off or request_controller.is_overload_error(response_json)
         except requests.exceptions.RequestException as e:
             logger.error(f"Request exception for tx_hash {tx_hash}: {e}")
+            back_off = True
         except ValueError as e:
             logger.error(f"JSON decoding error for tx_hash {tx_hash}: {e}")
 
@@ -81,9 +161,235 @@ def json_retriever(tx_hash, node_url, max_attempts=15):
             #ts = datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S')
             logger.error(f"Max attempts reached. Invalid tx hash: {tx_hash}.")
             json_flag = False
+        elif back_off:
+            controller.backoff(attempts - 1)
 
     return {}, json_flag
 
+
+def is_valid_trace_response(response_json):
+    """
+    Checks whether a JSON-RPC response object contains a usable callTracer result, parsed in memory or while streaming.
+
+    Args:
+        response_json (dict): A single JSON-RPC response object.
+
+    Returns:
+        bool: True if the response holds a trace result with a call type, False otherwise.
+    """
+    if not response_json or not isinstance(response_json, dict):
+        return False
+    result = response_json.get("result")
+    if isinstance(result, StreamedTrace):
+        return result.type is not None
+    return isinstance(result, dict) and "type" in result
+
+
+def get_cached_trace(trace_cache, tx_hash, stream_threshold=None):
+    """
+    Looks up the trace of a transaction in the trace cache. Traces larger than `stream_threshold` bytes are parsed 
+    while they are decompressed, as in `json_retriever`.
+
+    Returns:
+        dict: The stored debug_traceTransaction response, or None if the trace is not in the cache.
+    """
+    blob = trace_cache.get_compressed(tx_hash)
+    if blob is None:
+        return None
+    response_json = parse_response(iter_decompressed(blob), stream_threshold)
+    if isinstance(response_json.get("result"), StreamedTrace):
+        response_json["result"].compressed = blob
+    return response_json
+
+
+def store_trace(trace_cache, tx_hash, response_json):
+    """
+    Stores a debug_traceTransaction response in the trace cache. Streamed traces are stored with the compressed JSON 
+    they kept while they were parsed; streamed traces without it are not stored.
+    """
+    result = response_json.get("result")
+    if isinstance(result, StreamedTrace):
+        if result.compressed is not None:
+            trace_cache.put_compressed(tx_hash, result.compressed)
+    else:
+        trace_cache.put(tx_hash, response_json)
+
+
+def json_retriever_batch(tx_hashes, node_url, max_attempts=15, trace_cache=None, stream_threshold=None, keep_compressed=False, tracer_config=TRACER_CONFIG):
+    """
+    Retrieves JSON data for several transaction hashes from a blockchain node with one JSON-RPC batch request.
+
+    All debug_traceTransaction calls are packed into one HTTP POST. Each call gets the position of its hash in 
+    `tx_hashes` as JSON-RPC id, and the responses, which the node may return in any order, are matched back by that id.
+    Entries that come back as errors, are missing, or are malformed are retrieved again with single requests 
+    via `json_retriever`, including its retry semantics. Hashes with a trace in `trace_cache` are not sent to the node.
+    A batch response larger than `stream_threshold` bytes is parsed while it is received, as in `json_retriever`.
+
+    Args:
+        tx_hashes (list of str): The transaction hashes to retrieve the traces for.
+        node_url (str): The URL of the blockchain node to query.
+        max_attempts (int): Maximum number of attempts for the single-request fallback.
+        trace_cache (TraceCache, optional): Trace store that is checked before the node is queried. 
+                                            Traces retrieved from the node are added to it.
+        stream_threshold (int, optional): Size in bytes above which a response is parsed while streaming.
+        keep_compressed (bool): If True, streamed traces keep their compressed JSON, see `json_retriever`.
+        tracer_config (dict, optional): The tracer options of the requests, see `tracers.tracer_config`.
+
+    Returns:
+        list of tuple: One (JSON response, json_flag) tuple per transaction hash, in the order of `tx_hashes`.
+    """
+    headers = {'Content-type': 'application/json'}
+    results = [None] * len(tx_hashes)
+    if trace_cache is not None:
+        for i, tx_hash in enumerate(tx_hashes):
+            response_json = get_cached_trace(trace_cache, tx_hash, stream_threshold)
+            if response_json is not None:
+                results[i] = (response_json, True)
+    parameters = [
+        {
+            "jsonrpc": "2.0",
+            "method": "debug_traceTransaction",
+            "params": [tx_hash, tracer_config],
+            "id": i
+        }
+        for i, tx_hash in enumerate(tx_hashes) if results[i] is None
+    ]
+
+    try:
+        if parameters:
+            with request_controller.get_controller().post(node_url, json=parameters, headers=headers, stream=True) as response:
+                response_json = read_response(response, stream_threshold, keep_compressed or trace_cache is not None)
+            # A node that does not support batches answers with a single error object instead of a list
+            if isinstance(response_json, list):
+                for entry in response_json:
+                    request_id = entry.get("id") if isinstance(entry, dict) else None
+                    if isinstance(request_id, int) and 0 <= request_id < len(tx_hashes) and is_valid_trace_response(entry):
+                        results[request_id] = (entry, True)
+                        if trace_cache is not None:
+                            store_trace(trace_cache, tx_hashes[request_id], entry)
+            else:
+                logger.error(f"Unexpected response to a batch request of {len(parameters)} tx hashes: {str(response_json)[:200]}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request exception for a batch of {len(parameters)} tx hashes: {e}")
+    except ValueError as e:
+        logger.error(f"JSON decoding error for a batch of {len(parameters)} tx hashes: {e}")
+
+    failed = [i for i, result in enumerate(results) if result is None]
+    if failed:
+        logger.debug(f"Batch request: {len(failed)} of {len(tx_hashes)} tx hashes are retrieved with single requests.")
+    for i in failed:
+        results[i] = json_retriever(tx_hashes[i], node_url, max_attempts, trace_cache, stream_threshold, keep_compressed, tracer_config)
+
+    return results
+
+def block_trace_retriever(block_number, node_url, max_attempts=15, stream_threshold=None, keep_compressed=False, tracer_config=TRACER_CONFIG):
+    """
+    Retrieves the traces of all transactions in a block with one debug_traceBlockByNumber request.
+
+    Each transaction trace is wrapped in the same structure as a debug_traceTransaction response, so that the result 
+    can be processed like the output of `json_retriever`. Newer clients return the hash of each transaction along 
+    with its trace; for clients that do not, the hashes are taken from the block's transaction list, which is in 
+    the same order as the traces. A response larger than `stream_threshold` bytes is parsed while it is received, 
+    as in `json_retriever`.
+
+    Args:
+        block_number (int): The number of the block to trace.
+        node_url (str): The URL of the blockchain node to query.
+        max_attempts (int): Maximum number of attempts for the request.
+        stream_threshold (int, optional): Size in bytes above which the response is parsed while streaming.
+        keep_compressed (bool): If True, streamed traces keep their compressed JSON, to be stored in a trace cache or archived.
+        tracer_config (dict, optional): The tracer options of the request, see `tracers.tracer_config`.
+
+    Returns:
+        dict: A dictionary mapping transaction hashes to (JSON response, json_flag) tuples. Empty if the block could not be traced.
+    """
+    headers = {'Content-type': 'application/json'}
+    parameters = {
+        "jsonrpc": "2.0",
+        "method": "debug_traceBlockByNumber",
+        "params": [hex(block_number), tracer_config],
+        "id": 1
+    }
+
+    controller = request_controller.get_controller()
+    for attempt in range(max_attempts):
+        back_off = False
+        try:
+            with controller.post(node_url, json=parameters, headers=headers, stream=True) as response:
+                back_off = controller.is_failed_response(response)
+                response_json = read_response(response, stream_threshold, keep_compressed)
+            if isinstance(response_json, dict) and isinstance(response_json.get("result"), list):
+                block_traces = response_json["result"]
+                break
+            logger.error(f"Unexpected response for block trace {block_number}: {str(response_json)[:200]}")
+            back_off = back_off or request_controller.is_overload_error(response_json)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request exception for block trace {block_number}: {e}")
+            back_off = True
+        except ValueError as e:
+            logger.error(f"JSON decoding error for block trace {block_number}: {e}")
+        if back_off and attempt + 1 < max_attempts:
+            controller.backoff(attempt)
+    else:
+        logger.error(f"Max attempts reached. Block {block_number} could not be traced, its transactions are traced one by one.")
+        return {}
+
+    if block_traces and not all("txHash" in entry for entry in block_traces):
+        block = json_rpc_batch(node_url, [("eth_getBlockByNumber", [hex(block_number), False])])[0]
+        if block is None or len(block["transactions"]) != len(block_traces):
+            logger.error(f"Transaction hashes of block {block_number} could not be matched to its traces, its transactions are traced one by one.")
+            return {}
+        tx_hashes = block["transactions"]
+    else:
+        tx_hashes = [entry.get("txHash") for entry in block_traces]
+
+    traces = {}
+    for tx_hash, entry in zip(tx_hashes, block_traces):
+        response_json = {"jsonrpc": "2.0", "id": 1, "result": entry.get("result")}
+        if is_valid_trace_response(response_json):
+            traces[tx_hash.lower()] = (response_json, True)
+    return traces
+
+
+def select_dense_blocks(df_txs_lx, node_url, block_trace_threshold, block_cache=None):
+    """
+    Selects the blocks for which tracing the whole block is cheaper than tracing the relevant transactions one by one.
+
+    A block is selected if the share of its transactions that appear in `df_txs_lx` is at least `block_trace_threshold`. 
+    The number of transactions per block is taken from the block header cache, if given, or requested with batched 
+    eth_getBlockTransactionCountByNumber calls.
+
+    Args:
+        df_txs_lx (pd.DataFrame): A DataFrame of relevant transactions with the fields 'hash' and 'blockNumber'.
+        node_url (str): The URL of the blockchain node to query.
+        block_trace_threshold (float): Minimum share (0 to 1) of relevant transactions in a block to trace the whole block.
+        block_cache (BlockHeaderCache, optional): Block header cache with the number of transactions per block.
+
+    Returns:
+        set of int: The numbers of the blocks to trace as a whole.
+    """
+    relevant_counts = df_txs_lx['blockNumber'].astype(int).value_counts()
+    # Blocks with a single relevant transaction are never cheaper to trace as a whole
+    candidates = [int(block_number) for block_number, count in relevant_counts.items() if count > 1]
+
+    dense_blocks = set()
+    if block_cache is not None:
+        headers = block_cache.get_headers(candidates, node_url)
+        for block_number in candidates:
+            if block_number in headers and headers[block_number]["transactionCount"]:
+                if relevant_counts[block_number] / headers[block_number]["transactionCount"] >= block_trace_threshold:
+                    dense_blocks.add(block_number)
+        candidates = [block_number for block_number in candidates if block_number not in headers or not headers[block_number]["transactionCount"]]
+    for i in range(0, len(candidates), BLOCK_COUNT_BATCH_SIZE):
+        batch = candidates[i:i + BLOCK_COUNT_BATCH_SIZE]
+        counts = json_rpc_batch(node_url, [("eth_getBlockTransactionCountByNumber", [hex(block_number)]) for block_number in batch])
+        for block_number, count in zip(batch, counts):
+            if count is not None and relevant_counts[block_number] / int(count, 16) >= block_trace_threshold:
+                dense_blocks.add(block_number)
+
+    logger.info(f"Block tracing: {len(dense_blocks)} of {len(relevant_counts)} blocks are traced as a whole.")
+    return dense_blocks
+
 """
 def json_retriever(tx_hash, node_url):
 
@@ -120,7 +426,47 @@ def json_retriever(tx_hash, node_url):
 
 """
 
-def tx_to_trace(df_txs_lx, node_url):
+def retrieve_traces(tx_hashes, node_url, executor=None, batch_size=BATCH_SIZE, trace_cache=None, stream_threshold=None, keep_compressed=False, tracer_config=TRACER_CONFIG):
+    """
+    Retrieves the trace JSON for each transaction hash in a list.
+
+    With `batch_size` 1, every hash is retrieved with `json_retriever`. With a larger `batch_size`, the hashes are
+    packed into JSON-RPC batches of that size and retrieved with `json_retriever_batch`. Either way, the retry 
+    semantics of `json_retriever` apply per hash. If an executor is given, the requests (or batches) are spread 
+    over its workers and several requests are in flight at once. The results are returned in the order of 
+    `tx_hashes`, regardless of the order in which the node answers.
+
+    Args:
+        tx_hashes (list of str): The transaction hashes to retrieve the traces for.
+        node_url (str): The URL of the blockchain node to query.
+        executor (concurrent.futures.Executor, optional): Executor to run the requests concurrently. 
+                                                          If None, the requests are sent one after another.
+        batch_size (int, optional): Number of hashes per JSON-RPC batch request. Defaults to BATCH_SIZE.
+        trace_cache (TraceCache, optional): Trace store that is checked before the node is queried.
+        stream_threshold (int, optional): Size in bytes above which a response is parsed while streaming.
+        keep_compressed (bool): If True, streamed traces keep their compressed JSON, see `json_retriever`.
+        tracer_config (dict, optional): The tracer options of the requests, see `tracers.tracer_config`.
+
+    Returns:
+        list of tuple: One (JSON response, json_flag) tuple per transaction hash, in input order.
+    """
+    if batch_size > 1:
+        batches = [tx_hashes[i:i + batch_size] for i in range(0, len(tx_hashes), batch_size)]
+        fetch = lambda batch: json_retriever_batch(batch, node_url, trace_cache=trace_cache, stream_threshold=stream_threshold, keep_compressed=keep_compressed, tracer_config=tracer_config)
+    else:
+        batches = [[tx_hash] for tx_hash in tx_hashes]
+        fetch = lambda batch: [json_retriever(batch[0], node_url, trace_cache=trace_cache, stream_threshold=stream_threshold, keep_compressed=keep_compressed, tracer_config=tracer_config)]
+
+    if executor is None:
+        batch_results = [fetch(batch) for batch in batches]
+    else:
+        # Executor.map yields results in the order of the input, not in the order of completion
+        batch_results = list(executor.map(fetch, batches))
+    return [result for batch_result in batch_results for result in batch_result]
+
+
+def tx_to_trace(df_txs_lx, node_url, max_workers=MAX_WORKERS, batch_size=BATCH_SIZE, block_trace_threshold=None, trace_cache=None, chunk_callback=None, block_cache=None, stream_threshold=None, trace_callback=None, tracer_config=TRACER_CONFIG,
+                fetch_workers=FETCH_WORKERS, flatten_workers=FLATTEN_WORKERS, queue_size=QUEUE_SIZE, creations_callback=None):
     """
     Converts a DataFrame of transactions into a DataFrame of transaction traces by retrieving trace data from a blockchain node. 
     This function iterates over each transaction in the input DataFrame, retrieves its trace data from the specified node,
@@ -131,20 +477,49 @@ def tx_to_trace(df_txs_lx, node_url):
                                   the 'hash', 'timeStamp', and 'blockNumber' fields.
         node_url (str): The URL of the Ethereum node from which to retrieve trace data. This URL should point to an 
                         API endpoint capable of returning transaction trace data (have Geth debug functionality, e.g., Geth or Erigon).
+        max_workers (int, optional): Number of trace requests kept in flight against the node. Defaults to MAX_WORKERS.
+        batch_size (int, optional): Number of transaction hashes per JSON-RPC batch request. Defaults to BATCH_SIZE.
+        block_trace_threshold (float, optional): Minimum share of relevant transactions in a block to trace the whole block
+                                                 with debug_traceBlockByNumber instead of tracing single transactions.
+                                                 If None, block tracing is disabled.
+        trace_cache (TraceCache, optional): Trace store that is checked before the node is queried. Traces retrieved
+                                            from the node are added to it.
+        chunk_callback (callable, optional): Called with the DataFrame of each chunk and the number of the chunk. If given,
+                                             the rows are handed over chunk by chunk and not kept in memory.
+        block_cache (BlockHeaderCache, optional): Block header cache used to select the blocks to trace as a whole.
+        stream_threshold (int, optional): Size in bytes above which a trace response is parsed while it is received,
+                                          instead of in memory. If None, all responses are parsed in memory.
+        trace_callback (callable, optional): Called with the raw traces of each chunk before they are flattened, as a list of 
+                                             (hash, timeStamp, blockNumber, JSON response) tuples of the transactions with 
+                                             a valid trace, e.g., to archive them.
+        tracer_config (dict, optional): The tracer options of the trace requests, see `tracers.tracer_config`. The trace
+                                        cache should only hold traces of the same tracer.
+        fetch_workers (int, optional): Number of chunks fetched from the node at the same time. Their requests share the
+                                       `max_workers` requests in flight; with `max_workers` 1, one chunk is fetched at a time.
+        flatten_workers (int, optional): Number of threads that flatten fetched chunks.
+        queue_size (int, optional): Number of chunks that wait between two stages of the pipeline.
+        creations_callback (callable, optional): Called with the CREATE and CREATE2 rows ("type", "from", "to") of each
+                                                 chunk, in order, e.g., to follow CREATE-relations while the level is traced.
 
     Returns:
         pd.DataFrame: A DataFrame containing the traces of the transactions. This includes processed and flattened
                       trace data for each transaction in `df_txs_lx`. The DataFrame is expanded to include detailed
                       trace information such as execution order and potentially nested trace details, depending on the
-                      structure of the returned trace JSON data.
+                      structure of the returned trace JSON data. Empty if `chunk_callback` is given.
 
     Overview:
         The function performs the following steps for each transaction in `df_txs_lx`:
         1. Retrieves the transaction hash and other relevant details from the input DataFrame.
-        2. Makes a request to the specified node URL to fetch the trace data for each transaction hash.
-        3. Processes the retrieved trace data to insert execution order and flatten the JSON structure.
-        4. Compiles the processed trace data into a temporary DataFrame, which is then concatenated to the final
-           DataFrame of transaction traces.
+        2. Makes requests to the specified node URL to fetch the trace data for the transaction hashes of a chunk,
+           with up to `max_workers` requests in flight and `batch_size` hashes per request. Transactions in blocks 
+           selected by `select_dense_blocks` are taken from one trace of the whole block instead.
+        3. Processes the retrieved trace data with `flatten_trace`, which inserts the execution order and flattens
+           the JSON structure into row records in one pass.
+        4. Collects the row records of all transactions in a columnar `TraceBuffer` and builds one DataFrame of 
+           transaction traces from it at the end. With a `chunk_callback`, one DataFrame is built per chunk instead
+           and handed to the callback.
+        Steps 2 to 4 are the stages of a pipeline (see `trace_pipeline`): while a chunk is flattened, the next chunks
+        are fetched, and step 4 handles the chunks in the order of `df_txs_lx`.
         5. Prints progress updates and timing information to the console.
 
     Note:
@@ -152,63 +527,139 @@ def tx_to_trace(df_txs_lx, node_url):
           retrieved, as far as I know it is not used down the line.
         - It uses an 'INCREMENT_FACTOR' (defined at the start of the module) to determine the batch size for 
           processing transactions in chunks. 
-        - The function includes a method for appending execution order to the "from" and "address" fields in the
-          trace JSON which needs refinement.
         - Error handling within the function relies on a 'json_flag' returned by 'json_retriever' to skip transactions
           with faulty JSON data without halting the entire process.
-        - The loop should be implemented with, e.g., iterrows() to loop efficiently.
     """
-    data = []
-    df_trace_lx = pd.DataFrame(data)
+    # Rows of all transactions of the level, column by column; one DataFrame is built from them at the end
+    trace_buffer = TraceBuffer()
+    row_count = 0
     tic = time.time()
     
     c_max = len(df_txs_lx)
-    c_tmp = 1
-    c_tmp_minus = 0
-    loop_round = 0
     increment = math.ceil(c_max / INCREMENT_FACTOR)
-    while c_tmp_minus < c_max: 
-        df_trace_lx_tmp = pd.DataFrame()
-        loop_round += 1 
-    
-        for i in range(c_tmp_minus, c_tmp):
-            tx_hash=str(df_txs_lx.iloc[i]['hash'])
+    # The chunks of the level as (loop number, first row, end row); the first chunk holds one transaction
+    chunks = []
+    c_tmp_minus = 0
+    c_tmp = min(1, c_max)
+    while c_tmp_minus < c_max:
+        chunks.append((len(chunks) + 1, c_tmp_minus, c_tmp))
+        c_tmp_minus = c_tmp
+        c_tmp = min(c_tmp + increment, c_max)
+    # One pool for the whole level, so that the worker threads are reused across chunks
+    executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+
+    # Blocks that are traced as a whole; their relevant traces are kept until the chunk of the transaction is processed
+    dense_blocks = set()
+    if block_trace_threshold is not None and c_max > 0:
+        relevant_hashes = set(df_txs_lx['hash'].astype(str).str.lower())
+        df_txs_uncached = df_txs_lx
+        if trace_cache is not None:
+            # transactions with a stored trace do not count towards tracing a block
+            relevant_hashes -= trace_cache.contains_many(relevant_hashes)
+            df_txs_uncached = df_txs_lx[df_txs_lx['hash'].astype(str).str.lower().isin(relevant_hashes)]
+        dense_blocks = select_dense_blocks(df_txs_uncached, node_url, block_trace_threshold, block_cache) if not df_txs_uncached.empty else set()
+    # Chunks are fetched concurrently; the chunk that first needs a block traces it, the others wait for its future
+    block_futures = {}
+    prefetched_traces = {}
+    block_lock = threading.Lock()
+    # Streamed traces keep their compressed JSON only if it is stored or handed on
+    keep_compressed = trace_cache is not None or trace_callback is not None
+
+    def fetch_block(block_number):
+        block_traces = block_trace_retriever(block_number, node_url, stream_threshold=stream_threshold, keep_compressed=keep_compressed, tracer_config=tracer_config)
+        # only the relevant transactions of a block are kept
+        relevant_traces = {tx_hash: result for tx_hash, result in block_traces.items() if tx_hash in relevant_hashes}
+        if trace_cache is not None:
+            for tx_hash, result in relevant_traces.items():
+                store_trace(trace_cache, tx_hash, result[0])
+        with block_lock:
+            prefetched_traces.update(relevant_traces)
+
+    def fetch_chunk(chunk):
+        # retrieve JSON data for the whole chunk, the results are in the order of df_txs_lx
+        loop_round, c_tmp_minus, c_tmp = chunk
+        tx_hashes = [str(tx_hash) for tx_hash in df_txs_lx['hash'].iloc[c_tmp_minus:c_tmp]]
+        if dense_blocks:
+            chunk_blocks = sorted(set(df_txs_lx['blockNumber'].iloc[c_tmp_minus:c_tmp].astype(int)) & dense_blocks)
+            new_blocks = []
+            with block_lock:
+                for block_number in chunk_blocks:
+                    if block_number not in block_futures:
+                        block_futures[block_number] = executor.submit(fetch_block, block_number) if executor is not None else Future()
+                        new_blocks.append(block_number)
+            if executor is None:
+                for block_number in new_blocks:
+                    try:
+                        fetch_block(block_number)
+                        block_futures[block_number].set_result(None)
+                    except Exception as e:
+                        block_futures[block_number].set_exception(e)
+            for block_number in chunk_blocks:
+                block_futures[block_number].result()
+        with block_lock:
+            trace_results = [prefetched_traces.pop(tx_hash.lower(), None) for tx_hash in tx_hashes]
+        # transactions in sparse blocks (or missing in a block trace) are traced one by one
+        missing = [j for j, result in enumerate(trace_results) if result is None]
+        for j, result in zip(missing, retrieve_traces([tx_hashes[j] for j in missing], node_url, executor, batch_size, trace_cache, stream_threshold, keep_compressed, tracer_config)):
+            trace_results[j] = result
+        return chunk, tx_hashes, trace_results
+
+    def flatten_chunk(fetched):
+        chunk, tx_hashes, trace_results = fetched
+        loop_round, c_tmp_minus, c_tmp = chunk
+        timestamps = df_txs_lx['timeStamp'].iloc[c_tmp_minus:c_tmp].tolist()
+        blockNumbers = df_txs_lx['blockNumber'].iloc[c_tmp_minus:c_tmp].tolist()
+        records = [
+            (tx_hash, timestamp, blockNumber, trace_json_lx)
+            for tx_hash, timestamp, blockNumber, (trace_json_lx, json_flag) in zip(tx_hashes, timestamps, blockNumbers, trace_results) if json_flag
+        ]
+        rows = []
+        for tx_hash, timestamp, blockNumber, trace_json_lx in records:
             functionName="Place holder"#str(df_txs_lx.iloc[i]['functionName'])
-            timestamp=df_txs_lx.iloc[i]['timeStamp']
-            blockNumber = df_txs_lx.iloc[i]['blockNumber']
-            
-            # if (i != 0 and i % 100 == 0) or i == len(df_txs_lx)-1:
-            #     logger.info(f"Transactions for which traces were retrieved: {i+1}")
-
-            # retrieve JSON data
-            trace_json_lx, json_flag = json_retriever(tx_hash, node_url)
-            # json_flag in case something was wrong with the JSON from the server (i.e., json_flag == false), the respective tx hash is skipped. 
-            # corresponding faulty hash is logged already in json_retriever
-            if json_flag == False:
-                continue
-            # insert order of execution
-            trace_json_lx = insert_tracePos(trace_json_lx, trace_pos_counter=[0])
-            # insert position in trace by "depth" of the JSON dictionary (subprocesses) 
-            trace_json_lx = insert_tracePosDepth(trace_json_lx, parent_index="")
-            # insert position in trace by "depth" of the JSON dictionary (subprocesses) 
-            # trace_json_lx = insert_eventPos(trace_json_lx)
-            # flatten the JSON data
-            df_flat_json = pd.DataFrame.from_dict(flatten(trace_json_lx, {}), orient="index").T
-            # flatten nested JSON data
-            df_trace_lx_tmp = flatten_nested(df_flat_json, df_trace_lx_tmp, tx_hash, functionName, timestamp, blockNumber)       
-
+            # insert order of execution and position in trace by "depth", and flatten the JSON data in one pass.
+            # Transactions with a faulty JSON from the server (json_flag == False) are skipped; their hash is logged in json_retriever.
+            rows.extend(flatten_trace(trace_json_lx, tx_hash, functionName, timestamp, blockNumber))
+        return chunk, records if trace_callback is not None else None, rows
+
+    def persist_chunk(flattened):
+        nonlocal row_count
+        chunk, records, rows = flattened
+        loop_round, c_tmp_minus, c_tmp = chunk
+        if trace_callback is not None:
+            trace_callback(records)
+        if creations_callback is not None:
+            creation_rows = [row for row in rows if row.get("type") in ("CREATE", "CREATE2")]
+            creations_callback(pd.DataFrame(creation_rows, columns=["type", "from", "to"]))
+        trace_buffer.extend(rows)
+        if chunk_callback is not None:
+            row_count += len(trace_buffer)
+            chunk_callback(trace_buffer.to_frame(last_columns=TRACE_TX_COLUMNS), loop_round)
+            trace_buffer.clear()
         logger.info(f"TRACE REPLAY: {c_tmp} transactions of {len(df_txs_lx)} transactions; loop number: {loop_round}")
 
-        c_tmp_minus = c_tmp
-        c_tmp+=increment
-        df_trace_lx = pd.concat([df_trace_lx, df_trace_lx_tmp], axis=0)
-        if c_tmp > c_max:
-            c_tmp = c_max
+    # Chunks are fetched from the node while earlier chunks are flattened and handed over, in order
+    try:
+        run_pipeline(chunks, [
+            # without a pool, the requests of one chunk are sent one by one, and so are the chunks
+            Stage("fetch", fetch_chunk, workers=fetch_workers if executor is not None else 1),
+            Stage("flatten", flatten_chunk, workers=flatten_workers),
+            Stage("persist", persist_chunk, ordered=True)
+        ], queue_size=queue_size, name="Trace pipeline")
+    finally:
+        if executor is not None:
+            executor.shutdown()
     
+    # transaction-level columns last, as in the per-transaction flattening
+    df_trace_lx = trace_buffer.to_frame(last_columns=TRACE_TX_COLUMNS)
+    trace_buffer.clear()
+    row_count += len(df_trace_lx)
+
     toc = time.time()
 
     logger.debug(f"SPEEDTEST: Time to recompute and transform transaction traces: {toc - tic}")
-    logger.info(f"Number of traces for this level: {len(df_trace_lx)}")
+    logger.info(f"Number of traces for this level: {row_count}")
+    if trace_cache is not None:
+        logger.info(f"Trace cache: {trace_cache.stats()}")
 
     df_trace_lx.reset_index(inplace=True, drop=True)
     
@@ -347,6 +798,88 @@ def flatten(trace_json_lx, new_trace_json_lx={}):
             new_trace_json_lx[key] = value
     return new_trace_json_lx
 
+def flatten_trace(trace_json_lx, tx_hash, functionName, timestamp, blockNumber):
+    """
+    Flattens a callTracer result into row records by walking the trace tree once, iteratively.
+
+    The function yields the same rows as `insert_tracePos`, `insert_tracePosDepth`, `flatten`, and `flatten_nested` 
+    combined, without building intermediate DataFrames:
+        - 'tracePos' numbers the calls in depth-first order; the logs of a call follow all of its nested calls.
+        - 'tracePosDepth' is the position in the tree, e.g., "1.2.3"; the logs of a call are numbered after its calls.
+        - The rows are ordered level by level: the calls of nesting level n are followed by the logs emitted at 
+          level n-1, each in the order of the trace.
+
+    A result that was parsed while streaming (`StreamedTrace`) holds these rows already; its rows are taken over.
+
+    Args:
+        trace_json_lx (dict): The JSON response of debug_traceTransaction (or its "result").
+        tx_hash (str): The transaction hash, attached to every row.
+        functionName (str): The function name, attached to every row.
+        timestamp (str | int): The timestamp of the transaction, attached to every row.
+        blockNumber (str | int): The block number of the transaction, attached to every row.
+
+    Returns:
+        list of dict: One record per call and log in the trace.
+    """
+    root = trace_json_lx.get("result", trace_json_lx)
+    tx_values = {"hash": tx_hash, "functionName": functionName, "timeStamp": timestamp, "blockNumber": blockNumber}
+
+    if isinstance(root, StreamedTrace):
+        rows = root.take_rows()
+        for row in rows:
+            for key in DROPPED_TRACE_KEYS:
+                row.pop(key, None)
+        if rows:
+            # like flatten(): only keep plain values of the top-level call (the first row)
+            rows[0] = flatten(rows[0], {})
+        for row in rows:
+            row.update(tx_values)
+        return rows
+
+    # The rows of nesting level n are the calls at level n, followed by the logs emitted at level n-1
+    calls_by_level = []
+    logs_by_level = []
+    trace_pos = 0
+    # The stack holds calls to visit and markers to number the logs of a call once all of its nested calls are numbered
+    stack = [("call", root, "1", 0)]
+    while stack:
+        kind, item, trace_pos_depth, level = stack.pop()
+        nested_calls = item.get("calls") or []
+
+        if kind == "call":
+            trace_pos += 1
+            if level == 0:
+                # like flatten(): only keep plain values of the top-level call
+                row = flatten({key: value for key, value in item.items() if key not in DROPPED_TRACE_KEYS}, {})
+            else:
+                row = {key: value for key, value in item.items() if key not in DROPPED_TRACE_KEYS}
+            row["tracePos"] = trace_pos
+            row["tracePosDepth"] = trace_pos_depth
+            row.update(tx_values)
+            if len(calls_by_level) == level:
+                calls_by_level.append([])
+                logs_by_level.append([])
+            calls_by_level[level].append(row)
+
+            if item.get("logs"):
+                stack.append(("logs", item, trace_pos_depth, level))
+            for j in range(len(nested_calls), 0, -1):
+                if isinstance(nested_calls[j - 1], dict):
+                    stack.append(("call", nested_calls[j - 1], f"{trace_pos_depth}.{j}", level + 1))
+        else:
+            if len(logs_by_level) == level + 1:
+                calls_by_level.append([])
+                logs_by_level.append([])
+            for j, log in enumerate(item["logs"], start=1):
+                trace_pos += 1
+                row = {key: value for key, value in log.items() if key not in DROPPED_TRACE_KEYS}
+                row["tracePos"] = trace_pos
+                row["tracePosDepth"] = f"{trace_pos_depth}.{len(nested_calls) + j}"
+                row.update(tx_values)
+                logs_by_level[level + 1].append(row)
+
+    return [row for calls, logs in zip(calls_by_level, logs_by_level) for row in calls + logs]
+
 # Alternatively (but missing the first internal transaction):
 # df_normalized_from_json = pd.json_normalize(trace_json_l1["result"]["calls"])
 
@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import time
+import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport
+from src.trace_based_logging.raw_trace_retriever import tracers
+from src.trace_based_logging.raw_trace_retriever.trace_transformation import flatten_trace, is_valid_trace_response
+
+"""
+This module compares the tracer modes on a node: it traces the same transactions with each mode and measures the
+size of the responses, the time of the requests (tracing on the node and transfer), the time of parsing and
+flattening, and the number of rows. JavaScript tracers send less data than the native callTracer but are
+interpreted by the node, so whether they pay off depends on the node and the network between node and client.
+
+Usage:
+    python -m src.trace_based_logging.raw_trace_retriever.tracer_benchmark <tx_hash> [<tx_hash> ...]
+
+The node, the JavaScript tracer file, and the tracer timeout are read from config.json.
+
+Functions:
+    benchmark_tracers(tx_hashes, node_url, modes=TRACER_MODES, js_path=None, timeout=None): Measures the tracer modes.
+"""
+
+logger = setup_logging()
+
+
+def benchmark_tracers(tx_hashes, node_url, modes=tracers.TRACER_MODES, js_path=None, timeout=None):
+    """
+    Traces the transactions once per tracer mode, one request at a time, and measures each mode.
+
+    Args:
+        tx_hashes (list of str): The transaction hashes to trace.
+        node_url (str): The URL of the node.
+        modes (iterable of str): The tracer modes to compare.
+        js_path (str, optional): File with the source of the JavaScript tracer for the 'js' mode.
+        timeout (str, optional): Tracer timeout of the node, e.g., "60s".
+
+    Returns:
+        pd.DataFrame: One row per mode with the number of traced transactions and errors, the response size in bytes,
+                      the request and the parse time in seconds, and the number of rows.
+    """
+    results = []
+    for mode in modes:
+        tracer_config = tracers.tracer_config(mode, js_path, timeout)
+        result = {"mode": mode, "transactions": 0, "errors": 0, "bytes": 0, "request_seconds": 0.0, "parse_seconds": 0.0, "rows": 0}
+        for tx_hash in tx_hashes:
+            payload = {"jsonrpc": "2.0", "method": "debug_traceTransaction", "params": [tx_hash, tracer_config], "id": 1}
+            start = time.perf_counter()
+            try:
+                response = transport.post(node_url, json=payload)
+                body = response.content
+            except Exception as e:
+                logger.warning(f"Tracer benchmark: request for {tx_hash} in mode {mode} failed: {e}")
+                result["errors"] += 1
+                continue
+            result["request_seconds"] += time.perf_counter() - start
+            result["bytes"] += len(body)
+            start = time.perf_counter()
+            try:
+                response_json = json.loads(body)
+            except ValueError:
+                response_json = None
+            if not is_valid_trace_response(response_json):
+                result["errors"] += 1
+                continue
+            rows = flatten_trace(response_json, tx_hash, None, None, None)
+            result["parse_seconds"] += time.perf_counter() - start
+            result["transactions"] += 1
+            result["rows"] += len(rows)
+        logger.info(f"Tracer benchmark: {result}")
+        results.append(result)
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    from src.trace_based_logging.config import load_config, build_node_url
+    dir_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+    config = load_config(os.path.join(dir_path, 'config.json'))
+    transport.configure(config)
+    df_results = benchmark_tracers(sys.argv[1:], build_node_url(config), js_path=config["tracer_js_path"], timeout=config["tracer_timeout"])
+    print(df_results.to_string(index=False))
@@ -0,0 +1,123 @@
+import os
+
+"""
+This module provides the tracer configurations sent with debug_traceTransaction and debug_traceBlockByNumber. The
+tracer mode selects how much of each transaction the node returns:
+
+    - 'full': The native callTracer with logs, i.e., all calls and events. This is what the pipeline needs by default.
+    - 'no_logs': The native callTracer without logs, for runs that do not output events. The responses are smaller,
+      and the node does not collect the logs.
+    - 'top_call': The native callTracer with `onlyTopCall`, i.e., only the top-level call of each transaction and its
+      logs, e.g., for a quick discovery pass. Nested calls, including nested CREATE-relations, are missing.
+    - 'js': A custom JavaScript tracer. By default, the bundled `TRIMMED_JS_TRACER`, which returns the callTracer
+      structure with only the fields the pipeline uses. JavaScript tracers are interpreted by the node and can cost
+      more node CPU than they save in payload; compare them with `tracer_benchmark` before switching.
+
+Traces of different modes are not interchangeable, so stores of traces (the trace cache and the trace archive) are
+kept per mode, see `tracer_store_path`.
+
+Functions:
+    tracer_config(mode, js_path=None, timeout=None): Returns the tracer configuration of a mode.
+    tracer_store_path(path, mode): Returns the path of a trace store for a mode.
+
+Constants:
+    TRACER_MODES (tuple): The tracer modes.
+    TRIMMED_JS_TRACER (str): JavaScript tracer that returns calls and logs with only the fields the pipeline uses.
+"""
+
+TRACER_MODES = ("full", "no_logs", "top_call", "js")
+
+# Same structure and hex encoding as the callTracer; drops everything the flattening and decoding do not use
+# (e.g., revertReason). The logs of reverted calls are dropped, as by the callTracer.
+TRIMMED_JS_TRACER = """{
+    stack: [{calls: [], logs: []}],
+    hex: function(value) { return "0x" + value.toString(16); },
+    word: function(value) { var text = value.toString(16); while (text.length < 64) { text = "0" + text; } return "0x" + text; },
+    enter: function(frame) {
+        var call = {type: frame.getType(), from: toHex(frame.getFrom()), to: toHex(frame.getTo()), gas: this.hex(frame.getGas()),
+                    input: toHex(frame.getInput()), calls: [], logs: []};
+        if (frame.getValue() !== undefined) { call.value = this.hex(frame.getValue()); }
+        this.stack.push(call);
+    },
+    exit: function(result) {
+        var call = this.stack.pop();
+        call.gasUsed = this.hex(result.getGasUsed());
+        var output = result.getOutput();
+        if (output !== undefined && output.length > 0) { call.output = toHex(output); }
+        if (result.getError() !== undefined) { call.error = result.getError(); this.clearLogs(call); }
+        this.trim(call);
+        this.stack[this.stack.length - 1].calls.push(call);
+    },
+    step: function(log, db) {
+        var op = log.op.toNumber();
+        if (op < 0xa0 || op > 0xa4) { return; }
+        var offset = log.stack.peek(0).valueOf(), size = log.stack.peek(1).valueOf(), topics = [];
+        for (var i = 0; i < op - 0xa0; i++) { topics.push(this.word(log.stack.peek(2 + i))); }
+        this.stack[this.stack.length - 1].logs.push({address: toHex(log.contract.getAddress()), topics: topics,
+                                                    data: toHex(log.memory.slice(offset, offset + size))});
+    },
+    fault: function(log, db) {},
+    clearLogs: function(call) {
+        call.logs = [];
+        for (var i = 0; i < call.calls.length; i++) { this.clearLogs(call.calls[i]); }
+    },
+    trim: function(call) {
+        if (call.calls.length === 0) { delete call.calls; }
+        if (call.logs.length === 0) { delete call.logs; }
+    },
+    result: function(ctx, db) {
+        var top = this.stack[0];
+        var call = {type: ctx.type, from: toHex(ctx.from), to: toHex(ctx.to), value: this.hex(ctx.value), gas: this.hex(ctx.gas),
+                    gasUsed: this.hex(ctx.gasUsed), input: toHex(ctx.input), calls: top.calls, logs: top.logs};
+        if (ctx.output !== undefined && ctx.output.length > 0) { call.output = toHex(ctx.output); }
+        if (ctx.error !== undefined) { call.error = ctx.error; this.clearLogs(call); }
+        this.trim(call);
+        return call;
+    }
+}"""
+
+
+def tracer_config(mode, js_path=None, timeout=None):
+    """
+    Returns the tracer configuration (the second parameter of debug_traceTransaction) of a tracer mode.
+
+    Args:
+        mode (str): One of TRACER_MODES.
+        js_path (str, optional): File with the source of a JavaScript tracer for the 'js' mode. If None, the bundled
+                                 TRIMMED_JS_TRACER is used.
+        timeout (str, optional): Tracer timeout of the node, e.g., "60s". If None, the default of the node applies.
+
+    Returns:
+        dict: The tracer configuration.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode == "full":
+        config = {"tracer": "callTracer", "tracerConfig": {"withLog": True}}
+    elif mode == "no_logs":
+        config = {"tracer": "callTracer", "tracerConfig": {"withLog": False}}
+    elif mode == "top_call":
+        config = {"tracer": "callTracer", "tracerConfig": {"withLog": True, "onlyTopCall": True}}
+    elif mode == "js":
+        if js_path:
+            with open(js_path, "r") as file:
+                config = {"tracer": file.read()}
+        else:
+            config = {"tracer": TRIMMED_JS_TRACER}
+    else:
+        raise ValueError(f"Unknown tracer mode: {mode}. Expected one of {', '.join(TRACER_MODES)}")
+    if timeout:
+        config["timeout"] = timeout
+    return config
+
+
+def tracer_store_path(path, mode):
+    """
+    Returns the path of a trace store (a file or a folder) for a tracer mode: the path itself for 'full', and the path
+    with the mode appended to its name otherwise, e.g., "trace_cache_no_logs.sqlite".
+    """
+    if not path or mode == "full":
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}_{mode}{extension}"
@@ -0,0 +1,295 @@
+import time
+import random
+import threading
+import requests
+from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport
+
+"""
+This module provides the shared request controller for the JSON-RPC requests of the retrieval modules. The controller
+adapts the number of requests in flight to the node (AIMD): the limit grows by about one request per round trip
+while requests succeed at a steady latency, and it is halved when requests fail (connection errors, timeouts,
+HTTP 429 or 5xx) or when the recent latency rises well above the long-term latency. Threads beyond the limit wait.
+
+After several consecutive failures, the circuit breaker opens: requests fail right away with a `CircuitOpenError`
+instead of reaching the node, until a single probe request succeeds after the open period. The open period doubles
+with every failed probe. Retry loops wait with jittered exponential backoff (`RequestController.backoff`), so that
+threads that failed together do not retry together.
+
+The controller for the node is configured once at start-up with `configure(config)` and shared via `get_controller()`.
+
+Classes:
+    CircuitOpenError: Raised for requests while the circuit breaker is open.
+    RequestController: Adaptive concurrency limit, circuit breaker, and backoff for one service.
+
+Functions:
+    backoff_delay(attempt, base, cap): Returns a jittered exponential backoff delay.
+    is_overload_error(response_json): Checks whether a JSON-RPC response reports an overloaded node.
+    configure(config): Creates the node controller from the configuration.
+    get_controller(): Returns the shared node controller.
+
+Constants:
+    INITIAL_LIMIT (int): Default initial number of requests in flight.
+    MAX_LIMIT (int): Default maximum number of requests in flight.
+    DECREASE_FACTOR (float): Factor applied to the limit on congestion.
+    LATENCY_FACTOR (float): Recent latency above LATENCY_FACTOR times the long-term latency counts as congestion.
+    FAILURE_THRESHOLD (int): Default number of consecutive failures that open the circuit.
+    OPEN_SECONDS (float): Default initial open period of the circuit in seconds.
+    MAX_OPEN_SECONDS (float): Maximum open period of the circuit in seconds.
+    BACKOFF_BASE (float): Base delay of the backoff in seconds.
+    BACKOFF_MAX (float): Maximum delay of the backoff in seconds.
+    OVERLOAD_MESSAGES (tuple): Parts of JSON-RPC error messages that indicate an overloaded node.
+"""
+
+logger = setup_logging()
+
+INITIAL_LIMIT = 8
+MAX_LIMIT = 64
+DECREASE_FACTOR = 0.5
+LATENCY_FACTOR = 3.0
+FAILURE_THRESHOLD = 5
+OPEN_SECONDS = 10.0
+MAX_OPEN_SECONDS = 300.0
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+OVERLOAD_MESSAGES = ("timeout", "timed out", "deadline", "too many", "busy", "rate limit", "capacity")
+# Weights of a new latency sample in the recent and in the long-term moving average
+SHORT_SMOOTHING = 0.1
+LONG_SMOOTHING = 0.01
+# Number of latency samples before the latency is used as a congestion signal
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised for a request while the circuit breaker is open. It is a ConnectionError, so that the retry loops handle
+    it like an unreachable node.
+    """
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """
+    Returns a backoff delay with "full jitter": a random delay between 0 and min(cap, base * 2 ** attempt).
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_overload_error(response_json):
+    """
+    Checks whether a JSON-RPC response (or the first error of a batch response) reports an overloaded node, e.g.,
+    a tracer timeout or a request limit.
+    """
+    if isinstance(response_json, list):
+        response_json = next((entry for entry in response_json if isinstance(entry, dict) and "error" in entry), None)
+    if not isinstance(response_json, dict) or not isinstance(response_json.get("error"), dict):
+        return False
+    message = str(response_json["error"].get("message", "")).lower()
+    return any(part in message for part in OVERLOAD_MESSAGES)
+
+
+class RequestController:
+    """
+    Adaptive concurrency limit (AIMD), circuit breaker, and jittered backoff for the requests to one service. The
+    controller is shared by all threads that send requests to the service.
+
+    Args:
+        name (str): Name of the service, for the log.
+        initial_limit (int): Initial number of requests in flight.
+        min_limit (int): Minimum number of requests in flight.
+        max_limit (int): Maximum number of requests in flight.
+        failure_threshold (int): Number of consecutive failures that open the circuit.
+        open_seconds (float): Initial open period of the circuit in seconds.
+    """
+
+    def __init__(self, name, initial_limit=INITIAL_LIMIT, min_limit=1, max_limit=MAX_LIMIT, failure_threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.failure_threshold = failure_threshold
+        self.initial_open_seconds = open_seconds
+        self.open_seconds = open_seconds
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.short_latency = None
+        self.long_latency = None
+        self.latency_samples = 0
+        self.last_decrease = 0.0
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.open_until = 0.0
+        self.probe_in_flight = False
+
+    def acquire(self):
+        """
+        Waits for a free slot within the current limit.
+
+        Returns:
+            bool: True if the request is the probe of a half-open circuit.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe in flight.
+        """
+        with self.condition:
+            while True:
+                if self.state == "open":
+                    if time.monotonic() < self.open_until:
+                        raise CircuitOpenError(f"{self.name}: circuit open for another {self.open_until - time.monotonic():.1f}s")
+                    self.state = "half-open"
+                if self.state == "half-open":
+                    if self.probe_in_flight:
+                        raise CircuitOpenError(f"{self.name}: circuit half-open, waiting for the probe request")
+                    self.probe_in_flight = True
+                    self.in_flight += 1
+                    return True
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return False
+                self.condition.wait()
+
+    def decrease(self, now):
+        # One decrease per round trip, so that the failures of requests that were in flight together count once
+        if now - self.last_decrease > (self.short_latency or 0):
+            self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+            self.last_decrease = now
+
+    def release(self, probe, latency=None, failed=False):
+        """
+        Frees the slot of a request and adapts the limit and the circuit to its outcome.
+
+        Args:
+            probe (bool): The return value of `acquire`.
+            latency (float, optional): The latency of a successful request in seconds.
+            failed (bool): True if the request failed because of the node or the connection.
+        """
+        with self.condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            if probe:
+                self.probe_in_flight = False
+            if failed:
+                self.consecutive_failures += 1
+                self.decrease(now)
+                # Only the failure that opens the circuit, or a failed probe, sets the open period; requests that were
+                # already in flight when the circuit opened do not extend it
+                if probe or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+                    logger.warning(f"{self.name}: {self.consecutive_failures} consecutive failures, circuit opened for {self.open_seconds:.1f}s")
+                    self.state = "open"
+                    self.open_until = now + self.open_seconds
+                    self.open_seconds = min(MAX_OPEN_SECONDS, self.open_seconds * 2)
+            else:
+                self.consecutive_failures = 0
+                if self.state == "half-open":
+                    logger.info(f"{self.name}: probe request succeeded, circuit closed")
+                    self.state = "closed"
+                    self.open_seconds = self.initial_open_seconds
+                if latency is not None:
+                    self.short_latency = latency if self.short_latency is None else (1 - SHORT_SMOOTHING) * self.short_latency + SHORT_SMOOTHING * latency
+                    self.long_latency = latency if self.long_latency is None else (1 - LONG_SMOOTHING) * self.long_latency + LONG_SMOOTHING * latency
+                    self.latency_samples += 1
+                if self.latency_samples >= MIN_LATENCY_SAMPLES and self.short_latency > LATENCY_FACTOR * self.long_latency:
+                    self.decrease(now)
+                else:
+                    # Additive increase: about one more request in flight per round trip of the whole window
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    @staticmethod
+    def is_failed_response(response):
+        """
+        Checks whether an HTTP response is a failure of the node (HTTP 429 or 5xx) rather than an answer.
+        """
+        return response.status_code == 429 or response.status_code >= 500
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls a function that sends one request (e.g., a Web3 call) within the limit of the controller. Request 
+        exceptions count as failures of the node.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        probe = self.acquire()
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except requests.exceptions.RequestException:
+            self.release(probe, failed=True)
+            raise
+        except Exception:
+            self.release(probe)
+            raise
+        self.release(probe, time.monotonic() - start)
+        return result
+
+    def post(self, url, **kwargs):
+        """
+        Sends a POST request through the transport within the limit of the controller.
+
+        Returns:
+            requests.Response: The response. Responses with HTTP 429 or 5xx count as failures of the node.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            requests.exceptions.RequestException: If the request fails.
+        """
+        probe = self.acquire()
+        start = time.monotonic()
+        try:
+            response = transport.post(url, **kwargs)
+        except requests.exceptions.RequestException:
+            self.release(probe, failed=True)
+            raise
+        except Exception:
+            self.release(probe)
+            raise
+        failed = self.is_failed_response(response)
+        self.release(probe, None if failed else time.monotonic() - start, failed)
+        return response
+
+    def backoff(self, attempt):
+        """
+        Sleeps for a jittered exponential backoff delay before the next attempt; at least until the circuit is
+        half-open again.
+        """
+        delay = backoff_delay(attempt)
+        with self.condition:
+            if self.state == "open":
+                delay = max(delay, self.open_until - time.monotonic() + random.uniform(0, BACKOFF_BASE))
+        time.sleep(delay)
+
+    def stats(self):
+        with self.condition:
+            return {"limit": round(self.limit, 1), "in_flight": self.in_flight, "state": self.state,
+                    "latency": round(self.short_latency, 3) if self.short_latency is not None else None}
+
+
+controller = None
+lock = threading.Lock()
+
+
+def configure(config):
+    """
+    Creates the shared controller for the Ethereum node from the (flat) configuration.
+    """
+    global controller
+    with lock:
+        controller = RequestController(
+            "node", initial_limit=config.get("node_initial_concurrency") or INITIAL_LIMIT,
+            max_limit=config.get("node_max_concurrency") or MAX_LIMIT,
+            failure_threshold=config.get("circuit_failure_threshold") or FAILURE_THRESHOLD,
+            open_seconds=config.get("circuit_open_seconds") or OPEN_SECONDS
+        )
+    logger.info(f"Request controller: {controller.stats()}")
+
+
+def get_controller():
+    """
+    Returns the shared controller for the Ethereum node; a controller with the default settings if `configure` was not
+    called.
+    """
+    global controller
+    with lock:
+        if controller is None:
+            controller = RequestController("node")
+        return controller
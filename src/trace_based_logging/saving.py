@@ -16,7 +16,13 @@ def save_trace_data(config, state, dir_path):
     base_contract = state["base_contract"]
     csv_path = os.path.join(dir_path, "resources", config["log_folder"], "extraction", f"df_trace_tree_{base_contract}_{config['min_block']}_{config['max_block']}.csv")
     pkl_path = os.path.join(dir_path, "resources", config["log_folder"], "extraction", f"df_trace_tree_{base_contract}_{config['min_block']}_{config['max_block']}.pkl")
-    state["trace_tree"].to_csv(csv_path)
+    if state.get("trace_partitions"):
+        # The CSV is written partition by partition. The pickle holds the combined frame, which decoding works on, so
+        # from here on the whole trace tree is in memory again; spilling only bounds the memory of the extraction
+        state["trace_partitions"].write_csv(csv_path)
+        state["trace_tree"] = state["trace_partitions"].read_all()
+    else:
+        state["trace_tree"].to_csv(csv_path)
     state["trace_tree"].to_pickle(pkl_path)
 
     txt_path = os.path.join(dir_path, "resources", config["log_folder"], "extraction", "contracts_dapp_{base_contract}_{config['min_block']}_{config['max_block']}.txt")
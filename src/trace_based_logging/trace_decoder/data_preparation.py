@@ -5,10 +5,12 @@ import datetime
 import time
 import requests
 import json
-from web3 import Web3, HTTPProvider
+from web3 import Web3
 import os
 import pickle
 from src.trace_based_logging.logging_config import setup_logging
+from src.trace_based_logging import transport
+from src.trace_based_logging.raw_trace_retriever.etherscan_client import EtherscanClient
 from . import event_decoder
 
 
@@ -230,35 +232,39 @@ def convert_hex_to_int(df_log, list_of_cols=["gas", "gasUsed", "callvalue"]):
     return df_log
 
 
-def create_abi_dict(addresses, etherscan_api_key, abi_path):
+def create_abi_dict(addresses, etherscan_api_key, abi_path, client=None, return_non_verified=False):
     """
     Retrieves the ABI (Application Binary Interface) for a list of contract addresses from Etherscan and categorizes them
     into verified and non-verified based on the availability of their source code.
 
     Args:
         addresses (list or set): A collection of contract addresses for which to retrieve the ABIs.
+        etherscan_api_key (str): The API key for accessing Etherscan's API service.
+        abi_path (str): Path of an existing ABI dictionary; if it exists, it is loaded instead.
+        client (EtherscanClient, optional): The shared, rate-limited Etherscan client. If None, a client is created.
+        return_non_verified (bool): If True, the addresses that Etherscan reported as not verified are returned as well.
 
     Returns:
-        tuple: A tuple containing three elements:
-            - dict_abi (dict): A dictionary mapping contract addresses to their ABIs for contracts with verified source code.
-            - non_verified_addresses (set): A set containing contract addresses without verified source code.
-            - verified_addresses (set): A set containing contract addresses with verified source code.
+        dict: A dictionary mapping contract addresses to their ABIs for contracts with verified source code.
+        set: Only if `return_non_verified`: the addresses that Etherscan reported as not verified. Addresses whose 
+             request failed are in neither the dictionary nor the set.
 
     Overview:
-        The function iterates through each provided contract address, making up to three attempts to retrieve the ABI from
-        the Etherscan API. If the source code for a contract address is not verified, the address is added to the 
-        `non_verified_addresses` set. If the source code is verified, the ABI is parsed from the API response and stored 
-        in the `dict_abi` dictionary with the contract address as the key. The function also logs the progress of ABI 
-        retrieval, including the number of addresses processed and the count of verified versus non-verified addresses.
+        The ABIs of the provided contract addresses are requested concurrently through the Etherscan client, which 
+        limits the request rate and retries failed and rate-limited requests with exponential backoff. If the source 
+        code for a contract address is not verified, the address is added to the `non_verified_addresses` set. If the 
+        source code is verified, the ABI is parsed from the API response and stored in the `dict_abi` dictionary with 
+        the contract address as the key. The function also logs the progress of ABI retrieval, including the number of 
+        addresses processed and the count of verified versus non-verified addresses.
 
     Notes:
         - The function assumes that the Etherscan API's response structure is consistent and that an ABI can be directly
           parsed from the `result` field of a successful API response.
-        - Error handling is implemented via retry logic, with a brief pause between attempts. However, the function logs
-          a generic message upon failure without raising an exception, which might require refinement for better error 
-          management and reporting.
+        - Addresses whose ABI could not be retrieved after all attempts are logged and treated like addresses without 
+          verified source code.
     """
    
+    non_verified_addresses = set()
     try:
         with open(abi_path, 'rb') as file:
             dict_abi = pickle.load(file)
@@ -268,42 +274,27 @@ def create_abi_dict(addresses, etherscan_api_key, abi_path):
         if not isinstance(addresses, list):
             raise ValueError("The function input addresses must be a list.")
 
+        if client is None:
+            client = EtherscanClient(etherscan_api_key, max_attempts=MAX_API_RETRIES)
+
+        def fetch_abi(contract_address_tmp):
+            try:
+                return client.get_abi(contract_address_tmp)
+            except Exception as e:
+                logger.error(f"ABI could not be retrieved for {contract_address_tmp}: {e}")
+                return None
+
         dict_abi = {}
-        non_verified_addresses = set()
         verified_addresses = set()
         f = 0
         
-        for contract_address_tmp in addresses: 
-            attempts = 0
-            # Three attempts to retrieve the ABI from the Etherscan API
-            while attempts < MAX_API_RETRIES:
-                try: 
-                    api_key = etherscan_api_key
-                    headers = {'Content-type': 'application/json'}
-                    parameters = {
-                        "module": "contract",
-                        "action": "getabi",
-                        "address": contract_address_tmp,
-                        "apikey": api_key
-                    }    
-                    response_API = requests.get('https://api.etherscan.io/api', parameters, headers=headers)
-                    response_json = response_API.json()
-                    break
-                # Inexplicit exception
-                except:
-                    attempts += 1
-                    
-                    logger.error(f"{str(attempts)} attempt(s) failed. Was the library 'requests' imported? {contract_address_tmp}. Retrying...")
-                    
-                    time.sleep(2)
-                    response_json = {"result:"}
-            
-            # check if the key "result" is in the JSON response, if not retry, then skip
-            
-            # if the address has no verified source code, save the address 
-            if response_json["result"] == "Contract source code not verified":
+        for contract_address_tmp, response_json in zip(addresses, client.map(fetch_abi, addresses)): 
+            # if the address has no verified source code (or no response), save the address 
+            if response_json is None or response_json["result"] == "Contract source code not verified":
                 f += 1
-                non_verified_addresses.add(contract_address_tmp)
+                # a failed request says nothing about the source code of the address
+                if response_json is not None:
+                    non_verified_addresses.add(contract_address_tmp)
             # if the address has verified source code, save the ABI in a dictionary
             else:
                 abi = json.loads(response_json["result"])
@@ -311,11 +302,13 @@ def create_abi_dict(addresses, etherscan_api_key, abi_path):
                 verified_addresses.add(contract_address_tmp)
                 dict_abi[contract_address_tmp] = abi
             
-            logger.info(f"ABI dictionary: {len(verified_addresses)+len(non_verified_addresses)} of {len(addresses)} addresses. Number of valid ABIs: {len(dict_abi)}")
+            logger.info(f"ABI dictionary: {len(verified_addresses)+f} of {len(addresses)} addresses. Number of valid ABIs: {len(dict_abi)}")
         
         logger.info(f"{len(dict_abi)} contract ABI(s) retrieved. {f} contract(s) without verified ABI(s)")
     
-    return dict_abi#, non_verified_addresses, verified_addresses
+    if return_non_verified:
+        return dict_abi, non_verified_addresses
+    return dict_abi
 
 def decode_events(df_log, dict_abi):
     """
@@ -756,7 +749,7 @@ def process_abi(abi, contract_address_tmp, node_url):
         abi = abi.replace("False", "false")
         abi = abi.replace("True", "true")
 
-        w3 = Web3(Web3(HTTPProvider(node_url)))
+        w3 = transport.get_web3(node_url)
         if not w3.isConnected():
                 raise ConnectionError(f"Unable to connect to node at {node_url}")
 
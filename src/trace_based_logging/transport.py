@@ -0,0 +1,149 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from src.trace_based_logging.logging_config import setup_logging
+
+"""
+This module provides the shared transport layer of the package. All HTTP requests (JSON-RPC requests to the 
+Ethereum node and Etherscan API requests) go through one pooled, keep-alive `requests.Session`, so that 
+connections are reused instead of opened per request. All Web3 instances are built here as well: they share the 
+session for HTTP, or use an IPC or WebSocket provider for a local node.
+
+If several node URLs are configured, the requests for the node URL are spread across the nodes by a `NodePool` 
+(see node_pool.py), with failover and hedged requests; Web3 instances then use a `NodePoolProvider`.
+
+The transport is configured once at start-up with `configure(config)`; until then, the defaults below apply.
+
+Functions:
+    configure(config): Applies the transport settings of the configuration.
+    get_session(): Returns the shared session.
+    post(url, **kwargs): Sends a POST request through the shared session.
+    get(url, params=None, **kwargs): Sends a GET request through the shared session.
+    get_web3(node_url): Returns a shared Web3 instance for the node.
+    get_node_pool(): Returns the node pool, or None if a single node is configured.
+
+Constants:
+    POOL_CONNECTIONS (int): Default number of connection pools (hosts) kept by the session.
+    POOL_MAXSIZE (int): Default number of keep-alive connections per host.
+    CONNECT_TIMEOUT (float): Default connect timeout in seconds.
+    READ_TIMEOUT (float): Default read timeout in seconds. Traces of large transactions can take minutes.
+"""
+
+logger = setup_logging()
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 32
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 300
+
+settings = {
+    "pool_connections": POOL_CONNECTIONS,
+    "pool_maxsize": POOL_MAXSIZE,
+    "timeout": (CONNECT_TIMEOUT, READ_TIMEOUT),
+    "node_provider": "http",
+    "node_ipc_path": None,
+    "node_ws_url": None,
+}
+session = None
+web3_instances = {}
+node_pool = None
+node_pool_url = None
+lock = threading.RLock()
+
+
+def configure(config):
+    """
+    Applies the transport settings of the (flat) configuration and drops existing sessions and Web3 instances.
+
+    Args:
+        config (dict): The configuration, see `config.transform_config`.
+    """
+    global session, node_pool, node_pool_url
+    with lock:
+        settings["pool_connections"] = config.get("pool_connections") or POOL_CONNECTIONS
+        settings["pool_maxsize"] = config.get("pool_maxsize") or POOL_MAXSIZE
+        settings["timeout"] = (config.get("connect_timeout") or CONNECT_TIMEOUT, config.get("read_timeout") or READ_TIMEOUT)
+        settings["node_provider"] = config.get("node_provider") or "http"
+        settings["node_ipc_path"] = config.get("node_ipc_path")
+        settings["node_ws_url"] = config.get("node_ws_url")
+        if session is not None:
+            session.close()
+        session = None
+        web3_instances.clear()
+        if node_pool is not None:
+            node_pool.close()
+        node_pool = None
+        node_pool_url = None
+        if config.get("node_urls"):
+            from src.trace_based_logging.config import build_node_url
+            from src.trace_based_logging.node_pool import NodePool
+            # The configured node URL addresses the whole pool; it is the first node of the pool
+            node_pool_url = build_node_url(config)
+            node_pool = NodePool(
+                [node_pool_url] + list(config["node_urls"]), lambda url, **kwargs: get_session().post(url, **kwargs),
+                hedge=config.get("node_hedge_requests", True), hedge_min_delay=config.get("node_hedge_min_delay") or 2.0,
+                max_workers=2 * settings["pool_maxsize"]
+            )
+    if node_pool is not None:
+        node_pool.check_health()
+        if config.get("node_health_check_interval"):
+            node_pool.start_health_checks(config["node_health_check_interval"])
+    logger.info(f"Transport: {settings['node_provider']} provider for Web3, {settings['pool_maxsize']} pooled connections per host, timeout {settings['timeout']}")
+
+
+def get_session():
+    """
+    Returns the shared session with pooled keep-alive connections. requests sessions can be used by several threads.
+    """
+    global session
+    with lock:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=settings["pool_connections"], pool_maxsize=settings["pool_maxsize"])
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+
+def get_node_pool():
+    return node_pool
+
+
+def post(url, **kwargs):
+    kwargs.setdefault("timeout", settings["timeout"])
+    if node_pool is not None and url == node_pool_url:
+        return node_pool.post(**kwargs)
+    return get_session().post(url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    kwargs.setdefault("timeout", settings["timeout"])
+    return get_session().get(url, params=params, **kwargs)
+
+
+def get_web3(node_url):
+    """
+    Returns a shared Web3 instance for the node, built with the configured provider.
+
+    Args:
+        node_url (str): The HTTP URL of the Ethereum node. Ignored for the IPC and WebSocket providers.
+
+    Returns:
+        Web3: The Web3 instance.
+    """
+    from web3 import Web3
+
+    provider = settings["node_provider"]
+    key = (provider, settings["node_ipc_path"] if provider == "ipc" else settings["node_ws_url"] if provider == "websocket" else node_url)
+    with lock:
+        if key not in web3_instances:
+            if provider == "ipc":
+                web3_instances[key] = Web3(Web3.IPCProvider(settings["node_ipc_path"], timeout=settings["timeout"][1]))
+            elif provider == "websocket":
+                web3_instances[key] = Web3(Web3.WebsocketProvider(settings["node_ws_url"], websocket_timeout=settings["timeout"][1]))
+            elif node_pool is not None and node_url == node_pool_url:
+                from src.trace_based_logging.node_pool import NodePoolProvider
+                web3_instances[key] = Web3(NodePoolProvider(node_pool, timeout=settings["timeout"]))
+            else:
+                web3_instances[key] = Web3(Web3.HTTPProvider(node_url, request_kwargs={"timeout": settings["timeout"]}, session=get_session()))
+        return web3_instances[key]
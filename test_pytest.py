@@ -1,11 +1,29 @@
 import src.trace_based_logging.raw_trace_retriever.get_transactions as get_transactions
+import src.trace_based_logging.raw_trace_retriever.get_txIndex as get_txIndex
 import src.trace_based_logging.raw_trace_retriever.trace_transformation as trace_transformation
 import src.trace_based_logging.raw_trace_retriever.trace_retriever_utils as trace_retriever_utils
+import src.trace_based_logging.raw_trace_retriever.trace_buffer as trace_buffer
 import src.trace_based_logging.raw_trace_retriever.create_relations as create_relations
+import src.trace_based_logging.raw_trace_retriever.trace_cache as trace_cache
+import src.trace_based_logging.raw_trace_retriever.trace_partitions as trace_partitions
+import src.trace_based_logging.raw_trace_retriever.extraction_checkpoint as extraction_checkpoint
+import src.trace_based_logging.raw_trace_retriever.etherscan_client as etherscan_client
+import src.trace_based_logging.raw_trace_retriever.log_range_scheduler as log_range_scheduler
+import src.trace_based_logging.raw_trace_retriever.block_cache as block_cache
+import src.trace_based_logging.raw_trace_retriever.etherscan_cache as etherscan_cache
+import src.trace_based_logging.raw_trace_retriever.trace_stream as trace_stream
+import src.trace_based_logging.raw_trace_retriever.trace_archive as trace_archive
+import src.trace_based_logging.raw_trace_retriever.tracers as tracers
+import src.trace_based_logging.raw_trace_retriever.trace_pipeline as trace_pipeline
 import src.trace_based_logging.trace_decoder.data_preparation as data_preparation
 import src.trace_based_logging.trace_decoder.event_decoder as event_decoder
 import src.trace_based_logging.log_construction.transformation_augur_utils as transformation_augur_utils
 import src.trace_based_logging.config as config
+from src.trace_based_logging.config import transform_config
+import src.trace_based_logging.transport as transport
+import src.trace_based_logging.node_pool as node_pool
+import src.trace_based_logging.request_controller as request_controller
+import src.trace_based_logging.follow as follow
 
 import pickle
 import os
@@ -13,6 +31,12 @@ import pandas as pd
 import math
 import json
 import numpy as np
+import copy
+import time
+import requests
+import zlib
+import pytest
+from concurrent.futures import ThreadPoolExecutor
 
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -92,6 +116,42 @@ def test_get_transactions():
     assert len(df_normal) == 20000
 
 
+def test_fetch_contract_range():
+    # Stand-in for the Etherscan client: 30 transactions per block, truncated at 10,000 transactions
+    class PagedClient:
+        max_workers = 4
+        requests = 0
+        def map(self, func, items):
+            return [func(item) for item in items]
+        def get_transaction_list(self, address, min_block, max_block, internal_flag):
+            self.requests += 1
+            result = [{"blockNumber": str(block), "hash": f"{block}_{i}"} for block in range(min_block, max_block + 1) for i in range(30)]
+            return {"status": "1", "message": "OK", "result": result[:10000]}
+
+    client = PagedClient()
+    df, complete = get_transactions.fetch_contract_range("0xab", 1000, 2999, "normal", client)
+    assert complete
+    assert len(df) == 60000 and df["hash"].is_unique
+    assert list(pd.to_numeric(df["blockNumber"])) == sorted(pd.to_numeric(df["blockNumber"]))
+    # the rest of the range after the first response is requested in concurrent sub-ranges, not page by page
+    assert client.requests < 12
+
+
+def test_token_bucket():
+    bucket = etherscan_client.TokenBucket(20)
+    start = time.monotonic()
+    for i in range(40):
+        bucket.acquire()
+    # 20 tokens are available at once, the other 20 are refilled within one second
+    assert 0.9 <= time.monotonic() - start < 1.5
+    bucket.pause(0.5)
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.5
+    assert etherscan_client.EtherscanClient.is_rate_limited({"status": "0", "message": "NOTOK", "result": "Max rate limit reached"})
+    assert not etherscan_client.EtherscanClient.is_rate_limited({"status": "0", "message": "No transactions found", "result": []})
+
+
 def test_get_transactions_by_events():
     min_block = 11280718
     max_block = 11280718  
@@ -107,6 +167,249 @@ def test_get_transactions_by_events():
     assert len(df) == 1174   
     
     
+def test_log_range_scheduler(monkeypatch):
+    # one event per block in the busy stretch 1000-1999, none elsewhere; the node returns at most 100 results
+    def fetch(target, from_block, to_block):
+        events = [(target, block) for block in range(max(from_block, 1000), min(to_block, 1999) + 1)]
+        if len(events) > 100:
+            raise ValueError({"code": -32005, "message": "query returned more than 100 results"})
+        return events
+
+    scheduler = log_range_scheduler.LogRangeScheduler(fetch, max_workers=4, range_size=500, sparse_results=10)
+    results = scheduler.run(["0xa", "0xb"], 0, 9999)
+    assert results[0] == [("0xa", block) for block in range(1000, 2000)]
+    assert results[1] == [("0xb", block) for block in range(1000, 2000)]
+
+    # a range that fails in all attempts is not skipped silently
+    monkeypatch.setattr(log_range_scheduler, "RETRY_DELAY", 0)
+    def fetch_failing(target, from_block, to_block):
+        if target == "0xb" and from_block <= 1500 <= to_block:
+            raise requests.exceptions.ConnectionError("connection reset")
+        return fetch(target, from_block, to_block)
+    scheduler = log_range_scheduler.LogRangeScheduler(fetch_failing, max_workers=4, range_size=500, sparse_results=10)
+    with pytest.raises(log_range_scheduler.IncompleteRangesError) as error:
+        scheduler.run(["0xa", "0xb"], 0, 9999)
+    assert len(error.value.failed_ranges) == 1
+    target, from_block, to_block = error.value.failed_ranges[0]
+    assert target == "0xb" and from_block <= 1500 <= to_block
+    assert log_range_scheduler.is_range_error(ValueError({"code": -32005, "message": "query returned more than 10000 results"}))
+    assert not log_range_scheduler.is_range_error(ValueError({"code": -32000, "message": "header not found"}))
+    assert log_range_scheduler.is_range_error(ValueError({"code": -32602, "message": "Log response size exceeded. You can make eth_getLogs requests with up to a 2K block range"}))
+    assert not log_range_scheduler.is_range_error(ValueError({"code": -32005, "message": "rate limit exceeded"}))
+    assert not log_range_scheduler.is_range_error(ValueError({"code": -32602, "message": "invalid argument 0: hex number out of range"}))
+
+
+def test_get_transactions_by_events_groups(monkeypatch):
+    from hexbytes import HexBytes
+    contracts = [f"0x{i:040x}" for i in range(1, 5)]
+    checksum = {contract: get_transactions.Web3.toChecksumAddress(contract) for contract in contracts}
+    # one event of every contract in block 5 and one more of the first contract in block 8; the node returns at most 2 events
+    logs = [{"address": checksum[contract], "blockNumber": 5, "transactionHash": HexBytes(f"0x0{i}"), "transactionIndex": i} for i, contract in enumerate(contracts)]
+    logs.append({"address": checksum[contracts[0]], "blockNumber": 8, "transactionHash": HexBytes("0x08"), "transactionIndex": 0})
+    filters = []
+    def event_fetcher(parameters, w3):
+        filters.append(parameters)
+        matched = [log for log in logs if log["address"] in parameters["address"] and parameters["fromBlock"] <= log["blockNumber"] <= parameters["toBlock"]]
+        if len(matched) > 2:
+            raise ValueError({"code": -32005, "message": "query returned more than 2 results"})
+        return matched
+    class BlockCache:
+        def get_timestamps(self, block_numbers, node_url):
+            return {block_number: 1000 + block_number for block_number in block_numbers}
+    monkeypatch.setattr(get_transactions, "event_fetcher", event_fetcher)
+    monkeypatch.setattr(transport, "get_web3", lambda url: None)
+
+    df = get_transactions.get_transactions_by_events(node_url, contracts, 1, 10, max_workers=1, chunk_size=10, address_batch_size=3, block_cache=BlockCache())
+    # the contracts are queried in groups of 3; block 5 has too many events for the first group, so the group is split
+    assert max(len(parameters["address"]) for parameters in filters) == 3
+    assert {"address": [checksum[contracts[0]]], "fromBlock": 5, "toBlock": 5} in filters
+    assert {"address": [checksum[contract] for contract in contracts[1:3]], "fromBlock": 5, "toBlock": 5} in filters
+    # one row per event, grouped by contract in the order of the contracts
+    assert list(df["contractAddress"]) == [checksum[contracts[0]], checksum[contracts[0]]] + [checksum[contract] for contract in contracts[1:]]
+    assert list(df["hash"]) == ["0x00", "0x08", "0x01", "0x02", "0x03"]
+    assert list(df["timeStamp"]) == [1005, 1008, 1005, 1005, 1005]
+    assert list(df["transactionIndex"]) == [0, 0, 1, 2, 3]
+
+
+def test_get_transactions_by_trace_filter(monkeypatch):
+    traces = [
+        # a call from the first to the second contract: one row for each of them
+        {"action": {"from": "0xc1", "to": "0xc2"}, "blockNumber": 5, "transactionHash": "0xt1", "transactionPosition": 0},
+        # a nested call of the same transaction: no second row
+        {"action": {"from": "0xc2", "to": "0xe1"}, "blockNumber": 5, "transactionHash": "0xt1", "transactionPosition": 0},
+        # a creation by an outside account: the row is keyed on the created contract
+        {"action": {"from": "0xe2"}, "result": {"address": "0xc3"}, "type": "create", "blockNumber": 7, "transactionHash": "0xt2", "transactionPosition": 3},
+        # a block reward has no transaction
+        {"action": {"author": "0xc1"}, "type": "reward", "blockNumber": 9, "transactionHash": None},
+    ]
+    calls = []
+    def json_rpc_call(url, method, params):
+        query = params[0]
+        from_block, to_block = int(query["fromBlock"], 16), int(query["toBlock"], 16)
+        calls.append((from_block, to_block))
+        if to_block - from_block >= 5:
+            raise ValueError({"code": -32000, "message": "query timeout exceeded"})
+        def matches(trace):
+            if "fromAddress" in query:
+                return trace["action"].get("from") in query["fromAddress"]
+            # the receiver of a call, the created contract, or the author of a block reward
+            receivers = [trace["action"].get("to"), (trace.get("result") or {}).get("address"), trace["action"].get("author")]
+            return any(address in query["toAddress"] for address in receivers if address)
+        return [trace for trace in traces if from_block <= trace["blockNumber"] <= to_block and matches(trace)]
+    class BlockCache:
+        def get_timestamps(self, block_numbers, node_url):
+            return {block_number: 1000 + block_number for block_number in block_numbers}
+    monkeypatch.setattr(get_transactions, "json_rpc_call", json_rpc_call)
+
+    df = get_transactions.get_transactions_by_trace_filter(node_url, ["0xC1", "0xc2", "0xc3"], 1, 10, max_workers=1, chunk_size=10, block_cache=BlockCache())
+    # the error of the node shrinks the range
+    assert calls[0] == (1, 10)
+    assert all(to_block - from_block < 5 for from_block, to_block in calls[1:])
+    # the hits as fromAddress and toAddress are deduplicated, one row per transaction and contract
+    assert list(zip(df["contractAddress"], df["hash"])) == [("0xc1", "0xt1"), ("0xc2", "0xt1"), ("0xc3", "0xt2")]
+    assert list(df["blockNumber"]) == [5, 5, 7]
+    assert list(df["transactionIndex"]) == [0, 0, 3]
+    assert list(df["timeStamp"]) == [1005, 1005, 1007]
+
+
+def test_block_cache(tmp_path):
+    blocks = [
+        {"number": "0xa", "timestamp": "0x5f5e100", "hash": "0x01", "baseFeePerGas": "0x7", "transactions": ["0xa1", "0xa2"]},
+        {"number": "0xb", "timestamp": "0x5f5e10c", "hash": "0x02", "transactions": []},
+        None
+    ]
+    cache = block_cache.BlockHeaderCache(os.path.join(tmp_path, "block_headers.sqlite"))
+    cache.put_blocks(blocks)
+    cache.close()
+
+    # the cache is persistent; cached blocks are not requested from the node
+    cache = block_cache.BlockHeaderCache(os.path.join(tmp_path, "block_headers.sqlite"))
+    headers = cache.get_headers([10, 11], node_url)
+    assert headers[10] == {"timestamp": 100000000, "hash": "0x01", "baseFeePerGas": 7, "transactionCount": 2}
+    assert headers[11]["baseFeePerGas"] is None
+    assert cache.get_timestamps([11], node_url) == {11: 100000012}
+    assert cache.requested == 0
+    cache.close()
+
+
+def test_etherscan_cache(tmp_path):
+    cache = etherscan_cache.EtherscanCache(os.path.join(tmp_path, "etherscan_transactions.sqlite"))
+    transactions = pd.DataFrame({"blockNumber": ["100", "150", "250"], "hash": ["0x01", "0x02", "0x03"]})
+    cache.store("0xAB", "normal", 100, 199, transactions)
+    cache.store("0xab", "normal", 300, 399, pd.DataFrame())
+    cache.close()
+
+    # the cache is persistent; only blocks outside of the cached intervals are missing
+    cache = etherscan_cache.EtherscanCache(os.path.join(tmp_path, "etherscan_transactions.sqlite"))
+    assert cache.missing_intervals("0xab", "normal", 50, 450) == [(50, 99), (200, 299), (400, 450)]
+    assert cache.missing_intervals("0xab", "internal", 50, 450) == [(50, 450)]
+    # transactions outside of the stored interval are not cached
+    assert list(cache.get("0xab", "normal", 0, 1000)["hash"]) == ["0x01", "0x02"]
+    # adjacent intervals are merged
+    cache.store("0xab", "normal", 200, 299, transactions)
+    assert cache.intervals("0xab", "normal") == [(100, 399)]
+    assert list(cache.get("0xab", "normal", 120, 1000)["hash"]) == ["0x02", "0x03"]
+    cache.close()
+
+
+def test_transport():
+    transport.configure({"pool_maxsize": 4, "connect_timeout": 5, "read_timeout": 30})
+    session = transport.get_session()
+    assert transport.get_session() is session
+    assert session.get_adapter("http://127.0.0.1")._pool_maxsize == 4
+    calls = []
+    session.post = lambda url, **kwargs: calls.append((url, kwargs)) or "response"
+    # requests go through the shared session, with the configured timeout unless one is given
+    assert transport.post("http://127.0.0.1:1", json={"id": 1}) == "response"
+    assert transport.post("http://127.0.0.1:1", json={"id": 2}, timeout=1) == "response"
+    assert calls == [("http://127.0.0.1:1", {"json": {"id": 1}, "timeout": (5, 30)}), ("http://127.0.0.1:1", {"json": {"id": 2}, "timeout": 1})]
+    # a new configuration replaces the session
+    transport.configure({})
+    assert transport.get_session() is not session
+    assert transport.settings["timeout"] == (transport.CONNECT_TIMEOUT, transport.READ_TIMEOUT)
+
+def test_node_pool():
+    # Stand-ins for three nodes: one is down, one answers slowly once, one answers quickly
+    class Response:
+        def __init__(self, url):
+            self.status_code = 200
+            self.url = url
+            self.closed = False
+        def close(self):
+            self.closed = True
+    calls = []
+    responses = []
+    def send(url, **kwargs):
+        calls.append(url)
+        if url == "http://down":
+            raise requests.exceptions.ConnectionError("connection refused")
+        if url == "http://slow" and calls.count("http://slow") == 2:
+            time.sleep(2)
+        responses.append(Response(url))
+        return responses[-1]
+
+    pool = node_pool.NodePool(["http://down", "http://slow", "http://fast"], send, hedge_min_delay=0.2)
+    # the failed node is skipped for a cooldown, the request goes to another node
+    assert pool.post(json={"method": "eth_getCode"}).url in ["http://slow", "http://fast"]
+    assert not pool.stats()["endpoints"]["http://down"]["available"]
+    pool.endpoints[1].latency["debug_traceTransaction"] = 0.01
+    pool.endpoints[2].latency["debug_traceTransaction"] = 0.02
+    # the slow response of the best node is hedged with a request to the second-best node, which answers first
+    start = time.monotonic()
+    assert pool.post(json={"method": "debug_traceTransaction"}).url == "http://fast"
+    assert time.monotonic() - start < 1.5
+    assert pool.stats()["hedged"] == 1
+    assert calls.count("http://down") == 1
+    # the response of the slower duplicate is closed once it arrives, the response of the winner stays open
+    deadline = time.monotonic() + 5
+    while len(responses) < 3 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    time.sleep(0.1)
+    assert [(response.url, response.closed) for response in responses[1:]] == [("http://fast", False), ("http://slow", True)]
+    pool.close()
+
+
+def test_request_controller():
+    controller = request_controller.RequestController("test", initial_limit=4, max_limit=8, failure_threshold=3, open_seconds=0.5)
+    # successful requests raise the limit, up to max_limit
+    for i in range(40):
+        controller.call(lambda: None)
+    assert controller.stats()["limit"] == 8
+
+    def failing_request():
+        raise requests.exceptions.ConnectionError("connection refused")
+    for i in range(3):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            controller.call(failing_request)
+        time.sleep(0.01)
+    # failures halve the limit, and consecutive failures open the circuit
+    assert controller.stats()["limit"] < 8 and controller.stats()["state"] == "open"
+    with pytest.raises(request_controller.CircuitOpenError):
+        controller.call(lambda: None)
+    # the backoff waits until the circuit is half-open; a successful probe closes it
+    controller.backoff(0)
+    assert controller.call(lambda: "probe") == "probe"
+    assert controller.stats()["state"] == "closed"
+
+    # requests that were in flight when the circuit opened do not extend the open period
+    controller = request_controller.RequestController("test", initial_limit=8, max_limit=8, failure_threshold=5, open_seconds=10)
+    probes = [controller.acquire() for i in range(8)]
+    for probe in probes:
+        controller.release(probe, failed=True)
+    assert controller.stats()["state"] == "open"
+    assert controller.open_until - time.monotonic() <= 10
+    assert controller.open_seconds == 20
+    # a failed probe opens the circuit again, for twice as long
+    controller.open_until = 0
+    probe = controller.acquire()
+    assert probe
+    controller.release(probe, failed=True)
+    assert 10 < controller.open_until - time.monotonic() <= 20
+    assert controller.open_seconds == 40
+    assert request_controller.is_overload_error({"jsonrpc": "2.0", "id": 1, "error": {"code": -32000, "message": "execution timeout"}})
+    assert not request_controller.is_overload_error({"jsonrpc": "2.0", "id": 1, "error": {"code": -32000, "message": "transaction not found"}})
+
+
 def test_json_retriever():
     # Load a correct, pickled trace for comparison 
     path = os.path.join(dir_path, 'tests', 'test_resources', 'trace_json_lx_0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29_erigon2.pkl')
@@ -132,6 +435,65 @@ def test_json_retriever():
     assert json_flag == False
     assert json_dict not in [trace_json_lx_read_erigon2, trace_json_lx_read_erigon3]
 
+class StubNodeResponse:
+    # Stand-in for the HTTP response of a node, read as a stream or with json()
+    def __init__(self, body):
+        self.status_code = 200
+        self.content = json.dumps(body).encode()
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+    def json(self):
+        return json.loads(self.content)
+    def close(self):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+
+def stub_trace(tx_hash):
+    # A small callTracer result with a nested call and an event; the input tells the traces of the transactions apart
+    return {"type": "CALL", "from": "0xa", "to": "0xb", "value": "0x0", "gas": "0x100", "gasUsed": "0x80", "input": tx_hash, "output": "0x",
+            "calls": [{"type": "STATICCALL", "from": "0xb", "to": "0xc", "gas": "0x40", "gasUsed": "0x20", "input": "0x01", "output": "0x"}],
+            "logs": [{"address": "0xb", "topics": ["0x02"], "data": "0x"}]}
+
+def test_json_retriever_batch(monkeypatch):
+    requests_sent = []
+    batch_support = [True]
+    def post(url, json=None, **kwargs):
+        requests_sent.append(json)
+        if isinstance(json, list):
+            if not batch_support[0]:
+                return StubNodeResponse({"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "batch requests are not supported"}})
+            entries = []
+            for call in json:
+                if call["params"][0] == "0x02":
+                    entries.append({"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32000, "message": "execution timeout"}})
+                else:
+                    entries.append({"jsonrpc": "2.0", "id": call["id"], "result": stub_trace(call["params"][0])})
+            # the node answers in a different order than it was asked
+            return StubNodeResponse(entries[::-1])
+        return StubNodeResponse({"jsonrpc": "2.0", "id": json["id"], "result": stub_trace(json["params"][0])})
+    monkeypatch.setattr(transport, "post", post)
+
+    tx_hashes = ["0x01", "0x02", "0x03"]
+    expected = [({"jsonrpc": "2.0", "id": 1, "result": stub_trace(tx_hash)}, True) for tx_hash in tx_hashes]
+    results = trace_transformation.json_retriever_batch(tx_hashes, "http://stub-node")
+    # the responses are matched back by id; the entry with an error is requested again on its own
+    assert [result[0]["result"] for result in results] == [stub_trace(tx_hash) for tx_hash in tx_hashes]
+    assert all(json_flag for result, json_flag in results)
+    assert [call["id"] for call in requests_sent[0]] == [0, 1, 2]
+    assert requests_sent[1:] == [{"jsonrpc": "2.0", "method": "debug_traceTransaction", "params": ["0x02", trace_transformation.TRACER_CONFIG], "id": 1}]
+    assert results[1] == expected[1]
+
+    # a node without batch support answers with a single error object; all hashes are requested one by one
+    batch_support[0] = False
+    requests_sent.clear()
+    assert trace_transformation.json_retriever_batch(tx_hashes, "http://stub-node") == expected
+    assert isinstance(requests_sent[0], list)
+    assert [call["params"][0] for call in requests_sent[1:]] == tx_hashes
+
 def test_txs_to_trace():
     # We test: Does the number of entries in the resulting dataframe reflect the number of entries in the JSON-trace
     path = os.path.join(dir_path, 'tests', 'test_resources', 'df_txs_lx_0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29.pkl')
@@ -156,6 +518,106 @@ def test_txs_to_trace():
     # Check if number of events in the trace is okay
     assert len(df_trace_lx[df_trace_lx["address"] == "0x75228dce4d82566d93068a8d5d49435216551599"]) == 18
 
+def test_block_trace_retriever(monkeypatch):
+    # Block 16 is traced by a client that returns the hashes with the traces, block 17 by one that does not
+    blocks = {16: ["0x11", "0x12", "0x13"], 17: ["0x21", "0x22", "0x23", "0x24"], 18: ["0x31"]}
+    methods = []
+    def answer(call):
+        methods.append(call["method"])
+        block_number = int(call["params"][0], 16) if call["method"] != "debug_traceTransaction" else None
+        if call["method"] == "debug_traceBlockByNumber":
+            result = [{"txHash": tx_hash, "result": stub_trace(tx_hash)} if block_number == 16 else {"result": stub_trace(tx_hash)} for tx_hash in blocks[block_number]]
+        elif call["method"] == "eth_getBlockByNumber":
+            result = {"number": call["params"][0], "transactions": blocks[block_number]}
+        elif call["method"] == "eth_getBlockTransactionCountByNumber":
+            result = hex(len(blocks[block_number]))
+        else:
+            result = stub_trace(call["params"][0])
+        return {"jsonrpc": "2.0", "id": call["id"], "result": result}
+    monkeypatch.setattr(transport, "post", lambda url, json=None, **kwargs: StubNodeResponse([answer(call) for call in json] if isinstance(json, list) else answer(json)))
+
+    # the traces are matched to the transactions by txHash, or by the order of the block's transaction list
+    for block_number in [16, 17]:
+        methods.clear()
+        traces = trace_transformation.block_trace_retriever(block_number, "http://stub-node")
+        assert traces == {tx_hash: ({"jsonrpc": "2.0", "id": 1, "result": stub_trace(tx_hash)}, True) for tx_hash in blocks[block_number]}
+        assert methods == (["debug_traceBlockByNumber"] if block_number == 16 else ["debug_traceBlockByNumber", "eth_getBlockByNumber"])
+
+    # 2 of 3 relevant transactions in block 16, 2 of 4 in block 17, and a single one in block 18
+    df_txs_lx = pd.DataFrame({"hash": ["0x11", "0x13", "0x21", "0x24", "0x31"], "timeStamp": [1, 1, 2, 2, 3], "blockNumber": [16, 16, 17, 17, 18]})
+    assert trace_transformation.select_dense_blocks(df_txs_lx, "http://stub-node", 0.5) == {16, 17}
+    assert trace_transformation.select_dense_blocks(df_txs_lx, "http://stub-node", 2 / 3) == {16}
+    assert trace_transformation.select_dense_blocks(df_txs_lx, "http://stub-node", 0.7) == set()
+    # a block with a single relevant transaction is not even requested
+    methods.clear()
+    assert trace_transformation.select_dense_blocks(df_txs_lx[df_txs_lx["blockNumber"] == 18], "http://stub-node", 0.1) == set()
+    assert methods == []
+
+    # tracing whole blocks gives the same rows as tracing each transaction
+    methods.clear()
+    df_trace_blocks = trace_transformation.tx_to_trace(df_txs_lx, "http://stub-node", block_trace_threshold=0.5)
+    assert methods.count("debug_traceBlockByNumber") == 2 and methods.count("debug_traceTransaction") == 1
+    methods.clear()
+    df_trace_txs = trace_transformation.tx_to_trace(df_txs_lx, "http://stub-node")
+    assert methods == ["debug_traceTransaction"] * 5
+    assert len(df_trace_txs) == 5 * 3
+    pd.testing.assert_frame_equal(df_trace_blocks, df_trace_txs)
+
+def test_retrieve_traces(monkeypatch):
+    # Earlier hashes are answered later, so that the requests finish in a different order than they were sent
+    tx_hashes = ["0x01", "0x02", "0xbad", "0x04", "0x05", "0x06"]
+    finished = []
+    def answer(call):
+        tx_hash = call["params"][0]
+        if tx_hash == "0xbad":
+            return {"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32000, "message": "transaction not found"}}
+        time.sleep(0.05 * (len(tx_hashes) - tx_hashes.index(tx_hash)))
+        finished.append(tx_hash)
+        return {"jsonrpc": "2.0", "id": call["id"], "result": stub_trace(tx_hash)}
+    monkeypatch.setattr(transport, "post", lambda url, json=None, **kwargs: StubNodeResponse([answer(call) for call in json] if isinstance(json, list) else answer(json)))
+
+    # the results are compared without the JSON-RPC id, which is the position in the batch for batched requests
+    expected = [(None, False) if tx_hash == "0xbad" else (stub_trace(tx_hash), True) for tx_hash in tx_hashes]
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = trace_transformation.retrieve_traces(tx_hashes, "http://stub-node", executor)
+    assert finished.index("0x06") < finished.index("0x01")
+    # the results are in input order; the failed hash keeps its position with json_flag False
+    assert [(response.get("result"), json_flag) for response, json_flag in results] == expected
+    assert results[2] == ({}, False)
+    # the same with batches of two hashes
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = trace_transformation.retrieve_traces(tx_hashes, "http://stub-node", executor, batch_size=2)
+    assert [(response.get("result"), json_flag) for response, json_flag in results] == expected
+
+    # tracing with several requests in flight gives the same rows as tracing one transaction after another
+    df_txs_lx = pd.DataFrame({"hash": tx_hashes, "timeStamp": [1, 2, 3, 4, 5, 6], "blockNumber": [16, 16, 17, 17, 18, 18]})
+    df_trace_parallel = trace_transformation.tx_to_trace(df_txs_lx, "http://stub-node", max_workers=4)
+    df_trace_serial = trace_transformation.tx_to_trace(df_txs_lx, "http://stub-node")
+    assert list(df_trace_parallel.drop_duplicates("hash")["hash"]) == ["0x01", "0x02", "0x04", "0x05", "0x06"]
+    pd.testing.assert_frame_equal(df_trace_parallel, df_trace_serial)
+
+def test_trace_buffer():
+    rows = [{"type": "CALL", "hash": "0x01", "tracePos": 1},
+            {"address": "0xc1", "hash": "0x01", "tracePos": 2},
+            {"type": "CREATE", "tracePos": 3, "value": "0x0"}]
+    buffer = trace_buffer.TraceBuffer()
+    buffer.extend(rows[:2])
+    buffer.extend(rows[2:])
+    assert len(buffer) == 3
+
+    # columns missing in a row are NaN, and the column order matches pd.DataFrame(rows)
+    df_buffer = buffer.to_frame()
+    pd.testing.assert_frame_equal(df_buffer, pd.DataFrame(rows))
+    df_buffer = buffer.to_frame(last_columns=["hash", "missing"])
+    assert list(df_buffer.columns) == ["type", "tracePos", "address", "value", "hash"]
+    assert df_buffer["address"].isna().tolist() == [True, False, True]
+
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.to_frame().empty
+    buffer.append({"tracePos": 4})
+    assert list(buffer.to_frame().columns) == ["tracePos"]
+
 def test_insert_tracePosDepth():
     mock_trace = {
         "CALL_1":"attribute", "calls":[
@@ -222,6 +684,362 @@ def test_insert_tracePos():
     assert mock_trace_tracePos["calls"][1]["calls"][2]["logs"][1]["tracePos"] == 10
     assert mock_trace_tracePos["calls"][2]["tracePos"] == 11
 
+def test_flatten_trace():
+    # The single-pass walker has to produce the same rows as the DataFrame-based flattening
+    path = os.path.join(dir_path, 'tests', 'test_resources', 'trace_json_lx_0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29_erigon2.pkl')
+    trace_json_lx_read = pickle.load(open(path, 'rb'))
+    tx_hash = "0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29"
+
+    df_trace_walker = pd.DataFrame(trace_transformation.flatten_trace(copy.deepcopy(trace_json_lx_read), tx_hash, "Place holder", 1, 7498454))
+
+    trace_json_lx = trace_transformation.insert_tracePos(copy.deepcopy(trace_json_lx_read), trace_pos_counter=[0])
+    trace_json_lx = trace_transformation.insert_tracePosDepth(trace_json_lx, parent_index="")
+    df_flat_json = pd.DataFrame.from_dict(trace_transformation.flatten(trace_json_lx, {}), orient="index").T
+    df_trace_nested = trace_transformation.flatten_nested(df_flat_json, pd.DataFrame(), tx_hash, "Place holder", 1, 7498454)
+    df_trace_nested.reset_index(drop=True, inplace=True)
+
+    assert len(df_trace_walker) == len(df_trace_nested) # == 571
+    assert set(df_trace_walker.columns) == set(df_trace_nested.columns)
+    assert df_trace_walker["tracePos"][570] == 59
+    assert df_trace_walker["tracePos"][568] == 516
+    assert df_trace_walker.astype(str).equals(df_trace_nested[df_trace_walker.columns].astype(str))
+
+def test_trace_stream():
+    # The streaming parser has to produce the same rows as the in-memory parser, however the response is chunked
+    path = os.path.join(dir_path, 'tests', 'test_resources', 'trace_json_lx_0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29_erigon2.pkl')
+    trace_json_lx_read = pickle.load(open(path, 'rb'))
+    tx_hash = "0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29"
+    rows_in_memory = trace_transformation.flatten_trace(copy.deepcopy(trace_json_lx_read), tx_hash, "Place holder", 1, 7498454)
+    body = json.dumps(trace_json_lx_read, indent=1).encode("utf-8")
+
+    # small responses are parsed in memory
+    assert trace_stream.parse_response([body], stream_threshold=len(body)) == trace_json_lx_read
+    for chunk_size in [1, 100, 65536]:
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        response_json = trace_stream.parse_response(chunks, stream_threshold=0, keep_compressed=True)
+        assert isinstance(response_json["result"], trace_stream.StreamedTrace)
+        assert trace_transformation.is_valid_trace_response(response_json)
+        # the compressed JSON holds the complete trace, to be stored in the trace cache
+        assert json.loads(zlib.decompress(response_json["result"].compressed))["result"] == trace_json_lx_read["result"]
+        assert trace_transformation.flatten_trace(response_json, tx_hash, "Place holder", 1, 7498454) == rows_in_memory
+
+    # batch responses keep their errors, so that the entries are retried
+    batch = json.dumps([trace_json_lx_read, {"jsonrpc": "2.0", "id": 2, "error": {"code": -32000, "message": "execution timeout"}}]).encode("utf-8")
+    response_json = trace_stream.parse_response([batch], stream_threshold=0)
+    assert trace_transformation.flatten_trace(response_json[0], tx_hash, "Place holder", 1, 7498454) == rows_in_memory
+    assert not trace_transformation.is_valid_trace_response(response_json[1])
+    with pytest.raises(ValueError):
+        trace_stream.parse_response([body[:-10]], stream_threshold=0)
+
+
+def test_trace_cache(tmp_path):
+    path = os.path.join(dir_path, 'tests', 'test_resources', 'trace_json_lx_0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29_erigon2.pkl')
+    trace_json_lx_read = pickle.load(open(path, 'rb'))
+    tx_hash = "0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29"
+
+    cache = trace_cache.TraceCache(os.path.join(tmp_path, "trace_cache.sqlite"))
+    assert cache.get(tx_hash) is None
+    cache.put(tx_hash, trace_json_lx_read)
+    # lookups are case insensitive
+    assert cache.get(tx_hash.upper().replace("0X", "0x")) == trace_json_lx_read
+    assert cache.contains_many([tx_hash, "0x01"]) == {tx_hash}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    cache.close()
+
+    # the store is persistent
+    cache = trace_cache.TraceCache(os.path.join(tmp_path, "trace_cache.sqlite"), max_size_mb=0.01)
+    assert cache.get(tx_hash) == trace_json_lx_read
+    # least recently used traces are evicted once the store exceeds its size
+    for i in range(50):
+        cache.put(f"0x{i}", {"result": {"type": "CALL", "input": os.urandom(500).hex()}})
+    assert cache.stats()["size_mb"] <= 0.01
+    assert cache.stats()["evictions"] > 0
+    assert cache.get(tx_hash) is None
+    assert cache.get("0x49") is not None
+    cache.close()
+
+def test_trace_archive(tmp_path):
+    path = os.path.join(dir_path, 'tests', 'test_resources', 'trace_json_lx_0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29_erigon2.pkl')
+    trace_json_lx_read = pickle.load(open(path, 'rb'))
+    tx_hash = "0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29"
+    small_trace = {"jsonrpc": "2.0", "id": 1, "result": {"type": "CALL", "from": "0x01", "to": "0x02"}}
+
+    archive = trace_archive.TraceArchive(os.path.join(tmp_path, "archive"), segment_blocks=1000)
+    archive.append([(tx_hash, "1530000000", 7498454, trace_json_lx_read), ("0x02", "1530000001", 7499000, small_trace)], run="run", level=1)
+    # a streamed trace is archived from its compressed JSON
+    streamed = trace_stream.parse_response([json.dumps(small_trace).encode("utf-8")], stream_threshold=0, keep_compressed=True)
+    archive.append([("0x03", "1530000002", 100, streamed)], run="run", level=2)
+    assert archive.get(tx_hash.upper().replace("0X", "0x"))["trace"] == trace_json_lx_read
+    assert archive.get("0x03")["trace"] == small_trace
+    assert archive.run_levels("run") == [(1, [tx_hash, "0x02"]), (2, ["0x03"])]
+    # one segment per block range
+    assert len([name for name in os.listdir(os.path.join(tmp_path, "archive")) if name.endswith(".jsonl.gz")]) == 3
+
+    # the replay yields the rows of the extraction
+    df_replay = trace_archive.replay_traces(archive, [tx_hash])
+    df_trace = pd.DataFrame(trace_transformation.flatten_trace(trace_json_lx_read, tx_hash, "Place holder", "1530000000", 7498454))
+    assert df_replay.astype(str).equals(df_trace[df_replay.columns].astype(str))
+    archive.record_transaction_indexes({tx_hash: 12})
+    assert archive.transaction_indexes([tx_hash, "0x02"]) == {tx_hash: 12}
+    archive.close()
+
+    # records that were written but not indexed are cut off
+    segment = os.path.join(tmp_path, "archive", "segment_0007498000.jsonl.gz")
+    size = os.path.getsize(segment)
+    with open(segment, "ab") as file:
+        file.write(b"incomplete record")
+    archive = trace_archive.TraceArchive(os.path.join(tmp_path, "archive"), segment_blocks=1000)
+    assert os.path.getsize(segment) == size
+    assert archive.get("0x02")["trace"] == small_trace
+    archive.close()
+
+
+def test_tracers():
+    assert tracers.tracer_config("full") == trace_transformation.TRACER_CONFIG
+    assert tracers.tracer_config("no_logs", timeout="60s") == {"tracer": "callTracer", "tracerConfig": {"withLog": False}, "timeout": "60s"}
+    assert tracers.tracer_config("top_call")["tracerConfig"]["onlyTopCall"]
+    assert tracers.tracer_config("js")["tracer"] == tracers.TRIMMED_JS_TRACER
+    with pytest.raises(ValueError):
+        tracers.tracer_config("prestateTracer")
+    # each mode has a store of its own
+    assert tracers.tracer_store_path("resources/cache/trace_cache.sqlite", "full") == "resources/cache/trace_cache.sqlite"
+    assert tracers.tracer_store_path("resources/cache/trace_cache.sqlite", "js") == "resources/cache/trace_cache_js.sqlite"
+    assert tracers.tracer_store_path("resources/archive/traces", "no_logs") == "resources/archive/traces_no_logs"
+    assert tracers.tracer_store_path(None, "js") is None
+
+
+def test_trace_pipeline():
+    seen = []
+    def slow_square(x):
+        time.sleep(0.001 * (x % 3))
+        return x * x
+    # the ordered stage sees the items in input order, although the first stage finishes them out of order
+    results = trace_pipeline.run_pipeline(range(30), [
+        trace_pipeline.Stage("square", slow_square, workers=4),
+        trace_pipeline.Stage("collect", lambda x: seen.append(x) or x + 1, ordered=True)
+    ], queue_size=1)
+    assert seen == [x * x for x in range(30)]
+    assert results == [x * x + 1 for x in range(30)]
+
+    # backpressure: with a slow last stage, the first stage takes only a few items ahead of it
+    taken = []
+    def items():
+        for x in range(20):
+            taken.append(x)
+            yield x
+    ahead = []
+    def slow_last(x):
+        ahead.append(len(taken) - x)
+        time.sleep(0.02)
+        return x
+    trace_pipeline.run_pipeline(items(), [trace_pipeline.Stage("fast", lambda x: x), trace_pipeline.Stage("slow", slow_last)], queue_size=1)
+    # at most one item in each queue, one in the fast stage, and one waiting to enter the first queue
+    assert max(ahead) <= 5
+
+    def fail_at_five(x):
+        if x == 5:
+            raise RuntimeError("failed")
+        return x
+    with pytest.raises(RuntimeError):
+        trace_pipeline.run_pipeline(range(100), [trace_pipeline.Stage("fail", fail_at_five, workers=2), trace_pipeline.Stage("pass", lambda x: x)])
+    with pytest.raises(ValueError):
+        trace_pipeline.Stage("ordered", lambda x: x, workers=2, ordered=True)
+
+
+def test_creation_graph():
+    a, b, c, d, n, x = ["0x" + str(i) * 40 for i in range(1, 7)]
+    level_1 = pd.DataFrame({"type": ["CREATE", "CALL", "CREATE2", "CREATE"], "from": [a + "_2", a, n, x], "to": [b, c, a, np.nan]})
+    level_2 = pd.DataFrame({"type": ["CREATE", "CREATE"], "from": [n + "_5", b], "to": [d, x]})
+    graph = create_relations.CreationGraph()
+    # a creates b, and a was created by the non-dApp contract n; a failed creation (no "to") is no relation
+    contracts_dapp, contracts_lx = graph.update(create_relations.select_creations(level_1), {a}, {n})
+    assert contracts_dapp == {a, b} and contracts_lx == {b}
+    # the traversal passes through n to the contract d that n created later
+    contracts_dapp, contracts_lx = graph.update(create_relations.select_creations(level_2), contracts_dapp, {n})
+    assert contracts_dapp == {a, b, d, x} and contracts_lx == {d, x}
+    # the same result as from all CREATE rows at once
+    assert create_relations.create_relations(pd.concat([level_1, level_2]), {a}, {a}, {n}) == ({a, b, d, x}, {b, d, x})
+
+
+def test_trace_partitions(tmp_path):
+    path = os.path.join(dir_path, 'tests', 'test_resources', 'trace_json_lx_0x39a7a29cd1b941424774e0ffa8cc93bcd968f30e3d3d1ee3d7d086916697dc29_erigon2.pkl')
+    trace_json_lx_read = pickle.load(open(path, 'rb'))
+    rows = trace_transformation.flatten_trace(trace_json_lx_read, "0x39a7", "f", 1, 10)
+    df_chunk_1 = pd.DataFrame(rows[:300])
+    df_chunk_2 = pd.DataFrame(rows[300:])
+    df_chunk_2.loc[0, "type"] = "CREATE"
+
+    store = trace_partitions.TracePartitionStore(os.path.join(tmp_path, "partitions"))
+    store.write(df_chunk_1, 1, 1)
+    store.write(df_chunk_2, 1, 2)
+    assert store.row_count == len(rows)
+    assert store.hashes == {"0x39a7"}
+    assert len(store.creations()) == len(create_relations.select_creations(df_chunk_1)) + len(create_relations.select_creations(df_chunk_2))
+
+    store.map_partitions(lambda df: df.assign(transactionIndex=0))
+    df_all = store.read_all()
+    assert len(df_all) == len(rows)
+    assert list(df_all.columns)[-1] == "transactionIndex"
+    store.write_csv(os.path.join(tmp_path, "trace.csv"))
+    df_csv = pd.read_csv(os.path.join(tmp_path, "trace.csv"), index_col=0)
+    assert list(df_csv.index) == list(range(len(rows)))
+
+def test_get_txIndex(monkeypatch):
+    blocks = {10: ["0xa0", "0xA1", "0xa2"], 11: ["0xb0"]}
+    requests_sent = []
+    def json_rpc_batch(node_url, calls):
+        requests_sent.append(calls)
+        if calls[0][0] == "eth_getBlockByNumber":
+            return [{"number": block_number, "transactions": blocks.get(int(block_number, 16), [])} for method, (block_number, full) in calls]
+        return [{"transactionIndex": "0x5"} if tx_hash == "0xc0" else None for method, (tx_hash,) in calls]
+    monkeypatch.setattr(get_txIndex, "json_rpc_batch", json_rpc_batch)
+    class BlockCache:
+        def __init__(self):
+            self.blocks = []
+        def put_blocks(self, results):
+            self.blocks.extend(results)
+    block_cache = BlockCache()
+
+    # the hashes of a block are resolved by one request for the block; the block number may be a hex string
+    block_numbers = {"0xa1": 10, "0xa2": "0xa", "0xb0": 11, "0xd0": 11, "0xc0": None}
+    transaction_indexes = get_txIndex.get_txIndex(["0xa1", "0xa2", "0xb0", "0xd0", "0xc0", "0xe0"], node_url, block_numbers, batch_size=1, block_cache=block_cache)
+    assert transaction_indexes == {"0xa1": 1, "0xa2": 2, "0xb0": 0, "0xc0": 5}
+    assert [call[0] for call in requests_sent[:2]] == [("eth_getBlockByNumber", ["0xa", False]), ("eth_getBlockByNumber", ["0xb", False])]
+    assert len(block_cache.blocks) == 2
+    # hashes without a block number, or missing in their block, are requested by hash
+    assert sorted(call[0][1][0] for call in requests_sent[2:]) == ["0xc0", "0xd0", "0xe0"]
+
+def test_extraction_checkpoint(tmp_path):
+    folder = os.path.join(tmp_path, "partitions")
+    transactions = pd.DataFrame({"hash": ["0x01", "0x02", "0x03"], "functionName": "f", "timeStamp": 1, "blockNumber": 10})
+    state = {"contracts_dapp": {"0xc1"}, "contracts_lx": {"0xc1"}, "all_transactions": {"0x01", "0x02", "0x03"}}
+    store = trace_partitions.TracePartitionStore(folder)
+    checkpoint = extraction_checkpoint.ExtractionCheckpoint(folder)
+    checkpoint.start_level(1, transactions, state)
+    df_chunk = pd.DataFrame({"type": ["CALL", "CREATE"], "from": ["0xc1", "0xc1"], "to": ["0xc2", "0xc3"], "hash": ["0x01", "0x01"], "blockNumber": [10, 10]})
+    checkpoint.record_partition(1, 1, store.write(df_chunk, 1, 1), ["0x01"])
+    checkpoint.record_transaction_indexes({"0x01": 4})
+    checkpoint.close()
+
+    # a restarted run continues with the transactions of the level that are not traced yet
+    state = {"contracts_dapp": set(), "contracts_lx": set(), "all_transactions": set()}
+    store = trace_partitions.TracePartitionStore(folder, clear=False)
+    checkpoint = extraction_checkpoint.ExtractionCheckpoint(folder)
+    level, pending = checkpoint.restore(state, store)
+    assert level == 1
+    assert list(pending["hash"]) == ["0x02", "0x03"]
+    assert state["all_transactions"] == {"0x01", "0x02", "0x03"}
+    assert store.row_count == 2
+    assert len(store.creations()) == 1
+    assert checkpoint.last_chunk(1) == 1
+    assert checkpoint.transaction_indexes() == {"0x01": 4}
+
+    # once the level is complete, the next run continues with the next level
+    state["contracts_lx"] = {"0xc3"}
+    checkpoint.complete_level(1, 2, state)
+    level, pending = checkpoint.restore(state, trace_partitions.TracePartitionStore(folder, clear=False))
+    assert level == 2
+    assert pending is None
+    assert state["contracts_lx"] == {"0xc3"}
+    checkpoint.close()
+
+    # a checkpoint written with other settings is not resumed
+    checkpoint = extraction_checkpoint.ExtractionCheckpoint(folder, fingerprint="settings a")
+    assert checkpoint.discarded
+    checkpoint.start_level(1, transactions, state)
+    checkpoint.close()
+    checkpoint = extraction_checkpoint.ExtractionCheckpoint(folder, fingerprint="settings a")
+    assert not checkpoint.discarded
+    assert checkpoint.restore(state, trace_partitions.TracePartitionStore(folder, clear=False))[1] is not None
+    checkpoint.close()
+    checkpoint = extraction_checkpoint.ExtractionCheckpoint(folder, fingerprint="settings b")
+    assert checkpoint.discarded
+    assert checkpoint.restore(state, trace_partitions.TracePartitionStore(folder, clear=True)) == (1, None)
+    assert checkpoint.transaction_indexes() == {}
+    checkpoint.close()
+
+def test_follow(tmp_path, monkeypatch):
+    assert follow.next_range(100, 100, 50) is None
+    assert follow.next_range(100, 120, 50) == (101, 120)
+    assert follow.next_range(100, 500, 50) == (101, 150)
+
+    path = os.path.join(tmp_path, "follow_state.pkl")
+    follow_state = follow.FollowState(path)
+    follow_state.abis = {"0xa": ["abi_a"], "0xb": None}
+    requested = []
+    def fetch(addresses):
+        requested.append(addresses)
+        # 0xd is not verified; the request for 0xe fails
+        return {address: ["abi"] for address in addresses if address == "0xc"}, {"0xd"} & set(addresses)
+    # only addresses that were not retrieved before are requested; addresses without a verified ABI are left out
+    assert follow_state.abi_dict(["0xa", "0xb", "0xc", "0xd", "0xe"], fetch) == {"0xa": ["abi_a"], "0xc": ["abi"]}
+    assert follow_state.abi_dict(["0xc", "0xd", "0xe"], fetch) == {"0xc": ["abi"]}
+    # the failed request is repeated in the next round
+    assert requested == [["0xc", "0xd", "0xe"], ["0xe"]]
+    follow_state.last_block = 150
+    follow_state.creations = pd.DataFrame({"from": ["0xc1"], "to": ["0xc2"]})
+    follow_state.save()
+
+    follow_state = follow.FollowState(path)
+    assert follow_state.last_block == 150
+    assert set(follow_state.abis) == {"0xa", "0xb", "0xc", "0xd"}
+    creations = follow_state.all_creations(pd.DataFrame({"from": ["0xc2"], "to": ["0xc3"]}))
+    assert list(creations["to"]) == ["0xc2", "0xc3"]
+
+    state = follow.round_state({"base_contract": "0xc1", "etherscan_cache": "cache"}, follow_state)
+    assert state["etherscan_cache"] is None
+    assert state["follow_state"] is follow_state
+
+    # follow_chain with a stub node: a failed poll, a round, a reorganized block, a failed round that is repeated
+    from hexbytes import HexBytes
+    class Eth:
+        heads = [None, 110, 110, 130, 130, 150]
+        hashes = {}
+        def __init__(self):
+            self.polls = 0
+        @property
+        def block_number(self):
+            head = self.heads[min(self.polls, len(self.heads) - 1)]
+            self.polls += 1
+            if self.polls == 3:
+                # the last block of the first round is reorganized after it was processed
+                self.hashes[100] = HexBytes("0x01")
+            if head is None:
+                raise requests.exceptions.ConnectionError("connection refused")
+            return head
+        def get_block(self, block_number):
+            return {"hash": self.hashes.get(block_number, HexBytes(block_number.to_bytes(32, "big")))}
+    class Web3:
+        eth = Eth()
+    monkeypatch.setattr(transport, "get_web3", lambda url: Web3)
+    os.makedirs(os.path.join(tmp_path, "resources", "out"))
+    follow_config = dict(transform_config({}), min_block=1, max_block=90, log_folder="out", follow_confirmations=10,
+                         follow_poll_seconds=5, follow_max_blocks_per_round=20, follow_max_rounds=2)
+    rounds = []
+    def run_phases(round_config, state_round, dir_path):
+        rounds.append((round_config["min_block"], round_config["max_block"], sorted(state_round["contracts_lx"])))
+        if len(rounds) == 2:
+            return False
+        state_round["contracts_dapp"].add(f"0xc{round_config['min_block']}")
+        return True
+    sleeps = []
+    warnings = []
+    monkeypatch.setattr(follow.logger, "warning", warnings.append)
+    state = {"base_contract": "0xc1", "contracts_dapp": {"0xc1"}}
+    follow.follow_chain(follow_config, state, tmp_path, run_phases, sleep=sleeps.append)
+    assert rounds == [(91, 100, ["0xc1"]), (101, 120, ["0xc1", "0xc91"]), (101, 120, ["0xc1", "0xc91"])]
+    # after the failed poll, the poll without a new confirmed block, and the failed round
+    assert sleeps == [5, 5, 5]
+    assert len(warnings) == 2 and "polling the node failed" in warnings[0] and "block 100 was reorganized" in warnings[1]
+
+    # a restarted follow mode continues from the saved state
+    follow_state = follow.FollowState(follow.follow_state_path(tmp_path, follow_config, state))
+    assert follow_state.last_block == 120
+    assert follow_state.contracts_dapp == {"0xc1", "0xc91", "0xc101"}
+    follow.follow_chain(dict(follow_config, follow_max_rounds=1), state, tmp_path, run_phases, sleep=sleeps.append)
+    assert rounds[-1] == (121, 140, ["0xc1", "0xc101", "0xc91"])
+
 '''
 def test_insert_eventPos():
 